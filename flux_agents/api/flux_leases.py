@@ -0,0 +1,157 @@
+import sqlite3
+import threading
+import time
+from config.settings import AGENT_WORKERS, WORKER_ID, LEASE_MODE, LEASE_DB, LEASE_TTL
+from utils.logger import logger
+
+
+class LocalLeases:
+    """
+    Flux leases kept in a SQLite table shared by every worker on the host. A claim inserts
+    a row per flux; whoever inserts it first owns the flux until the lease expires.
+
+    Rated fluxes keep their row until it expires, so a worker holding a page fetched
+    before the rating landed does not claim them again. Leases of a worker that dies
+    simply run out and the fluxes go back to the pool.
+    """
+
+    def __init__(self, worker_id, db_path=LEASE_DB, ttl=LEASE_TTL):
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # autocommit, so the claim transaction below is the only one we open
+        self.db = sqlite3.connect(db_path, timeout=30, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                flux_id PRIMARY KEY,
+                worker TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0
+            )""")
+        logger.info("flux_leases_ready", store="local", worker=worker_id,
+                    db_path=db_path, ttl=ttl)
+
+    def claim(self, flux_ids, limit):
+        """Lease up to `limit` of the fluxes to this worker. Returns the ids now held."""
+        now = time.time()
+        claimed = []
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute(
+                    "DELETE FROM leases WHERE expires_at <= ?", (now,))
+                for flux_id in flux_ids:
+                    if len(claimed) >= limit:
+                        break
+                    # a flux this worker already holds (pushed and swept) is renewed
+                    cursor = self.db.execute("""
+                        INSERT INTO leases (flux_id, worker, expires_at) VALUES (?, ?, ?)
+                        ON CONFLICT (flux_id) DO UPDATE SET expires_at = excluded.expires_at
+                        WHERE worker = excluded.worker AND done = 0""",
+                        (flux_id, self.worker_id, now + self.ttl))
+                    if cursor.rowcount:
+                        claimed.append(flux_id)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def finish(self, flux_ids, rated):
+        """Mark the rated fluxes done and hand the rest back for another worker to try."""
+        rated = set(rated)
+        with self.lock:
+            for flux_id in flux_ids:
+                if flux_id in rated:
+                    self.db.execute("UPDATE leases SET done = 1 WHERE flux_id = ? AND worker = ?",
+                                    (flux_id, self.worker_id))
+                else:
+                    self.db.execute("DELETE FROM leases WHERE flux_id = ? AND worker = ? AND done = 0",
+                                    (flux_id, self.worker_id))
+
+    def held(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM leases WHERE worker = ? AND done = 0 AND expires_at > ?",
+                (self.worker_id, time.time())).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.execute("DELETE FROM leases WHERE worker = ? AND done = 0",
+                            (self.worker_id,))
+            self.db.close()
+
+
+class ServiceLeases:
+    """
+    Flux leases granted by the WON service, so workers on different hosts can share the
+    backlog. Switches to the local table for good if the service has no lease endpoint.
+    """
+
+    def __init__(self, flux_svc, worker_id, ttl=LEASE_TTL):
+        self.flux_svc = flux_svc
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.holding = set()
+        self.lock = threading.Lock()
+        self.fallback = None
+        logger.info("flux_leases_ready", store="api",
+                    worker=worker_id, ttl=ttl)
+
+    def claim(self, flux_ids, limit):
+        if self.fallback:
+            return self.fallback.claim(flux_ids, limit)
+        claimed = self.flux_svc.claim_fluxes(
+            self.worker_id, flux_ids, limit, self.ttl)
+        if claimed is None:
+            if not self.flux_svc.leases_supported:
+                logger.warning("flux_leases_fallback", store="local")
+                self.fallback = LocalLeases(self.worker_id, ttl=self.ttl)
+                return self.fallback.claim(flux_ids, limit)
+            # could not tell who owns them, so leave them to the next round
+            return []
+        with self.lock:
+            self.holding.update(claimed)
+        return claimed
+
+    def finish(self, flux_ids, rated):
+        if self.fallback:
+            return self.fallback.finish(flux_ids, rated)
+        with self.lock:
+            self.holding.difference_update(flux_ids)
+        # rated fluxes leave the unrated queue on their own; only the rest are handed back
+        rated = set(rated)
+        unrated = [flux_id for flux_id in flux_ids if flux_id not in rated]
+        if unrated:
+            self.flux_svc.release_fluxes(self.worker_id, unrated)
+
+    def held(self):
+        if self.fallback:
+            return self.fallback.held()
+        with self.lock:
+            return len(self.holding)
+
+    def close(self):
+        if self.fallback:
+            return self.fallback.close()
+        with self.lock:
+            holding = list(self.holding)
+            self.holding.clear()
+        if holding:
+            self.flux_svc.release_fluxes(self.worker_id, holding)
+
+
+def leases_enabled():
+    """Whether LEASE_MODE asks for fluxes to be leased."""
+    return not (LEASE_MODE == "off" or (LEASE_MODE == "auto" and AGENT_WORKERS <= 1))
+
+
+def leases_from_settings(flux_svc, worker_id=WORKER_ID):
+    """The lease store LEASE_MODE asks for, or None when fluxes are not leased."""
+    if not leases_enabled():
+        return None
+    if LEASE_MODE == "local":
+        return LocalLeases(worker_id)
+    return ServiceLeases(flux_svc, worker_id)
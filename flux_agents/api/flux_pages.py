@@ -0,0 +1,145 @@
+import threading
+from collections import deque
+from config.settings import FETCH_PAGE_SIZE, PREFETCH_DEPTH, PREFETCH_MAX_ITEMS
+from utils.logger import logger
+
+
+class UnratedPages:
+    """
+    Iterates over the unrated fluxes a page at a time, for one sweep of the backlog.
+
+    The service only ever lists the first `limit` unrated fluxes, so fluxes still being
+    rated (or that failed to rate) keep coming back. Each fetch asks for enough to reach
+    past them, and fluxes already handed out in this sweep are skipped. The caller reports
+    each page with done() once it is rated, which is how the iterator knows what is still
+    listed.
+
+    With a prefetch depth, a background thread fetches the next pages while the current
+    one is rated, holding at most `max_items` fluxes. Without one, the next page is fetched
+    when it is asked for, as before. The sweep ends when the service reports nothing more,
+    or when everything it lists was already handed out.
+    """
+
+    def __init__(self, flux_svc, page_size=FETCH_PAGE_SIZE, depth=PREFETCH_DEPTH, max_items=PREFETCH_MAX_ITEMS,
+                 scheduler=None):
+        self.flux_svc = flux_svc
+        self.page_size = page_size
+        self.depth = depth
+        self.max_items = max_items
+        # a FluxScheduler hands out the buffered fluxes most urgent first, rather than as listed
+        self.buffer = scheduler if scheduler is not None else deque()
+        self.seen = set()
+        self.in_flight = set()
+        self.stale = 0  # handed out and done, yet still listed
+        self.finished = 0  # pages reported done, so the prefetcher can wait for progress
+        self.total = None
+        self.has_more = False
+        self.handed_out = 0
+        self.failed = False
+        self.exhausted = False
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = None
+        if depth > 0:
+            self.thread = threading.Thread(
+                target=self.prefetch, name="page-prefetch", daemon=True)
+            self.thread.start()
+
+    def __iter__(self):
+        while True:
+            page = self.next_page()
+            if not page:
+                return
+            yield page
+
+    def next_page(self):
+        """Up to a page of fluxes not handed out before; empty once the sweep is over."""
+        if not self.thread:
+            while not self.buffer and not self.exhausted:
+                self.fetch()
+        with self.cond:
+            while not self.buffer and not self.exhausted:
+                self.cond.wait()
+            page = [self.buffer.popleft()
+                    for _ in range(min(len(self.buffer), self.page_size or len(self.buffer)))]
+            self.in_flight.update(flux["id"] for flux in page)
+            self.handed_out += len(page)
+            self.cond.notify_all()
+            return page
+
+    def done(self, flux_ids):
+        """The caller is finished with these fluxes, rated or not."""
+        with self.cond:
+            self.in_flight.difference_update(flux_ids)
+            self.finished += 1
+            self.cond.notify_all()
+
+    def room(self):
+        """How many more fluxes may be buffered."""
+        limit = self.max_items or max(1, self.page_size or 1) * max(1, self.depth)
+        return limit - len(self.buffer)
+
+    def fetch(self):
+        """Fetch the next page into the buffer. Marks the sweep exhausted when it is over."""
+        with self.cond:
+            # reach past everything handed out that the service may still be listing
+            limit = self.page_size + len(self.in_flight) + len(self.buffer) + self.stale \
+                if self.page_size else 0
+            progress = self.finished
+        batch = self.flux_svc.fetch_next_fluxes(limit)
+
+        with self.cond:
+            if not batch:
+                # returning None is the signal for an error that got swallowed
+                (self.failed, self.exhausted) = (True, True)
+                self.cond.notify_all()
+                return
+            items = batch["items"]
+            if self.total is None:
+                # the service may report the whole backlog; otherwise the first page is a lower bound
+                self.total = batch.get("total", len(items))
+                self.page_size = self.page_size or max(1, len(items))
+            self.has_more = self.has_more or batch["hasMore"]
+
+            queued = {flux["id"] for flux in self.buffer}
+            fresh = [flux for flux in items if flux["id"] not in self.seen]
+            self.stale = sum(1 for flux in items if flux["id"] in self.seen
+                             and flux["id"] not in self.in_flight and flux["id"] not in queued)
+            # what does not fit now is still unrated, so it comes back with a later fetch
+            taken = fresh[:max(0, self.room())] if self.thread else fresh
+            for flux in taken:
+                self.seen.add(flux["id"])
+                self.buffer.append(flux)
+
+            if not batch["hasMore"] and len(taken) == len(fresh):
+                self.exhausted = True
+            elif not fresh:
+                if self.thread and self.in_flight:
+                    # all listed fluxes are being rated; fetch again once some are done
+                    while self.finished == progress and not self.closed:
+                        self.cond.wait()
+                else:
+                    logger.info("unrated_pages_no_progress", listed=len(items),
+                                stale=self.stale)
+                    self.exhausted = True
+            self.cond.notify_all()
+
+    def prefetch(self):
+        """Background fetcher: keeps the buffer topped up while there is room for a page."""
+        while True:
+            with self.cond:
+                while not self.closed and self.buffer and self.room() < self.page_size:
+                    self.cond.wait()
+                if self.closed or self.exhausted:
+                    return
+            self.fetch()
+
+    def close(self):
+        """Stop prefetching; fluxes still buffered are left for the next sweep."""
+        with self.cond:
+            self.closed = True
+            self.exhausted = True
+            self.buffer.clear()
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join()
@@ -0,0 +1,145 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from config.settings import PRIORITY_HEAD_STARTS
+from utils.logger import logger
+from utils.metrics import registry
+
+# seconds; a backlog can keep routine fluxes waiting for hours
+SLA_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 14400, 43200, 86400)
+TIME_TO_RATING = registry.histogram(
+    "flux_time_to_rating_seconds", "Seconds from a flux's arrival to its rating, by priority class",
+    labels=("priority",), buckets=SLA_BUCKETS)
+
+# a long post costs more to rate, so it yields a second per this many characters to
+# shorter ones that arrived around the same time, up to LENGTH_DELAY_MAX seconds
+LENGTH_DELAY_CHARS = 100
+LENGTH_DELAY_MAX = 60
+# how many arrival times to keep for fluxes seen but not rated yet
+WAITING_LIMIT = 100000
+
+
+def priority_class(flux):
+    """
+    What kind of attention a flux needs, from the optional fields the service may send:
+    reportCount (or reported), authorViolationCount and authorFluxCount.
+    """
+    if flux.get("reportCount") or flux.get("reported"):
+        return "reported"
+    if flux.get("authorViolationCount"):
+        return "flagged_author"
+    posts = flux.get("authorFluxCount")
+    if isinstance(posts, int) and posts <= 1:
+        return "first_post"
+    return "routine"
+
+
+def created_at(flux):
+    """The flux's createdAt as epoch seconds (ISO 8601, or epoch seconds/milliseconds), or None."""
+    value = flux.get("createdAt")
+    try:
+        if isinstance(value, (int, float)):
+            return value / 1000 if value > 1e12 else float(value)
+        if isinstance(value, str):
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            return moment.timestamp()
+    except (ValueError, OverflowError):
+        pass
+    return None
+
+
+class FluxScheduler:
+    """
+    Priority queue of the fluxes fetched but not yet handed out for rating, most urgent
+    first. Stands in for the plain buffer of UnratedPages.
+
+    Every flux is ordered by its arrival time (createdAt when the service sends it,
+    otherwise when it was first fetched) less a head start for its priority class, plus a
+    small delay for long posts. Since the keys are fixed deadlines, waiting is its own
+    aging: a routine flux is overtaken only by fluxes that arrive less than a head start
+    after it, so it never starves however many reported ones keep coming.
+
+    Arrival times are kept across sweeps until the flux is rated, which is when its
+    time-to-rating is recorded for its class.
+    """
+
+    def __init__(self, head_starts=None):
+        self.head_starts = PRIORITY_HEAD_STARTS if head_starts is None else head_starts
+        self.heap = []
+        self.counter = itertools.count()
+        # flux id -> (priority class, arrival), for fluxes not rated yet
+        self.waiting = OrderedDict()
+        self.lock = threading.Lock()
+        self.reset_stats()
+        logger.info("priority_scheduling_enabled", head_starts=self.head_starts)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        with self.lock:
+            return iter([flux for (_, _, flux) in self.heap])
+
+    def append(self, flux):
+        kind = priority_class(flux)
+        content = flux.get("content") or ""
+        with self.lock:
+            if flux["id"] in self.waiting:
+                arrival = self.waiting[flux["id"]][1]
+            else:
+                arrival = created_at(flux) or time.time()
+                while len(self.waiting) >= WAITING_LIMIT:
+                    self.waiting.popitem(last=False)
+            self.waiting[flux["id"]] = (kind, arrival)
+            key = (arrival - self.head_starts.get(kind, 0)
+                   + min(LENGTH_DELAY_MAX, len(content) / LENGTH_DELAY_CHARS))
+            heapq.heappush(self.heap, (key, next(self.counter), flux))
+
+    def popleft(self):
+        with self.lock:
+            return heapq.heappop(self.heap)[2]
+
+    def clear(self):
+        """Drop what is queued; the fluxes come back with the next sweep, arrival times intact."""
+        with self.lock:
+            self.heap.clear()
+
+    def rated(self, flux_id):
+        """Record the time-to-rating of a flux that came through the queue."""
+        with self.lock:
+            entry = self.waiting.pop(flux_id, None)
+            if entry is None:
+                return
+            (kind, arrival) = entry
+            waited = max(0.0, time.time() - arrival)
+            self.waits.setdefault(kind, []).append(waited)
+        TIME_TO_RATING.observe(waited, priority=kind)
+
+    def stats(self, reset=False):
+        """Time-to-rating per priority class since the last reset, in seconds."""
+        with self.lock:
+            classes = {}
+            for (kind, waits) in self.waits.items():
+                waits = sorted(waits)
+                classes[kind] = {
+                    "rated": len(waits),
+                    "p50": round(waits[(len(waits) - 1) // 2], 3),
+                    "p95": round(waits[max(1, math.ceil(len(waits) * 0.95)) - 1], 3),
+                    "max": round(waits[-1], 3),
+                }
+            stats = {"classes": classes, "waiting": len(self.waiting)}
+            if reset:
+                self.reset_stats()
+            return stats
+
+    def log_stats(self):
+        logger.info("priority_stats", **self.stats(reset=True))
+
+    def reset_stats(self):
+        self.waits = {}
@@ -1,7 +1,74 @@
-from config.settings import WON_SERVICE_ENDPOINT, WON_SERVICE_API_KEY
+from config.settings import (WON_SERVICE_ENDPOINT, WON_SERVICE_API_KEY, WON_HTTP_POOL_SIZE,
+                             WON_HTTP_CONNECT_TIMEOUT, WON_HTTP_READ_TIMEOUT,
+                             WON_HTTP_RETRIES, WON_HTTP_BACKOFF, FETCH_PAGE_SIZE, PREFETCH_DEPTH,
+                             PREFETCH_MAX_ITEMS)
+import asyncio
+import random
+import time
 import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import urlencode
+from .flux_pages import UnratedPages
 from utils.logger import logger, log_connection_error
+from utils.metrics import registry
+
+# responses worth another try; anything else is the server telling us no
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# responses meaning the service has no batch ratings (or lease) endpoint
+BATCH_UNSUPPORTED_STATUSES = (404, 405, 501)
+# 4xx answers that say nothing about the rating itself: credentials, timeouts, rate limits
+TRANSIENT_CLIENT_STATUSES = (401, 403, 408, 429)
+
+API_SECONDS = registry.histogram(
+    "flux_api_request_seconds", "WON service calls by call and response status",
+    labels=("call", "status"))
+
+
+def observe_call(call, started, status):
+    API_SECONDS.observe(time.perf_counter() - started, call=call, status=status)
+
+
+def unrated_fluxes_url(endpoint, limit=0):
+    filters = {}
+    if limit:
+        filters["limit"] = str(limit)
+    queryParams = urlencode(filters)
+    return f"{endpoint}/flux-moderation/unrated-fluxes?{queryParams}"
+
+
+def rejected_for_good(status_code):
+    """A 4xx about the request itself: sending the same rating again will not help."""
+    return 400 <= status_code < 500 and status_code not in TRANSIENT_CLIENT_STATUSES
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, WON_HTTP_BACKOFF * (2 ** attempt))
+
+
+def pooled_session(headers):
+    """
+    A keep-alive session with a bounded connection pool. Idempotent calls are retried
+    with jittered exponential backoff; connection failures are retried for any method,
+    since the request never reached the server.
+    """
+    retries = Retry(
+        total=WON_HTTP_RETRIES,
+        backoff_factor=WON_HTTP_BACKOFF,
+        backoff_jitter=WON_HTTP_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=WON_HTTP_POOL_SIZE,
+                          pool_maxsize=WON_HTTP_POOL_SIZE, max_retries=retries)
+    session = requests.Session()
+    session.headers.update(headers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 class FluxService:
@@ -11,7 +78,16 @@ class FluxService:
         self.headers = {
             "Authorization": f"Bearer {WON_SERVICE_API_KEY}"
         }
-        logger.info("flux_api_initialized", endpoint=self.endpoint)
+        self.session = pooled_session(self.headers)
+        self.timeout = (WON_HTTP_CONNECT_TIMEOUT, WON_HTTP_READ_TIMEOUT)
+        # assume the batch endpoint exists until the service says otherwise
+        self.batch_supported = True
+        # likewise for flux leases
+        self.leases_supported = True
+        # called with (flux ids, status code) when the service refuses a rating for good
+        self.on_rejected = None
+        logger.info("flux_api_initialized", endpoint=self.endpoint,
+                    pool_size=WON_HTTP_POOL_SIZE)
 
     # def fetch_last_rating(self):
     #     logger.info("fetching_last_rating", message="See where we left off")
@@ -32,14 +108,25 @@ class FluxService:
     #         raise Exception(
     #             "Connection error while fetching last rating") from e
 
+    def send(self, call, method, url, **kwargs):
+        """One call to the service, with its latency and status code recorded for /metrics."""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.Timeout:
+            observe_call(call, started, "timeout")
+            raise
+        except requests.exceptions.RequestException:
+            observe_call(call, started, "connection_error")
+            raise
+        observe_call(call, started, response.status_code)
+        return response
+
     def fetch_next_fluxes(self, limit=0):
-        filters = {}
-        if limit:
-            filters["limit"] = str(limit)
-        queryParams = urlencode(filters)
-        url = f"{self.endpoint}/flux-moderation/unrated-fluxes?{queryParams}"
+        url = unrated_fluxes_url(self.endpoint, limit)
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self.send("fetch_next_fluxes", "GET", url)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -50,6 +137,33 @@ class FluxService:
             log_connection_error(logger, "fetch_next_fluxes_connection_error",
                                  url=url, message="Connection error while fetching fluxes")
             return None
+        except requests.exceptions.Timeout as e:
+            logger.error("fetch_next_fluxes_timeout", url=url)
+            return None
+
+    def iter_unrated(self, page_size=FETCH_PAGE_SIZE, depth=PREFETCH_DEPTH, max_items=PREFETCH_MAX_ITEMS,
+                     scheduler=None):
+        """
+        Pages of unrated fluxes for one sweep of the backlog, the next ones fetched in the
+        background while the current one is rated, and ordered by `scheduler` if given.
+        See UnratedPages.
+        """
+        return UnratedPages(self, page_size, depth, max_items, scheduler)
+
+    def check_reachable(self):
+        """Cheapest authenticated call we have: ask for a single unrated flux."""
+        url = unrated_fluxes_url(self.endpoint, 1)
+        try:
+            response = self.send("check_reachable", "GET", url)
+            if response.status_code == 200:
+                return True
+            logger.error("flux_api_unreachable",
+                         status_code=response.status_code)
+            return False
+        except requests.exceptions.RequestException as e:
+            log_connection_error(logger, "flux_api_unreachable",
+                                 url=url, message="Could not reach the flux service")
+            return False
 
     def rate_flux(self, flux_id, rating_code, reason):
         url = f"{self.endpoint}/flux-moderation/ratings"
@@ -60,23 +174,224 @@ class FluxService:
         }
         try:
             logger.info("storing_flux_rating", flux_id=flux_id)
-            response = requests.post(
-                url=url,
-                json=payload,
-                headers=self.headers
-            )
+            response = self.send("rate_flux", "POST", url, json=payload)
             if response.status_code == 200 or response.status_code == 201:
                 return response.json()
             else:
                 logger.error("rate_flux_failed",
                              status_code=response.status_code, flux_id=flux_id)
+                if self.on_rejected and rejected_for_good(response.status_code):
+                    self.on_rejected([flux_id], response.status_code)
                 return None
         except requests.exceptions.ConnectionError as e:
             log_connection_error(logger, "rate_flux_connection_error",
                                  url=url, flux_id=flux_id,
                                  message="Connection error while rating flux")
             return None
+        except requests.exceptions.Timeout as e:
+            logger.error("rate_flux_timeout", url=url, flux_id=flux_id)
+            return None
         except Exception as e:
             logger.exception("rate_flux_exception",
                              error=str(e), flux_id=flux_id)
             return None
+
+    def rate_fluxes(self, ratings):
+        """
+        Store many ratings in one round trip. Takes a list of (flux_id, rating_code, reason)
+        tuples. Returns None if the batch may or may not have been stored (a timeout, a 5xx),
+        and False if it surely was not: the service refused it for good, or has no batch
+        endpoint, in which case batch_supported is switched off as well. Only after False
+        is it safe to send the ratings one by one with rate_flux.
+        """
+        url = f"{self.endpoint}/flux-moderation/ratings/batch"
+        payload = [{
+            "fluxId": flux_id,
+            "rating": rating_code,
+            "reason": reason
+        } for (flux_id, rating_code, reason) in ratings]
+        try:
+            logger.info("storing_flux_ratings", count=len(payload))
+            response = self.send("rate_fluxes", "POST", url, json=payload)
+            if response.status_code == 200 or response.status_code == 201:
+                return response.json()
+            elif response.status_code in BATCH_UNSUPPORTED_STATUSES:
+                logger.warning("rate_fluxes_unsupported",
+                               status_code=response.status_code)
+                self.batch_supported = False
+                return False
+            else:
+                logger.error("rate_fluxes_failed",
+                             status_code=response.status_code, count=len(payload))
+                return False if rejected_for_good(response.status_code) else None
+        except requests.exceptions.ConnectionError as e:
+            log_connection_error(logger, "rate_fluxes_connection_error",
+                                 url=url, count=len(payload),
+                                 message="Connection error while rating fluxes")
+            return None
+        except requests.exceptions.Timeout as e:
+            logger.error("rate_fluxes_timeout", url=url, count=len(payload))
+            return None
+        except Exception as e:
+            logger.exception("rate_fluxes_exception",
+                             error=str(e), count=len(payload))
+            return None
+
+    def claim_fluxes(self, worker_id, flux_ids, limit, ttl):
+        """
+        Ask the service to lease up to `limit` of the given fluxes to this worker for `ttl`
+        seconds. Returns the ids granted, or None if the claim failed; if the service has
+        no lease endpoint, leases_supported is switched off.
+        """
+        url = f"{self.endpoint}/flux-moderation/leases"
+        payload = {
+            "workerId": worker_id,
+            "fluxIds": flux_ids,
+            "limit": limit,
+            "ttl": ttl
+        }
+        try:
+            response = self.send("claim_fluxes", "POST", url, json=payload)
+            if response.status_code == 200 or response.status_code == 201:
+                return response.json()["claimed"]
+            elif response.status_code in BATCH_UNSUPPORTED_STATUSES:
+                logger.warning("claim_fluxes_unsupported",
+                               status_code=response.status_code)
+                self.leases_supported = False
+                return None
+            else:
+                logger.error("claim_fluxes_failed",
+                             status_code=response.status_code, count=len(flux_ids))
+                return None
+        except requests.exceptions.ConnectionError as e:
+            log_connection_error(logger, "claim_fluxes_connection_error",
+                                 url=url, count=len(flux_ids),
+                                 message="Connection error while claiming fluxes")
+            return None
+        except requests.exceptions.Timeout as e:
+            logger.error("claim_fluxes_timeout", url=url, count=len(flux_ids))
+            return None
+        except Exception as e:
+            logger.exception("claim_fluxes_exception",
+                             error=str(e), count=len(flux_ids))
+            return None
+
+    def release_fluxes(self, worker_id, flux_ids):
+        """Hand leased fluxes back before their lease runs out. Returns False on failure."""
+        url = f"{self.endpoint}/flux-moderation/leases/release"
+        payload = {
+            "workerId": worker_id,
+            "fluxIds": flux_ids
+        }
+        try:
+            response = self.send("release_fluxes", "POST", url, json=payload)
+            if response.status_code in (200, 201, 204):
+                return True
+            logger.error("release_fluxes_failed",
+                         status_code=response.status_code, count=len(flux_ids))
+            return False
+        except requests.exceptions.RequestException as e:
+            log_connection_error(logger, "release_fluxes_connection_error",
+                                 url=url, count=len(flux_ids),
+                                 message="Could not release flux leases")
+            return False
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncFluxService:
+    """
+    Asyncio flavor of FluxService. Shares one httpx.AsyncClient, so concurrent calls
+    reuse connections instead of each opening their own.
+    """
+
+    def __init__(self):
+        self.endpoint = WON_SERVICE_ENDPOINT
+        self.headers = {
+            "Authorization": f"Bearer {WON_SERVICE_API_KEY}"
+        }
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(WON_HTTP_READ_TIMEOUT,
+                                  connect=WON_HTTP_CONNECT_TIMEOUT),
+            # connection failures are safe to retry for any method; the pool limits belong
+            # to the transport, since the client ignores its own once given one
+            transport=httpx.AsyncHTTPTransport(
+                retries=WON_HTTP_RETRIES,
+                limits=httpx.Limits(max_connections=WON_HTTP_POOL_SIZE,
+                                    max_keepalive_connections=WON_HTTP_POOL_SIZE)),
+        )
+        logger.info("flux_api_initialized", endpoint=self.endpoint,
+                    pool_size=WON_HTTP_POOL_SIZE, mode="async")
+
+    async def send(self, call, method, url, **kwargs):
+        """One call to the service, with its latency and status code recorded for /metrics."""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.TimeoutException:
+            observe_call(call, started, "timeout")
+            raise
+        except httpx.TransportError:
+            observe_call(call, started, "connection_error")
+            raise
+        observe_call(call, started, response.status_code)
+        return response
+
+    async def get_with_retry(self, call, url):
+        """GET is idempotent, so retry transient failures with jittered backoff."""
+        for attempt in range(WON_HTTP_RETRIES + 1):
+            last_try = attempt == WON_HTTP_RETRIES
+            try:
+                response = await self.send(call, "GET", url)
+                if response.status_code not in RETRY_STATUSES or last_try:
+                    return response
+            except httpx.TransportError:
+                if last_try:
+                    raise
+            await asyncio.sleep(backoff_delay(attempt))
+
+    async def fetch_next_fluxes(self, limit=0):
+        url = unrated_fluxes_url(self.endpoint, limit)
+        try:
+            response = await self.get_with_retry("fetch_next_fluxes", url)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error("fetch_next_fluxes_failed",
+                             status_code=response.status_code)
+                return None
+        except httpx.TransportError as e:
+            log_connection_error(logger, "fetch_next_fluxes_connection_error",
+                                 url=url, message="Connection error while fetching fluxes")
+            return None
+
+    async def rate_flux(self, flux_id, rating_code, reason):
+        url = f"{self.endpoint}/flux-moderation/ratings"
+        payload = {
+            "fluxId": flux_id,
+            "rating": rating_code,
+            "reason": reason
+        }
+        try:
+            logger.info("storing_flux_rating", flux_id=flux_id)
+            response = await self.send("rate_flux", "POST", url, json=payload)
+            if response.status_code == 200 or response.status_code == 201:
+                return response.json()
+            else:
+                logger.error("rate_flux_failed",
+                             status_code=response.status_code, flux_id=flux_id)
+                return None
+        except httpx.TransportError as e:
+            log_connection_error(logger, "rate_flux_connection_error",
+                                 url=url, flux_id=flux_id,
+                                 message="Connection error while rating flux")
+            return None
+        except Exception as e:
+            logger.exception("rate_flux_exception",
+                             error=str(e), flux_id=flux_id)
+            return None
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,90 @@
+import hmac
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config.settings import INGEST_HOST, INGEST_PORT, INGEST_TOKEN, INGEST_ALLOW_ANONYMOUS
+from utils.logger import logger
+
+
+class IngestServer:
+    """
+    Small local HTTP listener so new fluxes can be pushed to the agent instead of waiting
+    for the next poll. Accepts POST /fluxes with one flux or a list of them:
+
+    - {"id": 42, "content": "<p>...</p>"} is rated straight away
+    - {"id": 42} (no content) asks for an early sweep of the unrated queue
+
+    Every accepted flux is handed to the `accept` callback, which returns False when the
+    agent cannot take more right now.
+
+    Pushers must send the token as a Bearer token. Without one any local process could
+    have content rated, so the listener refuses to start unless `allow_anonymous`.
+    """
+
+    def __init__(self, accept, host=INGEST_HOST, port=INGEST_PORT, token=INGEST_TOKEN,
+                 allow_anonymous=INGEST_ALLOW_ANONYMOUS):
+        if not token:
+            if not allow_anonymous:
+                logger.error("ingest_token_missing",
+                             message="Set INGEST_TOKEN, or INGEST_ALLOW_ANONYMOUS=true to accept any caller.")
+                raise ValueError("INGEST_TOKEN is required for the push listener")
+            logger.warning("ingest_anonymous", message="The push listener accepts any caller.")
+        self.accept = accept
+        self.token = token
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="ingest-server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        (host, port) = self.server.server_address[:2]
+        logger.info("ingest_server_started", host=host, port=port)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def handler(self):
+        ingest = self
+
+        class IngestHandler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/fluxes":
+                    return self.reply(404, {"error": "not found"})
+                if ingest.token and not hmac.compare_digest(
+                        self.headers.get("Authorization", ""), f"Bearer {ingest.token}"):
+                    return self.reply(401, {"error": "unauthorized"})
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    payload = json.loads(self.rfile.read(length) or b"null")
+                except (ValueError, json.JSONDecodeError):
+                    return self.reply(400, {"error": "body must be JSON"})
+
+                fluxes = payload if isinstance(payload, list) else [payload]
+                if not all(isinstance(flux, dict) and "id" in flux for flux in fluxes):
+                    return self.reply(400, {"error": "every flux needs an id"})
+
+                queued = 0
+                for flux in fluxes:
+                    if not ingest.accept(flux):
+                        logger.warning("ingest_queue_full", flux_id=flux["id"])
+                        return self.reply(503, {"queued": queued, "error": "queue full"})
+                    queued += 1
+                return self.reply(202, {"queued": queued})
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # requests are logged by the agent when they are rated
+                pass
+
+        return IngestHandler
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from config.settings import JOURNAL_FILE, JOURNAL_SYNC_DELAY, AGENT_WORKERS, WORKER_ID
+from utils.logger import logger
+
+# acknowledged entries tolerated in the file before it is rewritten between rounds
+COMPACT_AFTER = 10000
+
+
+def journal_path(path=JOURNAL_FILE, worker_id=WORKER_ID):
+    """Every worker keeps its own journal when the controller runs several."""
+    if AGENT_WORKERS <= 1:
+        return path
+    (base, ext) = os.path.splitext(path)
+    return f"{base}.worker-{worker_id}{ext}"
+
+
+class RatingJournal:
+    """
+    Write-ahead journal of verdicts. Every verdict is appended (and fsynced) before it is
+    submitted, and an acknowledgement is appended once the service has stored it. Verdicts
+    without an acknowledgement are replayed instead of asking the LLM again, after a failed
+    submission or a restart.
+
+    Verdicts with the "error" rating are never journaled, so a failed LLM call is rated
+    again rather than replayed. A verdict the service refuses for good (a 4xx about the
+    request) is moved to a dead-letter file next to the journal instead of being retried.
+
+    Concurrent writers share fsyncs: the first one to need a sync waits JOURNAL_SYNC_DELAY
+    for others to join, then syncs everything written so far in one call.
+    """
+
+    def __init__(self, path=None, sync_delay=JOURNAL_SYNC_DELAY):
+        self.path = path or journal_path()
+        (base, ext) = os.path.splitext(self.path)
+        self.rejected_path = f"{base}.rejected{ext}"
+        self.sync_delay = sync_delay
+        self.cond = threading.Condition()
+        self.pending = {}  # flux id -> (rating, reason), in journal order
+        self.written = 0  # records appended since the file was opened
+        self.synced = 0  # records known to be on disk
+        self.syncing = False
+        self.syncs = 0
+        self.load()
+        self.file = None
+        self.compact()
+        logger.info("rating_journal_ready", path=self.path,
+                    unacknowledged=len(self.pending))
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a torn last line from a crash mid-append
+                        continue
+                    if entry["op"] == "verdict" and entry["rating"] != "error":
+                        self.pending[entry["fluxId"]] = (
+                            entry["rating"], entry["reason"])
+                    else:
+                        self.pending.pop(entry["fluxId"], None)
+        except FileNotFoundError:
+            pass
+
+    def compact(self):
+        """Rewrite the journal with only the unacknowledged verdicts."""
+        with self.cond:
+            while self.syncing:
+                self.cond.wait()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for (flux_id, (rating, reason)) in self.pending.items():
+                    f.write(self.entry("verdict", flux_id, rating, reason))
+                f.flush()
+                os.fsync(f.fileno())
+            if self.file:
+                self.file.close()
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, "a", encoding="utf-8")
+            self.written = self.synced = 0
+
+    def entry(self, op, flux_id, rating=None, reason=None):
+        entry = {"op": op, "fluxId": flux_id, "at": time.time()}
+        if op == "verdict":
+            entry.update(rating=rating, reason=reason)
+        return json.dumps(entry) + "\n"
+
+    def record(self, flux_id, rating, reason):
+        """Make the verdict durable. Returns once it is on disk."""
+        if rating == "error":
+            return
+        with self.cond:
+            if self.pending.get(flux_id) == (rating, reason):
+                return
+            self.file.write(self.entry("verdict", flux_id, rating, reason))
+            self.written += 1
+            seq = self.written
+        self.sync_through(seq)
+        with self.cond:
+            self.pending[flux_id] = (rating, reason)
+
+    def acknowledge(self, flux_ids):
+        """The service has stored these verdicts. Synced with the next verdict, or at close."""
+        with self.cond:
+            for flux_id in flux_ids:
+                if self.pending.pop(flux_id, None) is not None:
+                    self.file.write(self.entry("ack", flux_id))
+                    self.written += 1
+
+    def reject(self, flux_ids, status_code):
+        """
+        The service refused these verdicts for good. They go to the dead-letter file and
+        are not replayed again.
+        """
+        with self.cond:
+            rejected = [(flux_id, self.pending.pop(flux_id)) for flux_id in flux_ids
+                        if flux_id in self.pending]
+            if not rejected:
+                return
+            for (flux_id, _) in rejected:
+                self.file.write(self.entry("reject", flux_id))
+                self.written += 1
+            with open(self.rejected_path, "a", encoding="utf-8") as f:
+                for (flux_id, (rating, reason)) in rejected:
+                    entry = json.loads(self.entry("verdict", flux_id, rating, reason))
+                    f.write(json.dumps({**entry, "statusCode": status_code}) + "\n")
+        logger.warning("journal_verdicts_rejected", flux_ids=[flux_id for (flux_id, _) in rejected],
+                       status_code=status_code, path=self.rejected_path)
+
+    def verdict(self, flux_id):
+        """The journaled verdict for a flux that has not been stored yet, or None."""
+        with self.cond:
+            return self.pending.get(flux_id)
+
+    def unacknowledged(self):
+        with self.cond:
+            return [(flux_id, rating, reason) for (flux_id, (rating, reason)) in self.pending.items()]
+
+    def sync_through(self, seq):
+        """Group commit: wait until record `seq` is on disk, syncing it ourselves if nobody is."""
+        while True:
+            with self.cond:
+                while self.synced < seq and self.syncing:
+                    self.cond.wait()
+                if self.synced >= seq:
+                    return
+                self.syncing = True
+
+            if self.sync_delay:
+                time.sleep(self.sync_delay)
+            with self.cond:
+                self.file.flush()
+                target = self.written
+                fd = self.file.fileno()
+            try:
+                os.fsync(fd)
+            finally:
+                with self.cond:
+                    self.synced = max(self.synced, target)
+                    self.syncing = False
+                    self.syncs += 1
+                    self.cond.notify_all()
+
+    def maybe_compact(self):
+        """Between rounds: rewrite the file once acknowledged entries pile up."""
+        with self.cond:
+            due = self.written >= COMPACT_AFTER
+        if due:
+            self.compact()
+
+    def stats(self, reset=False):
+        with self.cond:
+            counters = {"unacknowledged": len(self.pending), "syncs": self.syncs}
+            if reset:
+                self.syncs = 0
+            return counters
+
+    def close(self):
+        self.compact()
+        with self.cond:
+            self.file.close()
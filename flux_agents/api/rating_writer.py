@@ -0,0 +1,88 @@
+import threading
+import time
+from config.settings import RATING_BATCH_SIZE, RATING_FLUSH_INTERVAL
+from utils.logger import logger
+
+
+class BufferedRatingWriter:
+    """
+    Sits in front of FluxService and collects ratings, submitting them with rate_fluxes
+    once a batch fills up or the flush interval passes. Falls back to one rate_flux call
+    per rating when the service has no batch endpoint or refuses a batch for good. A
+    batch that failed in a way it may still have been stored (a timeout, a 5xx) goes back
+    to the buffer and is sent again as a batch with the next flush, since storing its
+    ratings one by one could store them twice. The ids of stored ratings are handed to
+    `on_stored`, if given.
+    """
+
+    def __init__(self, flux_svc, batch_size=RATING_BATCH_SIZE, flush_interval=RATING_FLUSH_INTERVAL,
+                 on_stored=None):
+        self.flux_svc = flux_svc
+        self.on_stored = on_stored
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(
+            target=self.flush_periodically, name="rating-flusher", daemon=True)
+        self.flusher.start()
+
+    def add(self, flux_id, rating_code, reason):
+        with self.lock:
+            self.buffer.append((flux_id, rating_code, reason))
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Submit whatever is buffered right now."""
+        with self.lock:
+            batch = self.buffer
+            self.buffer = []
+            self.last_flush = time.monotonic()
+        if batch:
+            self.submit(batch)
+
+    def submit(self, batch):
+        result = self.flux_svc.rate_fluxes(batch) if self.flux_svc.batch_supported else False
+        if result is None:
+            logger.warning("rating_batch_retry", count=len(batch))
+            self.requeue(batch)
+            return
+        if result is not False:
+            stored = [flux_id for (flux_id, _, _) in batch]
+        else:
+            logger.info("rating_batch_fallback", count=len(batch))
+            stored = [flux_id for (flux_id, rating_code, reason) in batch
+                      if self.flux_svc.rate_flux(flux_id, rating_code, reason) is not None]
+        if self.on_stored and stored:
+            self.on_stored(stored)
+
+    def requeue(self, batch):
+        """Put a failed batch back in front; a flux rated again meanwhile keeps its newer rating."""
+        with self.lock:
+            buffered = {flux_id for (flux_id, _, _) in self.buffer}
+            self.buffer = [item for item in batch if item[0] not in buffered] + self.buffer
+
+    def flush_periodically(self):
+        # wake up often enough to honor the interval without spinning
+        tick = max(0.1, min(1.0, self.flush_interval / 2))
+        while not self.closed.wait(tick):
+            with self.lock:
+                due = self.buffer and time.monotonic() - self.last_flush >= self.flush_interval
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.exception("rating_flush_failed", error=str(e))
+
+    def close(self):
+        """Stop the timer and submit anything still buffered."""
+        self.closed.set()
+        self.flusher.join()
+        self.flush()
+        if self.buffer:
+            # with the journal on, the next start submits them
+            logger.warning("ratings_not_stored", count=len(self.buffer))
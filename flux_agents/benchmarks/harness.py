@@ -0,0 +1,158 @@
+"""
+Runs one benchmark configuration: starts the stand-in services, points the agent at
+them and rates the whole backlog, then prints the result as one line of JSON.
+
+Settings are read when config.settings is imported, so every configuration needs a
+fresh interpreter; benchmarks/run.py starts this module once per configuration.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from benchmarks.stubs import FakeFluxApi, FakeOllama, make_backlog
+
+# the model name cascade configurations use for their first stage
+FAST_MODEL = "benchmark-fast"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(fraction * len(values)))
+    return values[rank - 1]
+
+
+def summarize(name, api, ollama, elapsed, rounds, startup):
+    latencies = sorted(api.latencies())
+    reported = sorted(api.latencies(reported=True))
+    rated = len(api.ratings)
+    return {
+        "name": name,
+        "fluxes": rated + len(api.unrated),
+        "rated": rated,
+        "duplicates": sum(1 for ratings in api.ratings.values() if len(ratings) > 1),
+        "agreement": api.agreement(),
+        "rounds": rounds,
+        "elapsed_s": round(elapsed, 4),
+        "fluxes_per_sec": round(rated / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": to_ms(percentile(latencies, 0.50)),
+            "p95": to_ms(percentile(latencies, 0.95)),
+            "p99": to_ms(percentile(latencies, 0.99)),
+            "max": to_ms(latencies[-1] if latencies else None),
+        },
+        "reported_p95_ms": to_ms(percentile(reported, 0.95)),
+        "api_calls": api.calls,
+        "ollama_calls": ollama.calls,
+        "startup": startup,
+    }
+
+
+def to_ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def run_sync(api, max_rounds):
+    from bots.flux_nanny import FluxNanny
+
+    nanny = FluxNanny()
+    startup = nanny.startup_timings
+    rounds = 0
+    started = time.perf_counter()
+    try:
+        while api.unrated and rounds < max_rounds:
+            rounds += 1
+            if nanny.do_action()["failed"]:
+                break
+    finally:
+        elapsed = time.perf_counter() - started
+        nanny.close()
+    return (elapsed, rounds, startup)
+
+
+def run_async(api, max_rounds):
+    from bots.flux_nanny import AsyncFluxNanny
+
+    async def drive():
+        nanny = AsyncFluxNanny()
+        await nanny.start()
+        rounds = 0
+        started = time.perf_counter()
+        try:
+            while api.unrated and rounds < max_rounds:
+                rounds += 1
+                if (await nanny.do_action())["failed"]:
+                    break
+        finally:
+            elapsed = time.perf_counter() - started
+            await nanny.close()
+        return (elapsed, rounds, {})
+
+    return asyncio.run(drive())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--name", default="adhoc")
+    parser.add_argument("--fluxes", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--flagged-ratio", type=float, default=0.2)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--variant-ratio", type=float, default=0.0,
+                        help="share of fluxes that are variations of a spam message")
+    parser.add_argument("--reported-ratio", type=float, default=0.0,
+                        help="share of fluxes that members reported")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--llm-per-post", type=float, default=0.0)
+    parser.add_argument("--llm-per-token", type=float, default=0.0,
+                        help="seconds per output token")
+    parser.add_argument("--llm-parallel", type=int, default=4)
+    parser.add_argument("--fast-model-latency", type=float, default=0.01,
+                        help="base latency of the cascade's fast model")
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--max-rounds", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    api = FakeFluxApi(make_backlog(args.fluxes, args.flagged_ratio, args.duplicate_ratio, args.variant_ratio,
+                                   args.reported_ratio),
+                      page_size=args.page_size, latency=args.api_latency).start()
+    ollama = FakeOllama(latency=args.llm_latency, jitter=args.llm_jitter,
+                        per_post=args.llm_per_post, per_token=args.llm_per_token,
+                        parallel=args.llm_parallel,
+                        model_latency={FAST_MODEL: args.fast_model_latency}).start()
+
+    # only what the stand-ins need; the configuration under test comes in through the environment
+    scratch = tempfile.mkdtemp(prefix="flux-bench-")
+    os.environ.update({
+        "WON_SERVICE_ENDPOINT": api.url,
+        "OLLAMA_HOST": ollama.url,
+        "LLM_MODEL": os.environ.get("LLM_MODEL", "benchmark"),
+        "LOG_FILE": os.path.join(scratch, "benchmark.log"),
+        "RUNNING_AS_SERVICE": "true",
+        "RATING_CACHE_DB": "",
+        "JOURNAL_FILE": os.path.join(scratch, "rating-journal.jsonl"),
+        "LEASE_DB": os.path.join(scratch, "flux-leases.db"),
+        "PID_FILE": os.path.join(scratch, "flux-moderator.pid"),
+    })
+
+    from config.settings import RUNTIME_MODE
+    if RUNTIME_MODE == "async":
+        (elapsed, rounds, startup) = run_async(api, args.max_rounds)
+    else:
+        (elapsed, rounds, startup) = run_sync(api, args.max_rounds)
+
+    result = summarize(args.name, api, ollama, elapsed, rounds, startup)
+    api.stop()
+    ollama.stop()
+    print(json.dumps(result))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
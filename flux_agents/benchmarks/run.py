@@ -0,0 +1,166 @@
+"""
+Offline throughput benchmark. Rates a synthetic backlog against stand-in WON and
+Ollama services under each configuration and reports fluxes/sec and per-flux latency.
+
+    python -m benchmarks.run                          # every configuration
+    python -m benchmarks.run baseline pipelined       # just these
+    python -m benchmarks.run --output results.json    # keep the results
+    python -m benchmarks.run --compare results.json   # fail on a throughput drop
+
+Run it from the flux_agents directory.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+
+# shared by every configuration so they only differ in what they set themselves
+BASE_SETTINGS = {
+    "RATING_CACHE_ENABLED": "false",
+    "LEXICON_MODE": "off",
+    "PIPELINE_ENABLED": "false",
+    "RATING_BATCH_SIZE": "1",
+    "EVAL_BATCH_SIZE": "1",
+    "PROMPT_MODE": "generate",
+    "RUNTIME_MODE": "sync",
+    "INGEST_ENABLED": "false",
+    "METRICS_ENABLED": "false",
+    "OLLAMA_HOSTS": "",
+    "AGENT_WORKERS": "1",
+    "CASCADE_FAST_MODEL": "",
+    "LOG_QUEUE_ENABLED": "false",
+    "GENERATION_PROFILE": "balanced",
+    "STREAM_EVALUATION": "false",
+    "PREFETCH_DEPTH": "0",
+    "NEAR_DUP_ENABLED": "false",
+    "PRIORITY_SCHEDULING": "false",
+}
+
+CONFIGURATIONS = {
+    "baseline": {},
+    "chat": {"PROMPT_MODE": "chat"},
+    "pipelined": {"PIPELINE_ENABLED": "true", "EVAL_WORKERS": "4", "RATING_WRITERS": "2"},
+    "pipelined_batched_writes": {"PIPELINE_ENABLED": "true", "EVAL_WORKERS": "4",
+                                 "RATING_WRITERS": "2", "RATING_BATCH_SIZE": "10"},
+    "prompt_batches": {"EVAL_BATCH_SIZE": "5"},
+    "lexicon": {"LEXICON_MODE": "enforce"},
+    "cache": {"RATING_CACHE_ENABLED": "true"},
+    "async": {"RUNTIME_MODE": "async", "EVAL_WORKERS": "4", "RATING_WRITERS": "2"},
+    "no_journal": {"JOURNAL_ENABLED": "false"},
+    "cascade": {"CASCADE_FAST_MODEL": "benchmark-fast"},
+    "log_queue": {"LOG_QUEUE_ENABLED": "true"},
+    "profile_fast": {"GENERATION_PROFILE": "fast"},
+    "profile_audit": {"GENERATION_PROFILE": "audit"},
+    "stream": {"STREAM_EVALUATION": "true", "STREAM_EARLY_EXIT": "off"},
+    "stream_abort": {"STREAM_EVALUATION": "true", "STREAM_EARLY_EXIT": "abort"},
+    "stream_background": {"STREAM_EVALUATION": "true", "STREAM_EARLY_EXIT": "background",
+                          "PIPELINE_ENABLED": "true", "EVAL_WORKERS": "4", "RATING_WRITERS": "2"},
+    "prefetch": {"PREFETCH_DEPTH": "2"},
+    "pipelined_prefetch": {"PIPELINE_ENABLED": "true", "EVAL_WORKERS": "4", "RATING_WRITERS": "2",
+                           "PREFETCH_DEPTH": "2"},
+    "near_duplicates": {"NEAR_DUP_ENABLED": "true"},
+    "priority": {"PIPELINE_ENABLED": "true", "EVAL_WORKERS": "4", "RATING_WRITERS": "2",
+                 "PREFETCH_DEPTH": "2", "PREFETCH_MAX_ITEMS": "100", "PRIORITY_SCHEDULING": "true"},
+}
+
+
+def run_configuration(name, settings, stub_args):
+    env = os.environ.copy()
+    env.update(BASE_SETTINGS)
+    env.update(settings)
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.harness", "--name", name] + stub_args,
+        cwd=AGENT_DIR, env=env, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {"name": name, "settings": settings, "error": completed.stderr.strip()[-2000:]}
+    result = json.loads(lines[-1])
+    result["settings"] = settings
+    return result
+
+
+def compare(results, baseline_path, tolerance):
+    """Names of the configurations whose throughput fell more than `tolerance` below the baseline."""
+    with open(baseline_path) as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["name"], {}).get("fluxes_per_sec")
+        now = result.get("fluxes_per_sec")
+        if before and (now is None or now < before * (1 - tolerance)):
+            regressions.append(result["name"])
+            print(f"REGRESSION {result['name']}: {now} fluxes/sec, was {before}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'configuration':<26} {'fluxes/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'dups':>5} {'agree':>6} {'rep p95':>9}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['name']:<26} failed: {result['error'].splitlines()[-1:]}")
+            continue
+        latency = result["latency_ms"]
+        print(f"{result['name']:<26} {result['fluxes_per_sec']:>9} {latency['p50']:>9} "
+              f"{latency['p95']:>9} {latency['p99']:>9} {result['duplicates']:>5} "
+              f"{result['agreement']!s:>6} {result['reported_p95_ms']!s:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("configurations", nargs="*",
+                        help=f"any of: {', '.join(CONFIGURATIONS)}")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="results file to check throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed throughput drop against --compare (default: 0.10)")
+    # stand-in service parameters, passed through to the harness
+    parser.add_argument("--fluxes", default="200")
+    parser.add_argument("--page-size", default="10")
+    parser.add_argument("--duplicate-ratio", default="0.1")
+    parser.add_argument("--variant-ratio", default="0.1")
+    parser.add_argument("--reported-ratio", default="0.05")
+    parser.add_argument("--llm-latency", default="0.05")
+    parser.add_argument("--llm-jitter", default="0.02")
+    parser.add_argument("--llm-per-post", default="0.01")
+    parser.add_argument("--llm-per-token", default="0.0005")
+    parser.add_argument("--llm-parallel", default="4")
+    parser.add_argument("--fast-model-latency", default="0.01")
+    parser.add_argument("--api-latency", default="0.002")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.configurations if name not in CONFIGURATIONS]
+    if unknown:
+        parser.error(f"unknown configuration: {', '.join(unknown)}")
+    names = args.configurations or list(CONFIGURATIONS)
+    stub_args = []
+    for option in ("fluxes", "page_size", "duplicate_ratio", "variant_ratio", "reported_ratio", "llm_latency", "llm_jitter",
+                   "llm_per_post", "llm_per_token", "llm_parallel", "fast_model_latency", "api_latency"):
+        stub_args += ["--" + option.replace("_", "-"), getattr(args, option)]
+
+    results = [run_configuration(name, CONFIGURATIONS[name], stub_args)
+               for name in names]
+    print_table(results)
+
+    if args.output:
+        report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "python": sys.version.split()[0],
+                  "stubs": dict(zip(stub_args[::2], stub_args[1::2])),
+                  "results": results}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = [result["name"] for result in results if "error" in result]
+    if args.compare:
+        failed += compare(results, args.compare, args.tolerance)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Local stand-ins for the WON flux moderation API and Ollama, good enough to drive
+FluxNanny end to end without either service.
+"""
+import json
+import random
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CLEAN_POSTS = [
+    "<p>Fusion update #{n}: the new magnets held field for a full minute.</p>",
+    "<p>Anyone going to the reactor open day #{n}? I'll bring coffee.</p>",
+    "<p>Thorium fuel cycles are underrated, change my mind ({n}).</p>",
+    "<p>Took my kids to see the cooling towers. They loved it. #{n}</p>",
+]
+FLAGGED_POSTS = [
+    "<p>This is fucking ridiculous, post {n}.</p>",
+    "<p>What a load of shit, number {n}.</p>",
+]
+# spam waves: one message posted over and over with small changes
+SPAM_POSTS = [
+    "<p>Huge discount on premium reactor tours this week only, book now with code SAVE{n} for a free lunch!</p>",
+    "<p>Earn {n} dollars a day from home with this one simple trick, send me a message for all the details.</p>",
+]
+
+
+def make_backlog(size, flagged_ratio=0.2, duplicate_ratio=0.0, variant_ratio=0.0, reported_ratio=0.0, seed=7):
+    """
+    Fluxes to rate; some carry forbidden words, some repeat earlier content, some are
+    variations of a spam message and some were reported by members.
+    """
+    rng = random.Random(seed)
+    fluxes = []
+    for n in range(1, size + 1):
+        if fluxes and rng.random() < duplicate_ratio:
+            content = rng.choice(fluxes)["content"]
+        elif rng.random() < variant_ratio:
+            content = rng.choice(SPAM_POSTS).format(n=rng.randint(10, 99))
+        elif rng.random() < flagged_ratio:
+            content = rng.choice(FLAGGED_POSTS).format(n=n)
+        else:
+            content = rng.choice(CLEAN_POSTS).format(n=n)
+        flux = {"id": n, "content": content}
+        if rng.random() < reported_ratio:
+            flux["reportCount"] = 1
+        fluxes.append(flux)
+    return fluxes
+
+
+def expected_rating(content):
+    return "violation" if re.search(r"fuck|shit", content) else "safe"
+
+
+# about what a model writes when nothing stops it
+REASON_TEXT = "The post is rated on its wording alone; nothing in it is aimed at another member. " * 2
+THINK_TEXT = "Reading the post for swearing, insults, threats and innuendo before settling on a level. " * 8
+
+
+def fill(item_schema, content):
+    """A rating for `content` with every free-text field the schema asks for, cut to its maxLength."""
+    properties = item_schema.get("properties", {})
+    decision = {"rating": expected_rating(content)}
+    for (field, text) in (("reason", REASON_TEXT), ("think", THINK_TEXT)):
+        if field in properties:
+            decision[field] = text[:properties[field].get("maxLength", len(text))]
+    return decision
+
+
+class StubServer:
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes; without this, delayed ACKs
+        # add ~40ms to every keep-alive call and swamp what is being measured
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def reply(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeFluxApi(StubServer):
+    """
+    Serves a backlog on /flux-moderation/unrated-fluxes the way the WON service does
+    (first page of what is still unrated, with hasMore and total) and takes ratings
+    singly or in batches. Each flux's latency runs from the first time it was served
+    until its rating arrives.
+    """
+
+    def __init__(self, fluxes, page_size=10, latency=0.0, batch_ratings=True):
+        self.fluxes = {flux["id"]: flux for flux in fluxes}
+        self.unrated = dict(self.fluxes)
+        self.page_size = page_size
+        self.latency = latency
+        self.batch_ratings = batch_ratings
+        self.ratings = {}
+        self.served_at = {}
+        self.rated_at = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+        super().__init__()
+
+    def count(self, call):
+        with self.lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+
+    def page(self, limit):
+        now = time.perf_counter()
+        with self.lock:
+            items = [self.unrated[key] for key in sorted(self.unrated)][:limit]
+            for flux in items:
+                self.served_at.setdefault(flux["id"], now)
+            return {"items": items, "hasMore": len(self.unrated) > limit, "total": len(self.unrated)}
+
+    def store(self, ratings):
+        now = time.perf_counter()
+        with self.lock:
+            for rating in ratings:
+                self.ratings.setdefault(rating["fluxId"], []).append(rating)
+                self.rated_at.setdefault(rating["fluxId"], now)
+                self.unrated.pop(rating["fluxId"], None)
+
+    def agreement(self):
+        """Share of rated fluxes whose first rating is the one their content calls for."""
+        with self.lock:
+            agreed = sum(1 for (key, ratings) in self.ratings.items()
+                         if ratings[0]["rating"] == expected_rating(self.fluxes[key]["content"]))
+            return round(agreed / len(self.ratings), 4) if self.ratings else None
+
+    def latencies(self, reported=None):
+        """Seconds from first served to rated; only of (un)reported fluxes if `reported` is set."""
+        with self.lock:
+            return [self.rated_at[key] - self.served_at[key]
+                    for key in self.rated_at if key in self.served_at
+                    and (reported is None or bool(self.fluxes[key].get("reportCount")) == reported)]
+
+    def handler(self):
+        api = self
+
+        class FluxApiHandler(JsonHandler):
+
+            def do_GET(self):
+                if "/flux-moderation/unrated-fluxes" not in self.path:
+                    return self.reply(404, {"error": "not found"})
+                api.count("fetch_next_fluxes")
+                time.sleep(api.latency)
+                match = re.search(r"limit=(\d+)", self.path)
+                self.reply(200, api.page(
+                    int(match.group(1)) if match else api.page_size))
+
+            def do_POST(self):
+                body = self.body()
+                time.sleep(api.latency)
+                if self.path.endswith("/flux-moderation/ratings"):
+                    api.count("rate_flux")
+                    api.store([body])
+                    return self.reply(201, {"fluxId": body["fluxId"]})
+                if self.path.endswith("/flux-moderation/ratings/batch") and api.batch_ratings:
+                    api.count("rate_fluxes")
+                    api.store(body)
+                    return self.reply(201, {"count": len(body)})
+                # no lease endpoint, like the current service
+                self.reply(404, {"error": "not found"})
+
+        return FluxApiHandler
+
+
+class FakeOllama(StubServer):
+    """
+    Answers generate, chat and show like Ollama, after a delay of `latency` seconds
+    (plus up to `jitter` either way, `per_post` more for each extra post in a batch and
+    `per_token` for every output token). Answers fill the free-text fields the schema asks
+    for up to their maxLength and are cut off at num_predict tokens, as a model would be.
+    At most `parallel` generations run at once, like OLLAMA_NUM_PARALLEL.
+    Models named in `model_latency` take their own base latency instead, and when
+    asked for a confidence, `unsure_ratio` of the answers come back unsure.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, per_post=0.0, per_token=0.0, parallel=4, context_length=8192,
+                 model_latency=None, unsure_ratio=0.1, seed=7):
+        self.latency = latency
+        self.per_token = per_token
+        self.model_latency = model_latency or {}
+        self.unsure_ratio = unsure_ratio
+        self.jitter = jitter
+        self.per_post = per_post
+        self.slots = threading.BoundedSemaphore(max(1, parallel))
+        self.context_length = context_length
+        self.rng = random.Random(seed)
+        self.calls = {}
+        self.lock = threading.Lock()
+        super().__init__()
+
+    def count(self, call):
+        with self.lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+
+    def delay(self, model, posts=1, tokens=0):
+        with self.lock:
+            spread = self.rng.uniform(-self.jitter, self.jitter)
+        latency = self.model_latency.get(model, self.latency)
+        return max(0.0, latency + spread + self.per_post * (posts - 1) + self.per_token * tokens)
+
+    def answer(self, body, text):
+        """The rating JSON for a prompt, shaped by the schema the client asked for."""
+        schema = body.get("format") or {}
+        if not isinstance(schema, dict) or not schema.get("properties"):
+            return ("", 1)
+        if "ratings" in schema["properties"]:
+            item = schema["properties"]["ratings"]["items"]
+            posts = re.findall(r"### Post (\S+)\n(.*?)\n\n", text, re.S)
+            return (json.dumps({"ratings": [dict(id=key, **fill(item, content))
+                                            for (key, content) in posts]}), max(1, len(posts)))
+        if "reply" in schema["properties"]:
+            return (json.dumps({"reply": "ready"}), 1)
+        # the post is the last thing in the prompt
+        decision = fill(schema, text.split("---")[-1])
+        if "confidence" in schema["properties"]:
+            with self.lock:
+                decision["confidence"] = 0.4 if self.rng.random() < self.unsure_ratio else 0.95
+        return (json.dumps(decision), 1)
+
+    def handler(self):
+        ollama = self
+
+        class OllamaHandler(JsonHandler):
+
+            def do_POST(self):
+                body = self.body() or {}
+                if self.path.endswith("/api/show"):
+                    ollama.count("show")
+                    return self.reply(200, {"model_info": {
+                        "stub.context_length": ollama.context_length}})
+                if not self.path.endswith(("/api/generate", "/api/chat")):
+                    return self.reply(404, {"error": "not found"})
+
+                chat = self.path.endswith("/api/chat")
+                ollama.count("chat" if chat else "generate")
+                if chat:
+                    text = "\n".join(message["content"] for message in body.get("messages", [])
+                                     if message["role"] == "user")
+                else:
+                    text = body.get("prompt") or ""
+                (output, posts) = ollama.answer(body, text) if text else ("", 1)
+                eval_tokens = max(1, len(output) // 4)
+                limit = (body.get("options") or {}).get("num_predict")
+                done_reason = "stop"
+                if limit and limit > 0 and eval_tokens > limit:
+                    (output, eval_tokens, done_reason) = (output[:limit * 4], limit, "length")
+
+                if body.get("stream"):
+                    return self.stream(body, chat, text, output, posts, eval_tokens, done_reason)
+                with ollama.slots:
+                    started = time.perf_counter()
+                    time.sleep(ollama.delay(body.get("model"), posts, eval_tokens) if text else 0)
+                    took = int((time.perf_counter() - started) * 1e9)
+                self.reply(200, self.result(body, chat, text, output,
+                                            eval_tokens, done_reason, took))
+
+            def result(self, body, chat, text, output, eval_tokens, done_reason, took, done=True):
+                response = {
+                    "model": body.get("model"),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "done": done,
+                }
+                if done:
+                    response.update({
+                        "done_reason": done_reason,
+                        "load_duration": 1000,
+                        "prompt_eval_count": max(1, len(text) // 4),
+                        "prompt_eval_duration": took // 3,
+                        "eval_count": eval_tokens,
+                        "eval_duration": took - took // 3,
+                        "total_duration": took,
+                    })
+                if chat:
+                    response["message"] = {
+                        "role": "assistant", "content": output}
+                else:
+                    response["response"] = output
+                return response
+
+            def stream(self, body, chat, text, output, posts, eval_tokens, done_reason):
+                """
+                Send the answer a few tokens at a time, as Ollama does. A client that hangs
+                up stops the generation and frees its slot.
+                """
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                piece = 16  # characters, about four tokens
+                with ollama.slots:
+                    started = time.perf_counter()
+                    time.sleep(ollama.delay(body.get("model"), posts) if text else 0)
+                    try:
+                        for offset in range(0, len(output), piece):
+                            time.sleep(ollama.per_token * piece / 4)
+                            self.send_chunk(self.result(body, chat, text, output[offset:offset + piece],
+                                                        eval_tokens, done_reason, 0, done=False))
+                        took = int((time.perf_counter() - started) * 1e9)
+                        self.send_chunk(self.result(body, chat, text, "",
+                                                    eval_tokens, done_reason, took))
+                        self.wfile.write(b"0\r\n\r\n")
+                        self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        ollama.count("stream_closed_early")
+                        self.close_connection = True
+
+            def send_chunk(self, message):
+                data = (json.dumps(message) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        return OllamaHandler
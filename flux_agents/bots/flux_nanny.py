@@ -1,9 +1,47 @@
+import math
+import time
+import queue
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from urllib.parse import urlencode
-from models.llm import ModeratorBotClient
-from api.flux_svc import FluxService
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from models.llm import ModeratorBotClient, AsyncModeratorBotClient
+from api.flux_svc import FluxService, AsyncFluxService
+from api.rating_writer import BufferedRatingWriter
+from api.ingest_server import IngestServer
+from api.flux_leases import leases_from_settings, leases_enabled
+from api.rating_journal import RatingJournal
+from api.flux_priority import FluxScheduler
+from models.streaming import settled_reason
+from config.settings import (PIPELINE_ENABLED, EVAL_WORKERS, RATING_WRITERS, RATING_BATCH_SIZE,
+                             EVAL_BATCH_SIZE, MODEL_TOUCH_INTERVAL, INGEST_ENABLED, INGEST_QUEUE_SIZE,
+                             AGENT_WORKERS, JOURNAL_ENABLED, PRIORITY_SCHEDULING, DRAIN_TIMEOUT,
+                             STREAM_EVALUATION, STREAM_EARLY_EXIT)
 from utils.logger import logger
 
+# how many rated flux ids to remember for skipping duplicate pushes
+RECENTLY_RATED_LIMIT = 10000
+# seconds between looks at the stop flag while waiting on evaluations or pushes
+SIGNAL_CHECK_INTERVAL = 1
+
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def new_round_summary():
+    return {"processed": 0, "has_more": False, "backlog": None, "failed": False}
+
+
+def update_round_summary(summary, batch):
+    if summary["backlog"] is None:
+        # the service may report the whole backlog; otherwise the first page is a lower bound
+        summary["backlog"] = batch.get("total", len(batch["items"]))
+    summary["processed"] += len(batch["items"])
+    summary["has_more"] = summary["has_more"] or batch["hasMore"]
+
 
 class FluxNanny:
     """Looks at every flux that needs a rating. Asks AI for the rating, and updates the Flux Service."""
@@ -11,45 +49,551 @@ class FluxNanny:
     def __init__(self):
         self.flux_svc = FluxService()
         self.ai = ModeratorBotClient()
+        self.startup_timings = {}
 
-        # make sure AI is alive and well
-        if not self.ai.ping_ai():
+        started = time.perf_counter()
+        self.startup_timings["api_reachable"] = self.flux_svc.check_reachable()
+        self.startup_timings["api_check_ms"] = elapsed_ms(started)
+
+        # make sure AI is alive and well, and loaded before the first real post
+        started = time.perf_counter()
+        warm_up = self.ai.warm_up()
+        if warm_up is None:
             logger.error("ai_not_responsive",
                          message="No response from AI agent")
             raise Exception("AI agent is not responsive")
+        self.startup_timings.update(warm_up)
+        self.startup_timings["ai_ready_ms"] = elapsed_ms(started)
+        self.last_touch = time.monotonic()
+
+        # pipelined mode: evaluations run on one pool, rating submissions on another
+        self.eval_pool = None
+        self.write_pool = None
+        self.start_pools(PIPELINE_ENABLED, EVAL_WORKERS, RATING_WRITERS)
+
+        # graceful stop (SIGTERM): no new work is taken on once stopping is set, and what is
+        # in flight has until the drain deadline; woken cuts a rest short
+        self.stopping = threading.Event()
+        self.woken = threading.Event()
+        self.drain_deadline = None
+        self.abandoned = []
+
+        # recently rated ids (and their ratings) are remembered so a push and a sweep do not
+        # both rate a flux; recently stored ones, so a lease is only closed once its rating landed
+        self.recently_rated = OrderedDict()
+        self.recently_stored = OrderedDict()
+        self.recent_lock = threading.Lock()
+        self.rated_total = 0
+
+        # write-ahead journal: verdicts survive failed submissions and restarts
+        self.journal = RatingJournal() if JOURNAL_ENABLED else None
+        if self.journal:
+            self.flux_svc.on_rejected = self.journal.reject
+
+        # batched submission: ratings are buffered and stored a batch at a time
+        self.writer = None
+        if RATING_BATCH_SIZE > 1:
+            self.writer = BufferedRatingWriter(self.flux_svc, on_stored=self.stored)
+            logger.info("rating_batches_enabled", batch_size=RATING_BATCH_SIZE)
+        self.replay_journal()
+
+        # push ingestion: fluxes posted to the local listener are rated while we rest
+        self.inbox = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self.sweep_requested = threading.Event()
+        self.ingest = None
+        if INGEST_ENABLED:
+            self.ingest = IngestServer(self.accept_pushed)
+            self.ingest.start()
+
+        # several workers share the backlog: only fluxes leased to this one are rated
+        self.leases = leases_from_settings(self.flux_svc)
+
+        # priority scheduling: urgent fluxes are rated first; kept across sweeps for their arrival times
+        self.scheduler = FluxScheduler() if PRIORITY_SCHEDULING else None
 
     def do_action(self):
+        """
+        Rate everything that is waiting. Returns a summary of the round for the polling
+        scheduler: how many fluxes were processed, whether more than a page was waiting,
+        the backlog estimate from the first page, and whether the round failed.
+        """
+        summary = new_round_summary()
+
+        self.replay_journal()
+        logger.info("processing_started", message="Processing new fluxes.")
+        # the next pages may already be on their way while this one is rated
+        pages = self.flux_svc.iter_unrated(scheduler=self.scheduler)
+        try:
+            for items in pages:
+                # with leases, each worker takes its share of the page
+                share = math.ceil(len(items) / max(1, AGENT_WORKERS))
+                taken = self.rate_items(items, share)
+                pages.done([flux["id"] for flux in items])
+                if not taken:
+                    logger.info("page_leased_elsewhere", count=len(items))
+                    break
+                if self.stopping.is_set():
+                    logger.info("drain_skipped_pages", message="Stopping; leaving the rest for later.")
+                    break
+        finally:
+            pages.close()
+        summary.update(processed=pages.handed_out, has_more=pages.has_more,
+                       backlog=pages.total)
+
+        if pages.failed:
+            logger.error("processing_failed",
+                         message="Some kind of failure happened. Exiting...")
+            self.ai.log_stats()
+            summary["failed"] = True
+            return summary
+
+        logger.info("processing_complete", message="That's all for now.")
+        self.ai.log_stats()
+        if self.scheduler:
+            self.scheduler.log_stats()
+        return summary
+
+    def rate_items(self, items, limit=None):
+        """
+        Rate a list of fluxes and make sure every rating has been submitted. With leases,
+        only the fluxes (at most `limit`) this worker could claim are rated. Returns how
+        many fluxes were taken on.
+        """
+        if not self.leases:
+            self.rate_unleased(items)
+            return len(items)
+
+        claimed = set(self.leases.claim(
+            [flux["id"] for flux in items], limit or len(items)))
+        keys = [flux["id"] for flux in items if flux["id"] in claimed]
+        try:
+            self.rate_unleased(
+                [flux for flux in items if flux["id"] in claimed])
+        finally:
+            self.leases.finish(
+                keys, [key for key in keys if self.was_stored(key)])
+        return len(keys)
+
+    def rate_unleased(self, items):
+        if self.pipelined:
+            self.rate_pipelined(items)
+        else:
+            for group in self.groups(items):
+                if self.stopping.is_set():
+                    break
+                # rate the flux posts
+                verdicts = self.evaluate(group)
+
+                # record the ratings
+                for (key, (rating, reason)) in verdicts.items():
+                    self.record(key, rating, reason)
+
+        # buffered ratings must land before asking for more, or they come back as unrated
+        if self.writer:
+            self.writer.flush()
+
+    def rest(self, seconds):
+        """
+        Wait out the polling interval. Fluxes pushed in the meantime are rated as they
+        arrive, and a push without content cuts the rest short so a sweep runs right away.
+        The model is re-pinned along the way so the next round does not start by paying
+        for a reload.
+        """
+        deadline = time.monotonic() + seconds
+        while not self.sweep_requested.is_set():
+            if self.stopping.is_set() or self.woken.is_set():
+                self.woken.clear()
+                return
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            wait = deadline - now
+            if MODEL_TOUCH_INTERVAL:
+                wait = min(wait, self.last_touch + MODEL_TOUCH_INTERVAL - now)
+
+            pushed = self.take_pushed(max(0, min(wait, SIGNAL_CHECK_INTERVAL)))
+            if pushed:
+                logger.info("rating_pushed_fluxes", count=len(pushed))
+                self.rate_items(pushed)
+
+            if MODEL_TOUCH_INTERVAL and time.monotonic() - self.last_touch >= MODEL_TOUCH_INTERVAL:
+                self.ai.touch()
+                self.last_touch = time.monotonic()
+
+        self.sweep_requested.clear()
+        logger.info("sweep_requested", message="Push without content; sweeping now.")
+
+    def accept_pushed(self, flux):
+        """Called by the ingest listener for every pushed flux. False means no room."""
+        try:
+            self.inbox.put_nowait(flux)
+            return True
+        except queue.Full:
+            return False
+
+    def take_pushed(self, timeout):
+        """
+        Wait up to `timeout` seconds for pushed fluxes and return those ready to rate.
+        Pushes that only carry an id flag a sweep instead.
+        """
+        try:
+            pushed = [self.inbox.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(pushed) < INGEST_QUEUE_SIZE:
+            try:
+                pushed.append(self.inbox.get_nowait())
+            except queue.Empty:
+                break
+
+        ready = []
+        for flux in pushed:
+            if not isinstance(flux.get("content"), str):
+                self.sweep_requested.set()
+            elif self.was_rated(flux["id"]):
+                logger.info("pushed_flux_already_rated", flux_id=flux["id"])
+            else:
+                ready.append(flux)
+        return ready
+
+    def was_rated(self, key):
+        with self.recent_lock:
+            return key in self.recently_rated
+
+    def was_stored(self, key):
+        """Whether the flux got a real rating (not "error") that the service has stored."""
+        with self.recent_lock:
+            return self.recently_rated.get(key) not in (None, "error") and key in self.recently_stored
+
+    def stored(self, keys):
+        """The service has stored the ratings of these fluxes."""
+        if self.journal:
+            self.journal.acknowledge(keys)
+        with self.recent_lock:
+            for key in keys:
+                self.recently_stored[key] = True
+            while len(self.recently_stored) > RECENTLY_RATED_LIMIT:
+                self.recently_stored.popitem(last=False)
+
+    def groups(self, items):
+        """Split a page into the units handed to the AI: single posts, or batches for one prompt."""
+        size = max(1, EVAL_BATCH_SIZE)
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def evaluate(self, fluxes):
+        """Rate a group of fluxes. Returns {flux id: (rating, reason)}."""
+        verdicts = {}
+        if self.journal:
+            # verdicts that were paid for but never stored are submitted as they are;
+            # failed evaluations are never journaled, so those are asked again
+            for flux in fluxes:
+                verdict = self.journal.verdict(flux["id"])
+                if verdict and verdict[0] != "error":
+                    verdicts[flux["id"]] = verdict
+            fluxes = [flux for flux in fluxes if flux["id"] not in verdicts]
+
+        for flux in fluxes:
+            logger.info("rating_flux", flux_id=flux["id"])
+        if len(fluxes) == 1:
+            verdicts[fluxes[0]["id"]] = self.ai.evaluate_post(fluxes[0])
+        elif fluxes:
+            verdicts.update(self.ai.evaluate_posts(fluxes))
+        return verdicts
+
+    def record(self, key, rating, reason):
+        # a streamed verdict may still be finishing its reason
+        reason = settled_reason(reason)
+        with self.recent_lock:
+            self.recently_rated[key] = rating
+            self.recently_stored.pop(key, None)
+            self.rated_total += 1
+            while len(self.recently_rated) > RECENTLY_RATED_LIMIT:
+                self.recently_rated.popitem(last=False)
+        if self.journal:
+            self.journal.record(key, rating, reason)
+        self.submit(key, rating, reason)
+        if self.scheduler:
+            self.scheduler.rated(key)
+
+    def submit(self, key, rating, reason):
+        if self.writer:
+            self.writer.add(key, rating, reason)
+        elif self.flux_svc.rate_flux(key, rating, reason) is not None:
+            self.stored([key])
+
+    def replay_journal(self):
+        """Submit the journaled verdicts the service has not acknowledged yet."""
+        if not self.journal:
+            return
+        entries = self.journal.unacknowledged()
+        if entries:
+            logger.info("replaying_journal", count=len(entries))
+            for (key, rating, reason) in entries:
+                self.submit(key, rating, reason)
+            if self.writer:
+                self.writer.flush()
+        logger.info("rating_journal_stats", **self.journal.stats(reset=True))
+        self.journal.maybe_compact()
+
+    def rate_pipelined(self, items):
+        """
+        Evaluate a page of fluxes on the worker pool, handing each verdict to the writer
+        stage as soon as it is ready. Verdicts are matched to their flux by future, so
+        finishing out of order is fine.
+        """
+        evaluations = {self.eval_pool.submit(self.evaluate, group): [flux["id"] for flux in group]
+                       for group in self.groups(items)}
+        writes = {}
+        pending = set(evaluations)
+        while pending:
+            (finished, pending) = wait(
+                pending, timeout=SIGNAL_CHECK_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    verdicts = future.result()
+                except Exception as e:
+                    logger.exception("evaluation_failed",
+                                     flux_ids=evaluations[future], error=str(e))
+                    continue
+                for (key, (rating, reason)) in verdicts.items():
+                    writes[self.write_pool.submit(
+                        self.record, key, rating, reason)] = key
+            if pending and self.stopping.is_set():
+                pending = self.drain(pending, evaluations)
+
+        # wait for the writer stage so the page is fully recorded before fetching more
+        for future in as_completed(writes):
+            try:
+                future.result()
+            except Exception as e:
+                logger.exception("rating_submission_failed",
+                                 flux_id=writes[future], error=str(e))
+
+    def drain(self, pending, evaluations):
+        """
+        Stopping: evaluations that have not started are dropped, and the running ones are
+        waited for until the drain deadline. Returns what is still worth waiting for.
+        """
+        pending = {future for future in pending if not future.cancel()}
+        if pending and time.monotonic() >= self.drain_deadline:
+            abandoned = [key for future in pending for key in evaluations[future]]
+            logger.warning("drain_deadline_passed", abandoned=abandoned)
+            # if they still finish before the process is gone, the next start submits them
+            for future in pending:
+                future.add_done_callback(self.checkpoint)
+            self.abandoned += pending
+            return set()
+        return pending
+
+    def checkpoint(self, future):
+        """Journal the verdicts of an evaluation given up on at shutdown, for the next start."""
+        if not self.journal or future.cancelled() or future.exception():
+            return
+        try:
+            for (key, (rating, reason)) in future.result().items():
+                self.journal.record(key, rating, settled_reason(reason))
+        except Exception as e:
+            logger.warning("checkpoint_failed", error=str(e))
+
+    def stop(self, timeout=DRAIN_TIMEOUT):
+        """
+        Stop taking on new work (SIGTERM). Evaluations in flight get `timeout` seconds to
+        finish; their verdicts are submitted, and the round ends as soon as they are.
+        """
+        self.drain_deadline = time.monotonic() + timeout
+        self.stopping.set()
+
+    def wake(self):
+        """Cut the current rest short, so the main loop gets a turn (SIGHUP)."""
+        self.woken.set()
+
+    def start_pools(self, pipelined, eval_workers, rating_writers):
+        self.pipelined = pipelined
+        if self.pipelined:
+            self.eval_pool = ThreadPoolExecutor(
+                max_workers=max(1, eval_workers), thread_name_prefix="evaluator")
+            self.write_pool = ThreadPoolExecutor(
+                max_workers=max(1, rating_writers), thread_name_prefix="writer")
+            logger.info("pipeline_enabled", eval_workers=eval_workers,
+                        rating_writers=rating_writers)
+        # a reason finished in the background only helps if something else runs meanwhile;
+        # without the pipeline, record() waits for it right away
+        self.ai.stream_early_exit = STREAM_EARLY_EXIT
+        if STREAM_EVALUATION and STREAM_EARLY_EXIT == "background" and not self.pipelined:
+            logger.warning("stream_background_not_pipelined", early_exit="off",
+                           message="STREAM_EARLY_EXIT=background needs PIPELINE_ENABLED; waiting for reasons instead.")
+            self.ai.stream_early_exit = "off"
+
+    def reconfigure(self, settings, changed):
+        """
+        Apply reloaded settings between rounds: the pipeline and its concurrency, and the
+        model, which is warmed up before it takes over.
+        """
+        if changed & {"PIPELINE_ENABLED", "EVAL_WORKERS", "RATING_WRITERS"}:
+            # between rounds the pools are idle, so this only waits for their threads to exit
+            for pool in (self.eval_pool, self.write_pool):
+                if pool:
+                    pool.shutdown(wait=True)
+            (self.eval_pool, self.write_pool) = (None, None)
+            self.start_pools(settings.PIPELINE_ENABLED, settings.EVAL_WORKERS, settings.RATING_WRITERS)
+        if "LLM_MODEL" in changed:
+            self.ai.switch_model(settings.LLM_MODEL or "gemma3:latest")
+            self.last_touch = time.monotonic()
+
+    def status(self):
+        """What the service controller shows for this worker."""
+        with self.recent_lock:
+            status = {"rated": self.rated_total}
+        if self.leases:
+            status["leases_held"] = self.leases.held()
+        if self.ai.pool:
+            status["ollama"] = self.ai.pool.status()
+        return status
+
+    def close(self):
+        """Release the worker pools, flush buffered ratings and drop pooled connections."""
+        if self.ingest:
+            self.ingest.stop()
+        drained = self.drain_deadline is not None and time.monotonic() >= self.drain_deadline
+        for pool in (self.eval_pool, self.write_pool):
+            if pool:
+                # past the drain deadline, evaluations still running are not waited for
+                abandon = drained and pool is self.eval_pool
+                pool.shutdown(wait=not abandon, cancel_futures=abandon)
+        if self.writer:
+            self.writer.close()
+        if self.journal:
+            # the interpreter waits for evaluations given up on anyway, so their verdicts
+            # can still be checkpointed; a kill at the controller's deadline cuts this short
+            wait(self.abandoned)
+            self.journal.close()
+        if self.leases:
+            self.leases.close()
+        self.flux_svc.close()
+        self.ai.close()
+
+
+class AsyncFluxNanny:
+    """
+    Asyncio flavor of FluxNanny. Every flux on a page is rated concurrently; semaphores
+    keep the number of in-flight evaluations and rating submissions bounded.
+    """
+
+    def __init__(self):
+        # leases are only kept by the sync runtime; without them every worker would rate
+        # every flux
+        if leases_enabled():
+            logger.error("async_leases_unsupported", agent_workers=AGENT_WORKERS,
+                         message="RUNTIME_MODE=async runs a single worker; set AGENT_WORKERS=1 or use sync.")
+            raise Exception("Flux leases are not available in the async runtime")
+        self.flux_svc = AsyncFluxService()
+        self.ai = AsyncModeratorBotClient()
+        self.eval_slots = asyncio.Semaphore(max(1, EVAL_WORKERS))
+        self.write_slots = asyncio.Semaphore(max(1, RATING_WRITERS))
+        # graceful stop (SIGTERM), as in FluxNanny; woken cuts a rest short
+        self.stopping = asyncio.Event()
+        self.woken = asyncio.Event()
+        self.drain_deadline = None
+
+    async def start(self):
+        # make sure AI is alive and well
+        if not await self.ai.ping_ai():
+            logger.error("ai_not_responsive",
+                         message="No response from AI agent")
+            raise Exception("AI agent is not responsive")
+        logger.info("pipeline_enabled", eval_workers=EVAL_WORKERS,
+                    rating_writers=RATING_WRITERS, mode="async")
+
+    async def do_action(self):
         check_for_more = True
+        summary = new_round_summary()
 
         logger.info("processing_started", message="Processing new fluxes.")
         while check_for_more:
-            # gets the next batch of unrated fluxes
-            batch = self.flux_svc.fetch_next_fluxes()
+            batch = await self.flux_svc.fetch_next_fluxes()
 
             # returning None is the signal for an error that got swallowed
             if not batch:
                 logger.error("processing_failed",
                              message="Some kind of failure happened. Exiting...")
-                return
+                self.ai.log_stats()
+                summary["failed"] = True
+                return summary
 
-            # total = batch["total"]
-            # if (total):
-            #     logger.info("new_flux_posts_found", total=total)
-            # else:
-            #     logger.info("no_new_items")
-            #     break
+            update_round_summary(summary, batch)
+            await self.rate_page(batch["items"])
 
-            items = batch["items"]
-            for flux in items:
-                key = flux["id"]
+            check_for_more = batch["hasMore"]
+            if check_for_more and self.stopping.is_set():
+                logger.info("drain_skipped_pages", message="Stopping; leaving the rest for later.")
+                break
+
+        logger.info("processing_complete", message="That's all for now.")
+        self.ai.log_stats()
+        return summary
 
-                # rate the flux post
+    async def rate_page(self, items):
+        """
+        Rate a page concurrently and wait for every rating. Once stopping, what is still
+        running gets until the drain deadline.
+        """
+        tasks = {asyncio.create_task(self.rate(flux)): flux["id"] for flux in items}
+        pending = set(tasks)
+        stopped = asyncio.create_task(self.stopping.wait())
+        try:
+            while pending and not self.stopping.is_set():
+                (_, pending) = await asyncio.wait(pending | {stopped}, return_when=asyncio.FIRST_COMPLETED)
+                pending.discard(stopped)
+        finally:
+            stopped.cancel()
+        if not pending:
+            return
+        (_, pending) = await asyncio.wait(pending, timeout=max(0, self.drain_deadline - time.monotonic()))
+        if pending:
+            logger.warning("drain_deadline_passed", abandoned=[tasks[task] for task in pending])
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending)
+
+    async def rate(self, flux):
+        key = flux["id"]
+        try:
+            async with self.eval_slots:
+                # stopping: evaluations that have not started are dropped
+                if self.stopping.is_set():
+                    return
                 logger.info("rating_flux", flux_id=key)
-                (rating, reason) = self.ai.evaluate_post(flux)
+                (rating, reason) = await self.ai.evaluate_post(flux)
+            async with self.write_slots:
+                await self.flux_svc.rate_flux(key, rating, reason)
+        except Exception as e:
+            logger.exception("evaluation_failed", flux_id=key, error=str(e))
 
-                # record the rating
-                self.flux_svc.rate_flux(key, rating, reason)
+    async def rest(self, seconds):
+        """Wait out the polling interval, unless stopping or woken first."""
+        if self.stopping.is_set():
+            return
+        woken = asyncio.create_task(self.woken.wait())
+        stopped = asyncio.create_task(self.stopping.wait())
+        try:
+            await asyncio.wait({woken, stopped}, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            woken.cancel()
+            stopped.cancel()
+            self.woken.clear()
 
-            check_for_more = batch["hasMore"]
+    def stop(self, timeout=DRAIN_TIMEOUT):
+        """
+        Stop taking on new work (SIGTERM). Evaluations in flight get `timeout` seconds to
+        finish and their verdicts are submitted; the rest is left for the next start.
+        """
+        self.drain_deadline = time.monotonic() + timeout
+        self.stopping.set()
 
-        logger.info("processing_complete", message="That's all for now.")
+    def wake(self):
+        """Cut the current rest short, so the main loop gets a turn (SIGHUP)."""
+        self.woken.set()
+
+    async def close(self):
+        await self.flux_svc.close()
+        self.ai.close()
@@ -4,14 +4,141 @@ Configuration parameters for Flux Agents
 import os
 from dotenv import load_dotenv
 
+# The environment as launched, before .env fills in the gaps. A reload (SIGHUP) re-runs this
+# module in the same namespace, so the first capture is kept and .env is read over it afresh.
+LAUNCH_ENVIRONMENT = globals().get("LAUNCH_ENVIRONMENT") or dict(os.environ)
+
 # Load environment variables from .env
 load_dotenv()
 
 WON_SERVICE_ENDPOINT = os.getenv("WON_SERVICE_ENDPOINT")
 WON_SERVICE_API_KEY = os.getenv("WON_SERVICE_API_KEY")
 OLLAMA_HOST = os.getenv("OLLAMA_HOST")
+# several Ollama hosts, comma separated, each optionally "=model"; overrides OLLAMA_HOST when set
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS", "")
+OLLAMA_HEALTH_INTERVAL = int(os.getenv("OLLAMA_HEALTH_INTERVAL", "30"))  # seconds between host probes
 LLM_MODEL = os.getenv("LLM_MODEL")
+# "generate" sends the full instructions with every post; "chat" keeps them in a fixed system message
+PROMPT_MODE = os.getenv("PROMPT_MODE", "generate").lower()
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")  # how long Ollama keeps the model loaded
+MODEL_TOUCH_INTERVAL = int(os.getenv("MODEL_TOUCH_INTERVAL", "240"))  # seconds between re-pins while resting; 0 disables
+
+# HTTP client for the WON service
+WON_HTTP_POOL_SIZE = int(os.getenv("WON_HTTP_POOL_SIZE", "10"))  # keep-alive connections
+WON_HTTP_CONNECT_TIMEOUT = float(os.getenv("WON_HTTP_CONNECT_TIMEOUT", "5"))  # seconds
+WON_HTTP_READ_TIMEOUT = float(os.getenv("WON_HTTP_READ_TIMEOUT", "30"))  # seconds
+WON_HTTP_RETRIES = int(os.getenv("WON_HTTP_RETRIES", "3"))
+WON_HTTP_BACKOFF = float(os.getenv("WON_HTTP_BACKOFF", "0.5"))  # seconds, doubled per retry
+
+# Paging through the unrated fluxes: the next page can be fetched while this one is rated
+FETCH_PAGE_SIZE = int(os.getenv("FETCH_PAGE_SIZE", "0"))  # fluxes per page; 0 leaves it to the service
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "0"))  # pages fetched ahead; 0 fetches after each page
+PREFETCH_MAX_ITEMS = int(os.getenv("PREFETCH_MAX_ITEMS", "0"))  # most fluxes buffered; 0 is depth pages' worth
+# Priority scheduling: rate buffered fluxes by urgency (reports, author history, age) instead of as listed
+PRIORITY_SCHEDULING = os.getenv("PRIORITY_SCHEDULING", "false").lower() == "true"
+# seconds of head start per priority class, as class=seconds pairs; a class left out gets none
+PRIORITY_HEAD_STARTS = {name.strip(): float(seconds)
+                        for (name, _, seconds) in (entry.partition("=") for entry in os.getenv(
+                            "PRIORITY_HEAD_STARTS", "reported=900,flagged_author=600,first_post=300").split(","))
+                        if name.strip() and seconds.strip()}
 
 POLLING_INTERVAL = int(os.getenv("POLLING_INTERVAL", "60"))  # seconds
+# adaptive polling: rest the minimum after a round with work, back off toward the ceiling when idle
+POLLING_ADAPTIVE = os.getenv("POLLING_ADAPTIVE", "true").lower() == "true"
+POLLING_MIN_INTERVAL = int(os.getenv("POLLING_MIN_INTERVAL", "5"))  # seconds
+POLLING_MAX_INTERVAL = int(os.getenv("POLLING_MAX_INTERVAL", "300"))  # seconds
+POLLING_BACKOFF = float(os.getenv("POLLING_BACKOFF", "2"))  # multiplier per idle round
 LOG_FILE = os.getenv("LOG_FILE", "./flux-moderator.log")
 PID_FILE = os.getenv("PID_FILE", "./flux-moderator.pid")
+# SIGTERM: seconds for in-flight evaluations to finish before the worker gives up on them
+# (the controller waits a little longer than this before it kills the worker)
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "8"))
+
+# Execution mode: "sync" (threads) or "async" (asyncio event loop)
+RUNTIME_MODE = os.getenv("RUNTIME_MODE", "sync").lower()
+
+# Rating pipeline: evaluate fluxes on a worker pool and submit ratings from a separate writer stage
+PIPELINE_ENABLED = os.getenv("PIPELINE_ENABLED", "false").lower() == "true"
+# (the async runtime always pipelines and uses the same limits for its in-flight calls)
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "4"))  # concurrent LLM evaluations
+RATING_WRITERS = int(os.getenv("RATING_WRITERS", "2"))  # concurrent rating submissions
+
+# Rating submission: buffer ratings and send them in batches (1 = one POST per flux)
+RATING_BATCH_SIZE = int(os.getenv("RATING_BATCH_SIZE", "1"))
+RATING_FLUSH_INTERVAL = float(os.getenv("RATING_FLUSH_INTERVAL", "5"))  # seconds
+
+# Rating cache: reuse verdicts for identical content
+RATING_CACHE_ENABLED = os.getenv("RATING_CACHE_ENABLED", "true").lower() == "true"
+RATING_CACHE_SIZE = int(os.getenv("RATING_CACHE_SIZE", "10000"))  # in-memory entries
+RATING_CACHE_TTL = int(os.getenv("RATING_CACHE_TTL", "86400"))  # seconds in memory
+RATING_CACHE_DB = os.getenv("RATING_CACHE_DB", "./rating-cache.db")  # empty for memory only
+RATING_CACHE_DB_TTL = int(os.getenv("RATING_CACHE_DB_TTL", "2592000"))  # seconds on disk
+
+# Near-duplicate index: a post close enough to one rated recently reuses its verdict
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "false").lower() == "true"
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.82"))  # SimHash similarity, 0 to 1
+NEAR_DUP_INDEX_SIZE = int(os.getenv("NEAR_DUP_INDEX_SIZE", "100000"))  # posts indexed
+NEAR_DUP_TTL = int(os.getenv("NEAR_DUP_TTL", "3600"))  # seconds a post stays indexed
+NEAR_DUP_MIN_CHARS = int(os.getenv("NEAR_DUP_MIN_CHARS", "60"))  # shorter posts are too noisy to match
+
+# Lexicon pre-classifier: "off", "shadow" (log agreement with the LLM) or "enforce" (short-circuit the LLM)
+LEXICON_MODE = os.getenv("LEXICON_MODE", "off").lower()
+LEXICON_SAFE_MAX_CHARS = int(os.getenv("LEXICON_SAFE_MAX_CHARS", "0"))  # 0 never shortcuts to "safe"
+
+# Batched prompting: rate several posts per generation (1 = one post per call)
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "1"))  # most posts packed into one prompt
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "8192"))  # context window requested for batches, in tokens
+EVAL_OUTPUT_TOKENS = int(os.getenv("EVAL_OUTPUT_TOKENS", "256"))  # expected response tokens per post
+# output budget per rating: "fast" (no thinking, short reason), "balanced" or "audit" (uncapped);
+# a post can pick its own with a "generationProfile" field
+GENERATION_PROFILE = os.getenv("GENERATION_PROFILE", "balanced")
+
+# Streaming evaluation (sync client, single posts): the rating is read as soon as it is
+# generated and the stream closes once the reason is complete, so `think` is never paid for
+STREAM_EVALUATION = os.getenv("STREAM_EVALUATION", "false").lower() == "true"
+# for the early ratings: "abort" stops generating at the rating, "background" hands the
+# rating on at once and finishes the reason on a background thread, "off" waits for it
+STREAM_EARLY_EXIT = os.getenv("STREAM_EARLY_EXIT", "background")
+STREAM_EARLY_RATINGS = [rating.strip() for rating in os.getenv(
+    "STREAM_EARLY_RATINGS", "safe,edgy").split(",") if rating.strip()]
+
+# Push ingestion: a local listener that takes new fluxes so they are rated without waiting for a poll
+INGEST_ENABLED = os.getenv("INGEST_ENABLED", "false").lower() == "true"
+INGEST_HOST = os.getenv("INGEST_HOST", "127.0.0.1")
+INGEST_PORT = int(os.getenv("INGEST_PORT", "8787"))
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")  # shared secret expected as a Bearer token
+INGEST_ALLOW_ANONYMOUS = os.getenv("INGEST_ALLOW_ANONYMOUS", "false").lower() == "true"  # listen without a token
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))  # pushed fluxes waiting to be rated
+
+# Multi-worker mode: the service controller starts AGENT_WORKERS agents that share the backlog
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+WORKER_ID = os.getenv("WORKER_ID", "0")  # set by the controller for each worker it starts
+# Flux leases keep workers from rating the same flux: "off", "local" (shared SQLite table),
+# "api" (the service's lease endpoint, falling back to local) or "auto" ("api" with several workers)
+LEASE_MODE = os.getenv("LEASE_MODE", "auto").lower()
+LEASE_DB = os.getenv("LEASE_DB", "./flux-leases.db")
+LEASE_TTL = int(os.getenv("LEASE_TTL", "600"))  # seconds a claim holds; must outlast rating one page
+
+# Rating journal: verdicts are written ahead of submission and replayed until the service stores them
+JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "true").lower() == "true"
+JOURNAL_FILE = os.getenv("JOURNAL_FILE", "./rating-journal.jsonl")  # one per worker with several workers
+JOURNAL_SYNC_DELAY = float(os.getenv("JOURNAL_SYNC_DELAY", "0.005"))  # seconds to gather writes into one fsync
+
+# Metrics: a local HTTP endpoint serving /metrics in the Prometheus text format
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # plus the worker number with several workers
+
+# Model cascade: a small, fast model rates first; boundary or unsure verdicts escalate to LLM_MODEL
+CASCADE_FAST_MODEL = os.getenv("CASCADE_FAST_MODEL", "")  # empty sends every post to LLM_MODEL
+CASCADE_ESCALATE_RATINGS = [rating.strip() for rating in os.getenv(
+    "CASCADE_ESCALATE_RATINGS", "edgy,harsh").split(",") if rating.strip()]
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.7"))  # below this, escalate
+
+# Logging: a queue hands records to a listener thread that formats and writes them
+LOG_QUEUE_ENABLED = os.getenv("LOG_QUEUE_ENABLED", "false").lower() == "true"
+LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", "0"))  # rotate past this size; 0 never
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")  # or on a schedule: "midnight", "h", "w0", ...
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))  # rotated files to keep
+# share of each high-volume event to keep, e.g. "rating_flux=0.1,storing_flux_rating=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
@@ -1,24 +1,56 @@
-from bots.flux_nanny import FluxNanny
-from time import sleep
-from config.settings import POLLING_INTERVAL
+from time import perf_counter
+launched = perf_counter()
+import config.settings  # noqa: E402 (timed on its own for the startup report)
+config_loaded = perf_counter()
+import asyncio
+import os
+import signal
+import threading
+import time
+from bots.flux_nanny import FluxNanny, AsyncFluxNanny
+from config.settings import WORKER_ID, METRICS_ENABLED, DRAIN_TIMEOUT
 from utils.logger import logger
+from utils.metrics import MetricsServer
+from utils.polling import AdaptivePoller
+from utils.reload import reload_settings
+from utils.workers import write_status
+imports_done = perf_counter()
+
+# what a SIGHUP can change without a restart; the async runtime only picks up the polling ones
+POLLING_SETTINGS = {"POLLING_INTERVAL", "POLLING_ADAPTIVE", "POLLING_MIN_INTERVAL",
+                    "POLLING_MAX_INTERVAL", "POLLING_BACKOFF"}
+HOT_SETTINGS = POLLING_SETTINGS | {"PIPELINE_ENABLED", "EVAL_WORKERS", "RATING_WRITERS", "LLM_MODEL"}
+reload_requested = threading.Event()
 
 
 def main():
     logger.info("starting_agents", message="=== STARTING AGENTS ===")
+    metrics = start_metrics_server()
     roboNanny = FluxNanny()
-    polling_rest = 60
-    if POLLING_INTERVAL:
-        polling_rest = int(POLLING_INTERVAL)
+    logger.info("startup_timing",
+                config_ms=to_ms(config_loaded - launched),
+                imports_ms=to_ms(imports_done - config_loaded),
+                **roboNanny.startup_timings,
+                total_ms=to_ms(perf_counter() - launched))
+    install_signal_handlers(roboNanny)
+    poller = AdaptivePoller()
     round = 0
-    while True:
+    while not roboNanny.stopping.is_set():
         try:
+            if reload_requested.is_set():
+                reload_requested.clear()
+                poller = apply_reload(poller, roboNanny, HOT_SETTINGS)
             round += 1
             logger.info("round_start", round=round)
-            roboNanny.do_action()
+            report_status(roboNanny, round, "rating")
+            summary = roboNanny.do_action()
             logger.info("round_end", round=round)
-            logger.info("polling_rest", seconds=polling_rest)
-            sleep(polling_rest)
+            polling_rest = poller.next_interval(summary)
+            logger.info("polling_rest", seconds=polling_rest, backlog=poller.backlog,
+                        processed=summary["processed"], has_more=summary["has_more"])
+            report_status(roboNanny, round, "resting",
+                          backlog=poller.backlog, next_round_in=polling_rest)
+            roboNanny.rest(polling_rest)
         except KeyboardInterrupt:
             logger.info("shutdown", reason="keyboard_interrupt",
                         message="I guess you have had enough. Shutting down...goodbye!")
@@ -27,7 +59,122 @@ def main():
             logger.exception("unexpected_error", error=str(
                 e), message="Well, that was unexpected. Gotta go.")
             break
+    if roboNanny.stopping.is_set():
+        logger.info("shutdown", reason="signal",
+                    message="In-flight work is drained. Shutting down...goodbye!")
+    roboNanny.close()
+    if metrics:
+        metrics.stop()
+
+
+def install_signal_handlers(roboNanny):
+    """
+    SIGTERM drains: no new work, in-flight evaluations get DRAIN_TIMEOUT seconds, and
+    pending ratings and logs are flushed on the way out. SIGHUP reloads the settings
+    before the next round.
+    """
+    def stop(signum, frame):
+        logger.info("shutdown_requested", signal=signal.Signals(signum).name,
+                    drain_timeout=DRAIN_TIMEOUT)
+        roboNanny.stop()
+
+    def reload(signum, frame):
+        logger.info("reload_requested", signal=signal.Signals(signum).name)
+        reload_requested.set()
+        roboNanny.wake()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+
+def apply_reload(poller, roboNanny, hot):
+    """Re-read the settings and hand the changed hot ones to whoever uses them."""
+    (settings, changed) = reload_settings(hot)
+    if changed & POLLING_SETTINGS:
+        poller = AdaptivePoller(settings.POLLING_INTERVAL, settings.POLLING_ADAPTIVE, settings.POLLING_MIN_INTERVAL,
+                                settings.POLLING_MAX_INTERVAL, settings.POLLING_BACKOFF)
+    if roboNanny:
+        roboNanny.reconfigure(settings, changed)
+    return poller
+
+
+def start_metrics_server():
+    if not METRICS_ENABLED:
+        return None
+    metrics = MetricsServer()
+    metrics.start()
+    return metrics
+
+
+def report_status(roboNanny, round, state, **details):
+    """Leave this worker's status where `won_agent_service.py status` can show it."""
+    try:
+        write_status(WORKER_ID, {"pid": os.getpid(), "round": round, "state": state,
+                                 "updated_at": time.time(), **details, **roboNanny.status()})
+    except OSError as e:
+        logger.warning("worker_status_failed", error=str(e))
+
 
+def to_ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+async def async_main():
+    logger.info("starting_agents", message="=== STARTING AGENTS ===", mode="async")
+    metrics = start_metrics_server()
+    roboNanny = AsyncFluxNanny()
+    await roboNanny.start()
+    install_async_signal_handlers(roboNanny)
+    poller = AdaptivePoller()
+    round = 0
+    try:
+        while not roboNanny.stopping.is_set():
+            if reload_requested.is_set():
+                reload_requested.clear()
+                poller = apply_reload(poller, None, POLLING_SETTINGS)
+            round += 1
+            logger.info("round_start", round=round)
+            summary = await roboNanny.do_action()
+            logger.info("round_end", round=round)
+            polling_rest = poller.next_interval(summary)
+            logger.info("polling_rest", seconds=polling_rest, backlog=poller.backlog,
+                        processed=summary["processed"], has_more=summary["has_more"])
+            await roboNanny.rest(polling_rest)
+        logger.info("shutdown", reason="signal",
+                    message="In-flight work is drained. Shutting down...goodbye!")
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info("shutdown", reason="keyboard_interrupt",
+                    message="I guess you have had enough. Shutting down...goodbye!")
+    except Exception as e:
+        logger.exception("unexpected_error", error=str(
+            e), message="Well, that was unexpected. Gotta go.")
+    finally:
+        await roboNanny.close()
+        if metrics:
+            metrics.stop()
+
+
+def install_async_signal_handlers(roboNanny):
+    """The same as install_signal_handlers, on the event loop."""
+    def stop(signum):
+        logger.info("shutdown_requested", signal=signal.Signals(signum).name,
+                    drain_timeout=DRAIN_TIMEOUT)
+        roboNanny.stop()
+
+    def reload(signum):
+        logger.info("reload_requested", signal=signal.Signals(signum).name)
+        reload_requested.set()
+        roboNanny.wake()
+
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop, signal.SIGTERM)
+    loop.add_signal_handler(signal.SIGHUP, reload, signal.SIGHUP)
 
 if __name__ == "__main__":
-    main()
+    if config.settings.RUNTIME_MODE == "async":
+        try:
+            asyncio.run(async_main())
+        except KeyboardInterrupt:
+            pass
+    else:
+        main()
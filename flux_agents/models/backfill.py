@@ -0,0 +1,229 @@
+"""
+Offline backfill: re-rate historical fluxes from a JSONL file (gzip JSONL if it ends in
+.gz) and write the verdicts to a JSONL file, e.g. after a change to the rating prompt or
+to LLM_MODEL. Every line of input is a flux with at least an id and its content.
+
+    python -m models.backfill fluxes.jsonl.gz ratings.jsonl
+    python -m models.backfill fluxes.jsonl.gz ratings.jsonl --resume     # after a stop
+    python -m models.backfill fluxes.jsonl ratings.jsonl --upload        # store them too
+
+Run it from the flux_agents directory. It uses the same settings as the agent: model,
+prompt, shortcuts, and EVAL_BATCH_SIZE posts per prompt. It never calls the flux service
+unless --upload is given.
+
+Verdicts are written in input order, and a checkpoint next to the output records how
+many input lines are done. --resume picks up from there. Verdicts written after the last
+checkpoint are rated again (and with --upload, stored again).
+"""
+import argparse
+import gzip
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .llm import ModeratorBotClient
+from .streaming import settled_reason
+from config.settings import EVAL_WORKERS, EVAL_BATCH_SIZE
+from utils.logger import logger
+
+PROGRESS_INTERVAL = 5  # seconds between progress lines
+CHECKPOINT_INTERVAL = 10  # seconds between checkpoints
+
+
+def open_input(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def parse(line):
+    """The flux on a line of input, or None if the line does not hold one."""
+    try:
+        flux = json.loads(line)
+    except ValueError:
+        return None
+    if isinstance(flux, dict) and "id" in flux and isinstance(flux.get("content"), str):
+        return flux
+    return None
+
+
+def rate_group(bot, fluxes):
+    """Rate a group of fluxes. Returns {flux id: (rating, reason)} with every reason settled."""
+    if not fluxes:
+        return {}
+    if len(fluxes) == 1:
+        verdicts = {fluxes[0]["id"]: bot.evaluate_post(fluxes[0])}
+    else:
+        verdicts = bot.evaluate_posts(fluxes)
+    return {key: (rating, settled_reason(reason)) for (key, (rating, reason)) in verdicts.items()}
+
+
+class Backfill:
+    """
+    Rates lines of input on a pool of `workers` threads, `batch_size` posts at a time,
+    keeping a few groups queued per worker so none waits on the reader. Finished groups
+    are written in input order, which is what lets a line offset serve as the checkpoint.
+    """
+
+    def __init__(self, bot, output, checkpoint_path, input_path, workers=EVAL_WORKERS,
+                 batch_size=EVAL_BATCH_SIZE, offset=0, writer=None):
+        self.bot = bot
+        self.output = output
+        self.checkpoint_path = checkpoint_path
+        self.input_path = input_path
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.writer = writer
+        self.offset = offset
+        self.counts = {"rated": 0, "errors": 0, "skipped": 0}
+        self.started = time.monotonic()
+        self.last_progress = self.started
+        self.last_checkpoint = self.started
+
+    def run(self, lines):
+        """Rate every line; returns False if interrupted, with the checkpoint up to date."""
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backfill")
+        in_flight = deque()
+        try:
+            while True:
+                chunk = list(itertools.islice(lines, self.batch_size))
+                if not chunk:
+                    break
+                fluxes = [flux for flux in map(parse, chunk) if flux]
+                self.counts["skipped"] += sum(1 for line in chunk if line.strip()) - len(fluxes)
+                in_flight.append((pool.submit(rate_group, self.bot, fluxes), len(chunk), fluxes))
+                while len(in_flight) >= self.workers * 2:
+                    self.write(*in_flight.popleft())
+            while in_flight:
+                self.write(*in_flight.popleft())
+            return True
+        except KeyboardInterrupt:
+            logger.info("backfill_interrupted", offset=self.offset)
+            return False
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.save_checkpoint()
+            self.progress(final=True)
+
+    def write(self, future, lines, fluxes):
+        try:
+            verdicts = future.result()
+        except Exception as e:
+            logger.exception("backfill_evaluation_failed",
+                             flux_ids=[flux["id"] for flux in fluxes], error=str(e))
+            verdicts = {}
+        for flux in fluxes:
+            (rating, reason) = verdicts.get(flux["id"], ("error", "No verdict came back."))
+            self.counts["errors" if rating == "error" else "rated"] += 1
+            self.output.write(json.dumps(
+                {"fluxId": flux["id"], "rating": rating, "reason": reason, "model": self.bot.model}) + "\n")
+            if self.writer and rating != "error":
+                self.writer.add(flux["id"], rating, reason)
+        self.offset += lines
+
+        now = time.monotonic()
+        if now - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.save_checkpoint()
+        if now - self.last_progress >= PROGRESS_INTERVAL:
+            self.progress()
+
+    def save_checkpoint(self):
+        # only what is on disk counts; write then rename, so a crash never leaves half a file
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        checkpoint = {"input": self.input_path, "offset": self.offset,
+                      "output_bytes": os.fstat(self.output.fileno()).st_size, "model": self.bot.model,
+                      "updated_at": time.time()}
+        with open(f"{self.checkpoint_path}.tmp", "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(f"{self.checkpoint_path}.tmp", self.checkpoint_path)
+        self.last_checkpoint = time.monotonic()
+
+    def progress(self, final=False):
+        elapsed = time.monotonic() - self.started
+        done = self.counts["rated"] + self.counts["errors"]
+        rate = done / elapsed if elapsed else 0.0
+        print(f"{'done' if final else 'progress'}: line {self.offset}, rated {self.counts['rated']}, "
+              f"errors {self.counts['errors']}, skipped {self.counts['skipped']}, "
+              f"{rate:.1f} fluxes/s over {elapsed:.0f}s", flush=True)
+        if final:
+            logger.info("backfill_complete", offset=self.offset, elapsed_s=round(elapsed, 2),
+                        fluxes_per_sec=round(rate, 2), **self.counts)
+        self.last_progress = time.monotonic()
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of fluxes, gzip compressed if it ends in .gz")
+    parser.add_argument("output", help="JSONL file the verdicts are written to")
+    parser.add_argument("--workers", type=int, default=max(1, EVAL_WORKERS),
+                        help="evaluations in flight (default: EVAL_WORKERS)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the checkpoint next to the output")
+    parser.add_argument("--offset", type=int,
+                        help="skip this many input lines and append to the output")
+    parser.add_argument("--upload", action="store_true",
+                        help="also store every verdict with the live flux service")
+    args = parser.parse_args(argv)
+    if args.resume and args.offset is not None:
+        parser.error("--resume and --offset do not go together")
+
+    checkpoint_path = f"{args.output}.checkpoint"
+    offset = args.offset or 0
+    if args.resume:
+        checkpoint = read_checkpoint(checkpoint_path)
+        if checkpoint is None:
+            parser.error(f"no checkpoint at {checkpoint_path}")
+        if checkpoint["input"] != args.input:
+            logger.warning("backfill_input_changed", was=checkpoint["input"], now=args.input)
+        offset = checkpoint["offset"]
+        # drop what was written after the checkpoint; it is rated again
+        with open(args.output, "a") as output:
+            output.truncate(checkpoint["output_bytes"])
+
+    bot = ModeratorBotClient()
+    if bot.warm_up() is None:
+        logger.error("ai_not_responsive", message="No response from AI agent")
+        bot.close()
+        return 1
+
+    writer = None
+    if args.upload:
+        # only here does the backfill touch the live service
+        from api.flux_svc import FluxService
+        from api.rating_writer import BufferedRatingWriter
+        writer = BufferedRatingWriter(FluxService())
+
+    logger.info("backfill_started", input=args.input, output=args.output, offset=offset,
+                workers=args.workers, batch_size=EVAL_BATCH_SIZE, model=bot.model, upload=args.upload)
+    completed = False
+    with open(args.output, "a" if args.resume or args.offset is not None else "w", encoding="utf-8") as output:
+        backfill = Backfill(bot, output, checkpoint_path, args.input, args.workers,
+                            offset=offset, writer=writer)
+        try:
+            with open_input(args.input) as lines:
+                completed = backfill.run(itertools.islice(lines, offset, None))
+        finally:
+            if writer:
+                writer.close()
+                writer.flux_svc.close()
+            bot.close()
+    if not completed:
+        print(f"interrupted; continue with --resume (from line {backfill.offset})")
+    return 0 if completed else 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,23 +10,82 @@ response_format = {
     ]
 }
 
-rating_format = {
-    "type": "object",
-    "properties": {
+def rating_item_format(think=True, reason_chars=None, think_chars=None):
+    """
+    Schema for one rating. Leaving out `think` and capping the lengths of the free-text
+    fields bounds how many tokens the model can spend on its answer.
+    """
+    properties = {
         "rating": {
             "type": "string",
             "enum": ["safe", "edgy", "harsh", "violation"]
         },
-        "reason": {
-            "type": "string"
+        "reason": text_field(reason_chars)
+    }
+    required = ["rating", "reason"]
+    if think:
+        properties["think"] = text_field(think_chars)
+        required.append("think")
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": required
+    }
+
+
+def text_field(max_chars=None):
+    field = {"type": "string"}
+    if max_chars:
+        field["maxLength"] = max_chars
+    return field
+
+
+def with_confidence(item_format):
+    """Cascade fast stage: a rating plus the model's confidence in it."""
+    return {
+        "type": "object",
+        "properties": {
+            **item_format["properties"],
+            "confidence": {
+                "type": "number",
+                "minimum": 0,
+                "maximum": 1
+            }
         },
-        "think": {
-            "type": "string"
-        }
-    },
-    "required": [
-        "rating",
-        "reason",
-        "think"
-    ]
-}
+        "required": item_format["required"] + [
+            "confidence"
+        ]
+    }
+
+
+rating_format = rating_item_format()
+
+confident_rating_format = with_confidence(rating_format)
+
+
+def rating_list_format(item_format):
+    """Schema for several ratings in one response: the item schema plus the post id, in a list."""
+    return {
+        "type": "object",
+        "properties": {
+            "ratings": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {
+                            "type": "string"
+                        },
+                        **item_format["properties"]
+                    },
+                    "required": ["id"] + item_format["required"]
+                }
+            }
+        },
+        "required": [
+            "ratings"
+        ]
+    }
+
+
+batch_rating_format = rating_list_format(rating_format)
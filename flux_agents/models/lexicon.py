@@ -0,0 +1,209 @@
+import html
+import re
+import threading
+import unicodedata
+from collections import deque
+from .prompts import harsh_words, violation_words
+from config.settings import LEXICON_MODE, LEXICON_SAFE_MAX_CHARS
+from utils.logger import logger
+
+# words that are not curse words but mean a post needs a closer look
+risk_words = [
+    "kill", "die", "dead", "murder", "shoot", "stab", "bomb", "gun", "attack", "hurt",
+    "hate", "rape", "sex", "sexy", "nude", "naked", "porn", "drug", "cocaine", "meth",
+    "suicide", "idiot", "stupid", "moron", "loser", "dumb", "suck", "dick", "piss", "crap",
+    "slut", "whore", "fag", "retard", "blow up", "blew up", "blown up", "explode", "explosive",
+    "burn down", "poison", "weapon", "knife", "strangle", "behead", "massacre", "terror",
+    "hostage", "http", "www",
+]
+
+# curse words count wherever a word starts with one ("shitstorm", "fucktard"), but not
+# inside a word ("mishit", "Scunthorpe"), so the compounds that end in one are listed
+violation_compounds = [
+    "bullshit", "horseshit", "dipshit", "batshit", "apeshit", "chickenshit", "clusterfuck",
+    "mindfuck", "dumbfuck", "motherfuck",
+]
+
+# endings that still make a risk word the same word ("killing", "bombed", "sexy")
+SUFFIXES = ("", "s", "es", "ed", "er", "ers", "ing", "in", "y", "ty")
+
+LEET = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s",
+                      "7": "t", "@": "a", "$": "s", "!": "i", "|": "i"})
+EDGE_PUNCTUATION = ".,!?;:'\"()[]{}<>"
+SPACED_LETTERS = re.compile(r"\b(?:[a-z][\s.\-_*]){2,}[a-z]\b")
+LONG_RUNS = re.compile(r"([a-z])\1{2,}")
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: finds every pattern occurrence in one pass over the text."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for (pattern, value) in patterns:
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].append((len(pattern), value))
+
+        # breadth-first pass to wire up failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for (char, child) in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                self.output[child] = self.output[child] + \
+                    self.output[self.fail[child]]
+
+    def search(self, text):
+        """Yield (start, end, value) for every match."""
+        node = 0
+        for (i, char) in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for (length, value) in self.output[node]:
+                yield (i + 1 - length, i + 1, value)
+
+
+def visible_text(content):
+    """Strip markup and entities so only what readers see is matched."""
+    return html.unescape(re.sub(r"<[^>]+>", " ", content))
+
+
+def match_forms(content):
+    """
+    Fold the post into the forms the matcher runs over: lowercase, accents removed,
+    leetspeak decoded inside words ("sh!t", "a$$"), spaced-out letters joined ("f.u.c.k").
+    Runs of a repeated letter are squeezed both to two and to one ("fuuuck", "asssss").
+    """
+    text = unicodedata.normalize("NFKD", visible_text(content))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+    tokens = []
+    for token in text.split():
+        core = token.strip(EDGE_PUNCTUATION)
+        if any(c.isalpha() for c in core):
+            token = token.replace(core, core.translate(LEET))
+        tokens.append(token)
+    text = " ".join(tokens)
+    text = SPACED_LETTERS.sub(
+        lambda m: re.sub(r"[\s.\-_*]", "", m.group(0)), text)
+    return {LONG_RUNS.sub(r"\1\1", text), LONG_RUNS.sub(r"\1", text)}
+
+
+def masked(word):
+    """Variants with one inner letter starred out ("f*ck", "sh*t")."""
+    return [word[:i] + "*" + word[i + 1:] for i in range(1, len(word) - 1)] if len(word) >= 4 else []
+
+
+class LexiconClassifier:
+    """
+    Deterministic pre-classifier that runs before the LLM. Any forbidden word from the
+    "violation" rule decides the rating on the spot; short posts without a single risk
+    signal can optionally be called "safe".
+
+    In "shadow" mode nothing is short-circuited: the lexicon verdict is compared with the
+    LLM's so the word lists and thresholds can be tuned before enforcing them.
+    """
+
+    def __init__(self, mode=LEXICON_MODE, safe_max_chars=LEXICON_SAFE_MAX_CHARS):
+        self.mode = mode
+        self.enforce = mode == "enforce"
+        self.safe_max_chars = safe_max_chars
+
+        patterns = []
+        for word in violation_words + violation_compounds:
+            patterns += [(form, ("violation", word))
+                         for form in [word] + masked(word)]
+        for word in harsh_words:
+            patterns += [(form, ("harsh", word))
+                         for form in [word] + masked(word)]
+        patterns += [(word, ("risk", word)) for word in risk_words]
+        self.matcher = AhoCorasick(patterns)
+
+        self.lock = threading.Lock()
+        self.reset_stats()
+        logger.info("lexicon_ready", mode=self.mode, patterns=len(patterns),
+                    safe_max_chars=self.safe_max_chars)
+
+    def word_starts(self, content):
+        """
+        Yield (kind, word, whole) for every lexicon word that starts a word of the
+        content; whole when it also ends there, give or take one of the SUFFIXES.
+        """
+        for text in match_forms(content):
+            for (start, end, (kind, word)) in self.matcher.search(text):
+                if start > 0 and text[start - 1].isalpha():
+                    continue
+                rest = text[end:end + 4]
+                whole = any(rest.startswith(suffix) and not rest[len(suffix):len(suffix) + 1].isalpha()
+                            for suffix in SUFFIXES)
+                yield (kind, word, whole)
+
+    def signals(self, content):
+        """
+        The (kind, word) pairs found in the content. Curse words count at any word start,
+        risk words only as whole words ("diet" is not "die").
+        """
+        return {(kind, word) for (kind, word, whole) in self.word_starts(content)
+                if whole or kind != "risk"}
+
+    def classify(self, content):
+        """Return a (rating, reason) when the lexicon can decide alone, otherwise None."""
+        found = list(self.word_starts(content))
+        signals = {(kind, word) for (kind, word, whole) in found if whole or kind != "risk"}
+        forbidden = sorted(word for (kind, word) in signals if kind == "violation")
+        if forbidden:
+            verdict = ("violation", f'Contains the forbidden word "{forbidden[0]}".')
+        # "safe" only when no lexicon word even starts a word ("murderous", "bomber")
+        elif (not found and self.safe_max_chars
+              and len(visible_text(content).strip()) <= self.safe_max_chars):
+            verdict = ("safe", "Short post with no risk signals.")
+        else:
+            return None
+
+        if self.enforce:
+            with self.lock:
+                self.short_circuits += 1
+        return verdict
+
+    def compare(self, post_id, shortcut, verdict):
+        """Shadow mode: log whether the lexicon would have agreed with the LLM."""
+        agree = shortcut[0] == verdict[0]
+        with self.lock:
+            if agree:
+                self.agreements += 1
+            else:
+                self.disagreements += 1
+        logger.info("lexicon_agreement", post_id=post_id, lexicon_rating=shortcut[0],
+                    llm_rating=verdict[0], agree=agree)
+
+    def stats(self, reset=False):
+        with self.lock:
+            counters = {
+                "mode": self.mode,
+                "short_circuits": self.short_circuits,
+                "agreements": self.agreements,
+                "disagreements": self.disagreements,
+            }
+            if reset:
+                self.reset_stats()
+            return counters
+
+    def reset_stats(self):
+        self.short_circuits = 0
+        self.agreements = 0
+        self.disagreements = 0
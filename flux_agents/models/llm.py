@@ -1,25 +1,309 @@
 import json
+import threading
+import time
 import requests
-from ollama import Client
+from concurrent.futures import Future, ThreadPoolExecutor
+from ollama import Client, AsyncClient
 from .prompts import *
 from .formats import *
 from string import Template
-from config.settings import LLM_MODEL
+from config.settings import (LLM_MODEL, RATING_CACHE_ENABLED, LEXICON_MODE, EVAL_BATCH_SIZE,
+                             LLM_NUM_CTX, PROMPT_MODE, LLM_KEEP_ALIVE, OLLAMA_HOSTS, GENERATION_PROFILE,
+                             CASCADE_FAST_MODEL, CASCADE_ESCALATE_RATINGS, CASCADE_MIN_CONFIDENCE,
+                             STREAM_EVALUATION, STREAM_EARLY_EXIT, STREAM_EARLY_RATINGS, EVAL_WORKERS,
+                             NEAR_DUP_ENABLED)
+from .profiles import profile_named
+from .streaming import StreamedFields, settled_reason
+from .rating_cache import RatingCache
+from .lexicon import LexiconClassifier
+from .near_duplicates import NearDuplicateIndex
+from .ollama_pool import OllamaPool
 from datetime import datetime
 from utils.logger import logger, log_connection_error
+from utils.metrics import registry, THROUGHPUT_BUCKETS
 
+LLM_PHASE_SECONDS = registry.histogram(
+    "flux_llm_phase_seconds", "Time Ollama reports per call: load, prompt_eval, eval and total",
+    labels=("phase", "prompt_mode", "model"))
+LLM_TOKENS = registry.counter(
+    "flux_llm_tokens_total", "Tokens processed by Ollama, prompt or eval", labels=("kind",))
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "flux_llm_tokens_per_second", "Ollama throughput per call, prompt or eval",
+    labels=("kind",), buckets=THROUGHPUT_BUCKETS)
+EVALUATE_SECONDS = registry.histogram(
+    "flux_evaluate_seconds", "Wall time of evaluate_post, by where the verdict came from",
+    labels=("source",))
+VERDICTS = registry.counter(
+    "flux_verdicts_total", "Verdicts by source (llm, cache, near_duplicate or lexicon) and rating",
+    labels=("source", "rating"))
+CASCADE_VERDICTS = registry.counter(
+    "flux_cascade_verdicts_total", "Cascade verdicts by the stage that settled them, fast or strong",
+    labels=("stage",))
+CASCADE_ESCALATIONS = registry.counter(
+    "flux_cascade_escalations_total", "Posts escalated to the strong model, by reason",
+    labels=("reason",))
+STREAM_RATING_SECONDS = registry.histogram(
+    "flux_stream_rating_seconds", "Time from a streamed request until its rating was read")
+STREAM_EXITS = registry.counter(
+    "flux_stream_exits_total", "How streamed evaluations ended: aborted, background or reason",
+    labels=("outcome",))
 
-class ModeratorBotClient:
+
+def rating_prompt(post, template=assign_rating_level):
+    """Fill the rating template with the content of the post."""
+    prompt = Template(template)
+    return prompt.substitute(content=post["content"])
+
+
+def chat_messages(post, system=rating_system_prompt):
+    """The fixed system message with the rules, then the post content on its own."""
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": post["content"]},
+    ]
+
+
+def response_text(response):
+    """The generated text of a generate or chat response."""
+    message = response.get('message')
+    if message:
+        return message['content']
+    return response['response']
+
+
+def read_field(stream, fields, name=None, **context):
+    """
+    Feed streamed chunks to `fields` until `name` is complete (without a name, to the
+    end); None if the stream ends first. Ollama's stats come with the final chunk, and
+    are logged with `context` if it is read.
+    """
+    for chunk in stream:
+        fields.feed(response_text(chunk))
+        if chunk.get('done'):
+            log_call_stats(chunk, **context)
+        if name in fields:
+            break
+    return fields.get(name)
+
+
+def parse_decision(response):
+    """Pull the (rating, reason) pair out of a structured generate or chat response."""
+    decision = json.loads(response_text(response))
+    return (decision['rating'], decision['reason'])
+
+
+def log_call_stats(response, **context):
+    """
+    Log the token counts and timings Ollama reports, so prompt-prefix reuse shows up,
+    and feed them to the metrics.
+    """
+    observe_call_stats(response)
+    logger.info("llm_call_stats", prompt_mode=PROMPT_MODE,
+                prompt_eval_count=response.get('prompt_eval_count'),
+                prompt_eval_duration_ms=nanos_to_ms(
+                    response.get('prompt_eval_duration')),
+                eval_count=response.get('eval_count'),
+                eval_duration_ms=nanos_to_ms(response.get('eval_duration')),
+                load_duration_ms=nanos_to_ms(response.get('load_duration')),
+                total_duration_ms=nanos_to_ms(response.get('total_duration')),
+                **context)
+
+
+def observe_call_stats(response):
+    for phase in ("load", "prompt_eval", "eval", "total"):
+        nanos = response.get(f"{phase}_duration")
+        if nanos is not None:
+            LLM_PHASE_SECONDS.observe(nanos / 1e9, phase=phase, prompt_mode=PROMPT_MODE,
+                                      model=response.get('model'))
+    for kind in ("prompt_eval", "eval"):
+        (tokens, nanos) = (response.get(f"{kind}_count"),
+                           response.get(f"{kind}_duration"))
+        if tokens is not None:
+            LLM_TOKENS.inc(tokens, kind=kind)
+            if nanos:
+                LLM_TOKENS_PER_SECOND.observe(tokens / (nanos / 1e9), kind=kind)
+
+
+def nanos_to_ms(nanos):
+    return round(nanos / 1e6, 2) if nanos is not None else None
+
+
+def escalation_reason(decision):
+    """Why a fast-stage verdict has to go to the strong model, or None if it can stand."""
+    if (decision.get('rating') not in rating_format["properties"]["rating"]["enum"]
+            or not isinstance(decision.get('reason'), str)):
+        return "malformed"
+    if decision['rating'] in CASCADE_ESCALATE_RATINGS:
+        return "boundary_rating"
+    confidence = decision.get('confidence')
+    if not isinstance(confidence, (int, float)) or confidence < CASCADE_MIN_CONFIDENCE:
+        return "low_confidence"
+    return None
+
+
+def batch_prompt(posts, template=assign_rating_levels):
+    """Fill the multi-post template, each post under a header carrying its id."""
+    listing = "".join(Template(rated_post).substitute(id=post["id"], content=post["content"])
+                      for post in posts)
+    return Template(template).substitute(posts=listing)
+
+
+def parse_decisions(response):
+    """
+    Pull {post id: (rating, reason)} out of a multi-post response. Entries that are
+    missing fields or carry an unknown rating are left out.
+    """
+    ratings = rating_format["properties"]["rating"]["enum"]
+    decisions = {}
+    for entry in json.loads(response['response']).get('ratings', []):
+        if (isinstance(entry, dict) and entry.get('rating') in ratings
+                and isinstance(entry.get('reason'), str) and 'id' in entry):
+            decisions[str(entry['id'])] = (entry['rating'], entry['reason'])
+    return decisions
+
+
+class RatingShortcuts:
+    """
+    The checks both client flavors run before paying for a generation: the lexicon
+    pre-classifier, the rating cache and the near-duplicate index.
+    """
+
+    def setup_shortcuts(self):
+        prompt = self.profile.prompt(
+            rating_system_prompt if PROMPT_MODE == "chat" else assign_rating_level)
+        # a cascade's verdicts depend on both of its models
+        model = f"{self.fast_model}>{self.model}" if self.fast_model else self.model
+        self.cache = RatingCache(
+            model, prompt=prompt, schema=self.profile.schema) if RATING_CACHE_ENABLED else None
+        self.lexicon = LexiconClassifier() if LEXICON_MODE != "off" else None
+        # near-duplicates must carry the same lexicon signals, whether or not the lexicon rates
+        self.near_duplicates = NearDuplicateIndex(
+            (self.lexicon or LexiconClassifier(mode="off")).signals) if NEAR_DUP_ENABLED else None
+
+    def profile_for(self, post):
+        """The generation profile a post asked for, or the deployment's."""
+        return profile_named(post.get("generationProfile"), self.profile)
+
+    def lookup(self, post):
+        """
+        Returns (shortcut, verdict). A verdict means the AI does not need to be asked;
+        the shortcut is the lexicon's opinion, kept for comparison in shadow mode.
+        """
+        # forbidden words decide the rating without asking the AI
+        shortcut = self.lexicon.classify(
+            post["content"]) if self.lexicon else None
+        if shortcut and self.lexicon.enforce:
+            VERDICTS.inc(source="lexicon", rating=shortcut[0])
+            return (shortcut, shortcut)
+
+        # identical content gets the same verdict; no need to ask again. The stores hold
+        # verdicts of the deployment's profile only, so posts asking for another get a fresh one
+        if self.profile_for(post) is not self.profile:
+            return (shortcut, None)
+        verdict = self.cache.get(post["content"]) if self.cache else None
+        source = "cache"
+        if not verdict and self.near_duplicates:
+            # and a small variation of a recent post (a spam wave) gets that post's verdict
+            verdict = self.near_duplicates.find(post["content"])
+            source = "near_duplicate"
+        if verdict:
+            VERDICTS.inc(source=source, rating=verdict[0])
+            if shortcut:
+                self.lexicon.compare(
+                    post.get("id", "unknown"), shortcut, verdict)
+        return (shortcut, verdict)
+
+    def settle(self, post, shortcut, verdict):
+        """Remember a fresh verdict from the AI and hand it back."""
+        VERDICTS.inc(source="llm", rating=verdict[0])
+        if verdict[0] != "error":
+            if self.profile_for(post) is self.profile:
+                self.remember(post["content"], *verdict)
+            if shortcut:
+                self.lexicon.compare(
+                    post.get("id", "unknown"), shortcut, verdict)
+        return verdict
+
+    def remember(self, content, rating, reason):
+        """Store a verdict; one whose reason is still being generated is stored once it is done."""
+        if isinstance(reason, Future):
+            reason.add_done_callback(
+                lambda done: self.remember(content, rating, done.result()))
+            return
+        if self.cache:
+            self.cache.put(content, rating, reason)
+        if self.near_duplicates:
+            self.near_duplicates.put(content, rating, reason)
+
+    def log_stats(self):
+        """Log (and reset) the per-round counters of the shortcuts in front of the LLM."""
+        if self.cache:
+            logger.info("rating_cache_stats", **self.cache.stats(reset=True))
+        if self.near_duplicates:
+            logger.info("near_duplicate_stats", **self.near_duplicates.stats(reset=True))
+        if self.lexicon:
+            logger.info("lexicon_stats", **self.lexicon.stats(reset=True))
+        if self.pool:
+            logger.info("ollama_pool_status", endpoints=self.pool.status())
+        if self.fast_model:
+            logger.info("cascade_stats", **self.cascade_stats(reset=True))
+
+    def close(self):
+        if self.reason_pool:
+            # reasons still being generated land in the cache before it closes
+            self.reason_pool.shutdown(wait=True)
+        if self.cache:
+            self.cache.close()
+        if self.pool:
+            self.pool.close()
+
+
+class ModeratorBotClient(RatingShortcuts):
 
     def __init__(
         self,
     ):
-        self.client = Client()
         self.model = LLM_MODEL or "gemma3:latest"  # include a default
         # might be better to raise an exception if no model specified;
         # then again, we have ping to make sure the model loads and runs
 
+        # several Ollama hosts share the load through a pool that acts like a Client
+        self.pool = None
+        if OLLAMA_HOSTS:
+            self.pool = OllamaPool.from_settings(self.model, self.check_model)
+            self.pool.start()
+        self.client = self.pool or Client()
+
         logger.info("model_requested", model=self.model)
+        self.load_duration_ms = None
+        self.profile = profile_named(GENERATION_PROFILE)
+        logger.info("generation_profile", profile=self.profile.name)
+
+        # streaming: reasons that finish after their rating was handed on are read here
+        self.reason_pool = None
+        self.stream_early_exit = STREAM_EARLY_EXIT
+        if STREAM_EVALUATION:
+            self.reason_pool = ThreadPoolExecutor(
+                max_workers=max(1, EVAL_WORKERS), thread_name_prefix="reason")
+            logger.info("stream_evaluation_enabled", early_exit=STREAM_EARLY_EXIT,
+                        early_ratings=STREAM_EARLY_RATINGS)
+
+        # cascade: the fast model rates first and only hard cases reach self.model
+        self.fast_model = CASCADE_FAST_MODEL or None
+        self.cascade_lock = threading.Lock()
+        self.reset_cascade_stats()
+        if self.fast_model:
+            logger.info("cascade_enabled", fast_model=self.fast_model, strong_model=self.model,
+                        escalate_ratings=CASCADE_ESCALATE_RATINGS,
+                        min_confidence=CASCADE_MIN_CONFIDENCE)
+        self.setup_shortcuts()
+
+        # batched prompting adapts to what fits: the context window is read from the model,
+        # the characters-per-token estimate is calibrated from real prompt token counts, and
+        # the batch limit shrinks when answers come back incomplete
+        self.num_ctx = None
+        self.chars_per_token = 3.0
+        self.batch_limit = max(1, EVAL_BATCH_SIZE)
 
     def ping_ai(self):
         """
@@ -28,10 +312,12 @@ class ModeratorBotClient:
         logger.info(
             "pinging_ai", message="Let's make sure we can reach our AI agent.")
         try:
-            response = self.client.generate(model=self.model)
+            response = self.check_model(self.client, self.model)
             time_of_response = datetime.fromisoformat(
                 response['created_at']).strftime("%Y-%m-%d %H:%M:%S")
-            logger.info("ai_responded", timestamp=time_of_response)
+            self.load_duration_ms = nanos_to_ms(response.get('load_duration'))
+            logger.info("ai_responded", timestamp=time_of_response,
+                        load_duration_ms=self.load_duration_ms)
             return True
         except requests.exceptions.ConnectionError as e:
             log_connection_error(logger, "ai_connection_error",
@@ -42,6 +328,97 @@ class ModeratorBotClient:
             logger.error("ai_not_responsive", error=str(e), error_type="other")
             return False
 
+    def check_model(self, client, model):
+        """
+        The liveness check behind ping_ai and the pool's health probes. An empty prompt
+        just loads the model; keep_alive pins it once loaded.
+        """
+        return client.generate(model=model, keep_alive=LLM_KEEP_ALIVE)
+
+    def warm_up(self):
+        """
+        Get the model loaded and pinned before real work arrives, and time a first token
+        so the cost of the first evaluation is known up front. Returns the timings in
+        milliseconds, or None if the AI is not responding.
+        """
+        if self.pool:
+            # load the model on every host, not just the one ping_ai lands on
+            self.pool.probe_all()
+        if not self.ping_ai():
+            return None
+        timings = {"model_load_ms": self.load_duration_ms}
+        if self.fast_model:
+            try:
+                response = self.check_model(self.client, self.fast_model)
+                timings["fast_model_load_ms"] = nanos_to_ms(
+                    response.get('load_duration'))
+            except Exception as e:
+                # the cascade escalates everything until the fast model answers
+                logger.warning("fast_model_not_ready",
+                               model=self.fast_model, error=str(e))
+        started = time.perf_counter()
+        try:
+            stream = self.client.generate(
+                model=self.model, prompt="Reply with OK.", stream=True,
+                options={"temperature": 0, "num_predict": 1}, keep_alive=LLM_KEEP_ALIVE)
+            try:
+                next(stream, None)
+                timings["first_token_ms"] = round(
+                    (time.perf_counter() - started) * 1000, 2)
+            finally:
+                stream.close()
+        except Exception as e:
+            logger.warning("first_token_probe_failed",
+                           model=self.model, error=str(e))
+        logger.info("model_warmed_up", model=self.model,
+                    keep_alive=LLM_KEEP_ALIVE, **timings)
+        return timings
+
+    def touch(self):
+        """
+        Re-pin the model between rounds so Ollama does not evict it while we rest.
+        Logs a warning if it had been evicted anyway and had to load again.
+        """
+        for model in filter(None, (self.model, self.fast_model)):
+            try:
+                response = self.client.generate(
+                    model=model, keep_alive=LLM_KEEP_ALIVE)
+                load_ms = nanos_to_ms(response.get('load_duration'))
+                # an already-resident model reports a negligible load
+                if load_ms and load_ms > 1000:
+                    logger.warning("model_reloaded", model=model,
+                                   load_duration_ms=load_ms)
+            except Exception as e:
+                logger.warning("model_touch_failed",
+                               model=model, error=str(e))
+
+    def switch_model(self, model):
+        """
+        Rate with another model from now on (a settings reload). The new model is loaded
+        and pinned first, and if it does not answer the current one stays. The rating
+        cache and near-duplicate index start over, since they hold the old model's verdicts.
+        Returns whether the switch happened.
+        """
+        if model == self.model:
+            return True
+        previous = self.model
+        self.model = model
+        if self.pool:
+            self.pool.model = model
+        if self.warm_up() is None:
+            logger.error("model_switch_failed", model=model, keeping=previous)
+            self.model = previous
+            if self.pool:
+                self.pool.model = previous
+            return False
+
+        if self.cache:
+            self.cache.close()
+        self.setup_shortcuts()
+        self.num_ctx = None
+        logger.info("model_switched", model=model, previous=previous)
+        return True
+
     def prepare_to_classify(self):
         """
         Give instructions to AI about how to classify the language used in social media posts.
@@ -67,19 +444,157 @@ class ModeratorBotClient:
         """
         Review the post, assign a rating and provide a (short?) reason.
         """
-        # set up prompt
-        content = post["content"]
-        prompt = Template(assign_rating_level)
-        full_prompt = prompt.substitute(content=content)
+        started = time.perf_counter()
+        (shortcut, verdict) = self.lookup(post)
+        if verdict:
+            EVALUATE_SECONDS.observe(
+                time.perf_counter() - started, source="shortcut")
+            return verdict
+        verdict = self.settle(post, shortcut, self.ask_ai(post))
+        EVALUATE_SECONDS.observe(time.perf_counter() - started, source="llm")
+        return verdict
+
+    def evaluate_posts(self, posts):
+        """
+        Review several posts, packing the ones that need the AI into shared prompts so the
+        instructions are only sent once per batch. Returns {post id: (rating, reason)}.
+        Posts that come back missing or malformed are asked about one at a time.
+        """
+        verdicts = {}
+        shortcuts = {}
+        pending = []
+        for post in posts:
+            (shortcut, verdict) = self.lookup(post)
+            if verdict:
+                verdicts[post["id"]] = verdict
+            else:
+                shortcuts[post["id"]] = shortcut
+                pending.append(post)
+
+        # batches are generated under the deployment's profile; posts asking for another go alone
+        singles = [post for post in pending if self.profile_for(post) is not self.profile]
+        for post in singles:
+            verdicts[post["id"]] = self.settle(
+                post, shortcuts[post["id"]], self.ask_ai(post))
+        pending = [post for post in pending if post not in singles]
+
+        for group in self.plan_batches(pending):
+            answers = self.ask_ai_batch(group) if len(group) > 1 else {}
+            for post in group:
+                verdict = answers.get(str(post["id"]))
+                if not verdict:
+                    if len(group) > 1:
+                        logger.info("batch_item_retry", post_id=post["id"])
+                    verdict = self.ask_ai(post)
+                verdicts[post["id"]] = self.settle(
+                    post, shortcuts[post["id"]], verdict)
+        return verdicts
+
+    def plan_batches(self, posts):
+        """Greedily pack posts into groups whose prompt and answers fit the context window."""
+        budget = int(self.context_window() * 0.9) - \
+            self.estimate_tokens(assign_rating_levels)
+        groups = []
+        group = []
+        used = 0
+        for post in posts:
+            cost = self.estimate_tokens(
+                post["content"]) + self.profile.output_tokens
+            if group and (len(group) >= self.batch_limit or used + cost > budget):
+                groups.append(group)
+                group = []
+                used = 0
+            group.append(post)
+            used += cost
+        if group:
+            groups.append(group)
+        return groups
 
+    def ask_ai_batch(self, posts):
+        """
+        Have the model rate several posts in one generation. Returns whatever usable
+        ratings came back, keyed by post id as a string.
+        """
+        full_prompt = batch_prompt(
+            posts, self.profile.prompt(assign_rating_levels))
         try:
-            # make the call to AI
             response = self.client.generate(
-                model=self.model, prompt=full_prompt, stream=False, format=rating_format, options={"temperature": 0})
+                model=self.model, prompt=full_prompt, stream=False, format=self.profile.batch_schema,
+                options=self.profile.options(len(posts), self.context_window()), keep_alive=LLM_KEEP_ALIVE)
+            log_call_stats(response, batch_size=len(posts),
+                           profile=self.profile.name)
+            self.calibrate(full_prompt, response)
+            truncated = response.get('done_reason') == "length"
+            answers = parse_decisions(response)
+        except requests.exceptions.ConnectionError as e:
+            log_connection_error(logger, "evaluate_posts_connection_error",
+                                 model=self.model, count=len(posts),
+                                 message="Connection error while evaluating posts")
+            return {}
+        except Exception as e:
+            # usually JSON cut off mid-answer
+            logger.warning("evaluate_posts_error", model=self.model,
+                           count=len(posts), error=str(e))
+            truncated = True
+            answers = {}
+
+        if truncated:
+            # ran out of room; try smaller batches from here on
+            self.batch_limit = max(2, len(posts) // 2)
+            logger.info("batch_limit_lowered", batch_limit=self.batch_limit,
+                        answered=len(answers), asked=len(posts))
+        elif self.batch_limit < EVAL_BATCH_SIZE:
+            self.batch_limit += 1
+        return answers
+
+    def context_window(self):
+        """Tokens of context to use for batches: the configured size, capped by the model's own."""
+        if self.num_ctx is None:
+            self.num_ctx = LLM_NUM_CTX
+            try:
+                info = self.client.show(self.model).modelinfo or {}
+                limit = next((value for (key, value) in info.items()
+                              if key.endswith(".context_length")), None)
+                if limit:
+                    self.num_ctx = min(LLM_NUM_CTX, int(limit))
+            except Exception as e:
+                logger.warning("model_info_unavailable",
+                               model=self.model, error=str(e))
+            logger.info("batch_context_window",
+                        model=self.model, num_ctx=self.num_ctx)
+        return self.num_ctx
+
+    def estimate_tokens(self, text):
+        return int(len(text) / self.chars_per_token) + 1
+
+    def calibrate(self, prompt, response):
+        """Nudge the characters-per-token estimate toward what the model actually counted."""
+        count = response.get('prompt_eval_count')
+        if count:
+            observed = min(6.0, max(1.5, len(prompt) / count))
+            self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * observed
+
+    def ask_ai(self, post):
+        """
+        Have the model rate the post. Failures come back as an "error" rating.
+        With a cascade, the fast model is asked first.
+        """
+        profile = self.profile_for(post)
+        if self.fast_model:
+            verdict = self.ask_fast_model(post, profile)
+            if verdict:
+                return verdict
+        try:
+            if STREAM_EVALUATION:
+                return self.stream_rating(post, profile)
+
+            # make the call to AI
+            response = self.request_rating(post, self.model, profile)
+            log_call_stats(response, post_id=post.get("id", "unknown"),
+                           profile=profile.name)
 
             # process response
-            decision = json.loads(response['response'])
-            return (decision['rating'], decision['reason'])
+            return parse_decision(response)
         except requests.exceptions.ConnectionError as e:
             log_connection_error(logger, "evaluate_post_connection_error",
                                  model=self.model, post_id=post.get(
@@ -94,6 +609,222 @@ class ModeratorBotClient:
             # Return a default rating for other errors
             return ("error", f"Error evaluating post: {str(e)}")
 
+    def request_rating(self, post, model, profile, confidence=False, stream=False):
+        """
+        One rating call in the configured prompt mode, within the profile's output budget;
+        `confidence` also asks how sure the model is.
+        """
+        schema = profile.confident_schema if confidence else profile.schema
+        if PROMPT_MODE == "chat":
+            system = confident_system_prompt if confidence else rating_system_prompt
+            return self.client.chat(
+                model=model, messages=chat_messages(post, profile.prompt(system)), stream=stream,
+                format=schema, options=profile.options(), keep_alive=LLM_KEEP_ALIVE)
+        template = confident_rating_level if confidence else assign_rating_level
+        return self.client.generate(
+            model=model, prompt=rating_prompt(post, profile.prompt(template)), stream=stream,
+            format=schema, options=profile.options(), keep_alive=LLM_KEEP_ALIVE)
+
+    def stream_rating(self, post, profile):
+        """
+        Rate the post from a streamed answer, reading no further than needed. The rating
+        comes first in the schema, so it is known a few tokens in. For STREAM_EARLY_RATINGS,
+        "abort" stops the generation right there and "background" hands the rating back at
+        once, with a future for the reason that a background thread finishes reading.
+        Otherwise the stream is read until the reason is complete, and closed before `think`.
+        """
+        post_id = post.get("id", "unknown")
+        started = time.perf_counter()
+        stream = self.request_rating(post, self.model, profile, stream=True)
+        fields = StreamedFields()
+        context = {"post_id": post_id, "profile": profile.name, "streamed": True}
+        # with nothing after the reason, the few chunks left are read for their stats
+        to_end = list(profile.schema["properties"])[-1] == "reason"
+        handed_off = False
+        try:
+            rating = read_field(stream, fields, "rating", **context)
+            if rating not in rating_format["properties"]["rating"]["enum"]:
+                raise ValueError(f"Streamed answer carried no usable rating: {rating!r}")
+            STREAM_RATING_SECONDS.observe(time.perf_counter() - started)
+            logger.info("streamed_rating", post_id=post_id, rating=rating,
+                        rating_ms=round((time.perf_counter() - started) * 1000, 2))
+
+            if rating in STREAM_EARLY_RATINGS and self.stream_early_exit == "abort":
+                STREAM_EXITS.inc(outcome="aborted")
+                return (rating, f"Rated {rating}; generation stopped before the explanation.")
+            if rating in STREAM_EARLY_RATINGS and self.stream_early_exit == "background":
+                STREAM_EXITS.inc(outcome="background")
+                handed_off = True
+                return (rating, self.reason_pool.submit(
+                    self.finish_reason, stream, fields, rating, started, to_end, context))
+
+            STREAM_EXITS.inc(outcome="reason")
+            reason = read_field(stream, fields, "reason", **context)
+            if to_end:
+                read_field(stream, fields, **context)
+            return (rating, reason or "")
+        finally:
+            if not handed_off:
+                # closing the stream makes Ollama stop generating
+                stream.close()
+
+    def finish_reason(self, stream, fields, rating, started, to_end, context):
+        """Background half of a streamed evaluation: read on until the reason is complete."""
+        post_id = context["post_id"]
+        reason = None
+        try:
+            reason = read_field(stream, fields, "reason", **context)
+            if to_end:
+                read_field(stream, fields, **context)
+        except Exception as e:
+            logger.warning("streamed_reason_failed",
+                           post_id=post_id, error=str(e))
+        finally:
+            stream.close()
+        logger.info("streamed_reason", post_id=post_id, rating=rating,
+                    reason_ms=round((time.perf_counter() - started) * 1000, 2))
+        if reason is None:
+            return f"Rated {rating}; the explanation did not finish."
+        return reason
+
+    def ask_fast_model(self, post, profile):
+        """
+        First stage of the cascade. Returns the fast model's verdict when it can stand,
+        or None when the post has to go to the strong model.
+        """
+        post_id = post.get("id", "unknown")
+        decision = {}
+        try:
+            response = self.request_rating(
+                post, self.fast_model, profile, confidence=True)
+            log_call_stats(response, post_id=post_id, stage="fast",
+                           profile=profile.name)
+            decision = json.loads(response_text(response))
+            reason = escalation_reason(decision)
+        except Exception as e:
+            logger.warning("cascade_fast_model_failed", post_id=post_id,
+                           model=self.fast_model, error=str(e))
+            reason = "fast_model_failed"
+
+        with self.cascade_lock:
+            if reason is None:
+                self.settled_fast += 1
+            else:
+                self.escalated[reason] = self.escalated.get(reason, 0) + 1
+        if reason is None:
+            CASCADE_VERDICTS.inc(stage="fast")
+            return (decision['rating'], decision['reason'])
+
+        CASCADE_VERDICTS.inc(stage="strong")
+        CASCADE_ESCALATIONS.inc(reason=reason)
+        logger.info("cascade_escalated", post_id=post_id, fast_rating=decision.get('rating'),
+                    confidence=decision.get('confidence'), reason=reason)
+        return None
+
+    def cascade_stats(self, reset=False):
+        with self.cascade_lock:
+            escalated = sum(self.escalated.values())
+            total = self.settled_fast + escalated
+            counters = {
+                "settled_fast": self.settled_fast,
+                "escalated": escalated,
+                "escalation_rate": round(escalated / total, 3) if total else None,
+                "escalation_reasons": dict(self.escalated),
+            }
+            if reset:
+                self.reset_cascade_stats()
+            return counters
+
+    def reset_cascade_stats(self):
+        self.settled_fast = 0
+        self.escalated = {}
+
+
+class AsyncModeratorBotClient(RatingShortcuts):
+    """
+    Asyncio flavor of ModeratorBotClient, built on ollama.AsyncClient. Many evaluations
+    can be in flight at once without a thread per call.
+    """
+
+    def __init__(
+        self,
+    ):
+        self.client = AsyncClient()
+        self.pool = None  # multi-host routing is only available to the sync client
+        self.fast_model = None  # and so is the model cascade
+        self.reason_pool = None  # and streaming evaluation
+        self.model = LLM_MODEL or "gemma3:latest"  # include a default
+        logger.info("model_requested", model=self.model, mode="async")
+        self.profile = profile_named(GENERATION_PROFILE)
+        logger.info("generation_profile", profile=self.profile.name)
+        self.setup_shortcuts()
+
+    async def ping_ai(self):
+        """
+        See if the AI is listening. Find out how it's doing.
+        """
+        logger.info(
+            "pinging_ai", message="Let's make sure we can reach our AI agent.")
+        try:
+            response = await self.client.generate(
+                model=self.model, keep_alive=LLM_KEEP_ALIVE)
+            time_of_response = datetime.fromisoformat(
+                response['created_at']).strftime("%Y-%m-%d %H:%M:%S")
+            logger.info("ai_responded", timestamp=time_of_response)
+            return True
+        except ConnectionError as e:
+            log_connection_error(logger, "ai_connection_error",
+                                 model=self.model,
+                                 message="Connection error while pinging AI")
+            return False
+        except Exception as e:
+            logger.error("ai_not_responsive", error=str(e), error_type="other")
+            return False
+
+    async def evaluate_post(self, post):
+        """
+        Review the post, assign a rating and provide a (short?) reason.
+        """
+        started = time.perf_counter()
+        (shortcut, verdict) = self.lookup(post)
+        if verdict:
+            EVALUATE_SECONDS.observe(
+                time.perf_counter() - started, source="shortcut")
+            return verdict
+        verdict = self.settle(post, shortcut, await self.ask_ai(post))
+        EVALUATE_SECONDS.observe(time.perf_counter() - started, source="llm")
+        return verdict
+
+    async def ask_ai(self, post):
+        """
+        Have the model rate the post. Failures come back as an "error" rating.
+        """
+        profile = self.profile_for(post)
+        try:
+            if PROMPT_MODE == "chat":
+                response = await self.client.chat(
+                    model=self.model, messages=chat_messages(post, profile.prompt(rating_system_prompt)),
+                    stream=False, format=profile.schema, options=profile.options(), keep_alive=LLM_KEEP_ALIVE)
+            else:
+                full_prompt = rating_prompt(post, profile.prompt(assign_rating_level))
+                response = await self.client.generate(
+                    model=self.model, prompt=full_prompt, stream=False, format=profile.schema,
+                    options=profile.options(), keep_alive=LLM_KEEP_ALIVE)
+            log_call_stats(response, post_id=post.get("id", "unknown"),
+                           profile=profile.name)
+            return parse_decision(response)
+        except ConnectionError as e:
+            log_connection_error(logger, "evaluate_post_connection_error",
+                                 model=self.model, post_id=post.get(
+                                     "id", "unknown"),
+                                 message="Connection error while evaluating post")
+            return ("error", "Connection error while evaluating post")
+        except Exception as e:
+            logger.exception("evaluate_post_error",
+                             post_id=post.get("id", "unknown"),
+                             error=str(e))
+            return ("error", f"Error evaluating post: {str(e)}")
+
 
 sample_posts = [
     {"id": 2,
@@ -126,7 +857,7 @@ def main():
     for post in sample_posts:
         answer = bot.evaluate_post(post)
         logger.info("post_evaluated",
-                    post_id=post["id"], rating=answer[0], reason=answer[1])
+                    post_id=post["id"], rating=answer[0], reason=settled_reason(answer[1]))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+import hashlib
+import re
+import threading
+from functools import lru_cache
+from itertools import combinations
+import time
+import unicodedata
+from collections import OrderedDict
+from .lexicon import visible_text
+from config.settings import (NEAR_DUP_THRESHOLD, NEAR_DUP_INDEX_SIZE, NEAR_DUP_TTL,
+                             NEAR_DUP_MIN_CHARS)
+from utils.logger import logger
+
+FINGERPRINT_BITS = 64
+BANDS = 4
+BAND_BITS = FINGERPRINT_BITS // BANDS
+# spreads the bits of a word hash into byte-wide lanes: "0"/"1" characters to 0/1 bytes
+BIT_LANES = bytes.maketrans(b"01", b"\x00\x01")
+URLS = re.compile(r"(?:https?://|www\.)\S+")
+
+
+def shingle_text(content):
+    """
+    What readers see, casefolded, with punctuation and runs of whitespace folded away.
+    Links read as "url" and words with a digit in them as "0", since spam copies mostly
+    differ in links, codes and amounts.
+    """
+    text = URLS.sub(" url ", unicodedata.normalize("NFKC", visible_text(content)).casefold())
+    return " ".join("0" if any(c.isdigit() for c in word) else word for word in re.findall(r"\w+", text))
+
+
+def text_digest(text):
+    return hashlib.blake2b(text.encode(), digest_size=8).digest()
+
+
+@lru_cache(maxsize=65536)
+def lanes(word):
+    # a stable hash, so every worker and every restart fingerprints a post the same way
+    bits = format(int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big"), "064b")
+    return int.from_bytes(bits.encode("ascii").translate(BIT_LANES), "big")
+
+
+def simhash(text):
+    """
+    64-bit SimHash over the distinct words: each bit is set when most word hashes set it,
+    so changing a word or two flips only a few bits.
+    """
+    words = list(set(text.split()))
+    # with every bit in its own byte lane, one sum counts the votes for all 64 bits;
+    # a lane holds at most 255, so long posts are summed in chunks
+    votes = [0] * FINGERPRINT_BITS
+    for start in range(0, len(words), 255):
+        total = sum(map(lanes, words[start:start + 255]))
+        votes = [vote + count for (vote, count)
+                 in zip(votes, total.to_bytes(FINGERPRINT_BITS, "big"))]
+    half = len(words) / 2
+    return int("".join("1" if vote > half else "0" for vote in votes), 2)
+
+
+class NearDuplicateIndex:
+    """
+    SimHash index of recently rated posts, so that variations of one message (spam waves,
+    brigading) reuse the first verdict instead of each costing an LLM call.
+
+    A post matches when its fingerprint differs in at most `max_distance` bits. The
+    fingerprint is split into four 16-bit bands, and a match differs in at most
+    max_distance // 4 bits in at least one of them. So a lookup lists the few posts whose
+    band equals one of the query's bands with up to that many bits flipped, and compares
+    only those.
+    A match must also carry the same lexicon signals (curse words, risk words), so a
+    variant that adds a slur never inherits a "safe". And since the fingerprint ignores
+    word order and a single word can turn a post around ("never"), a "safe" is only
+    handed to posts that differ from the rated one in nothing but links, codes and numbers.
+
+    Bounded by size, oldest first; entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, signals=None, threshold=NEAR_DUP_THRESHOLD, size=NEAR_DUP_INDEX_SIZE,
+                 ttl=NEAR_DUP_TTL, min_chars=NEAR_DUP_MIN_CHARS):
+        self.signals = signals
+        self.max_distance = max(0, int(FINGERPRINT_BITS * (1 - threshold)))
+        self.size = size
+        self.ttl = ttl
+        self.min_chars = min_chars
+
+        # every band value within max_distance // BANDS flipped bits of the query's
+        self.flips = [sum(1 << bit for bit in bits)
+                      for flipped in range(self.max_distance // BANDS + 1)
+                      for bits in combinations(range(BAND_BITS), flipped)]
+        self.tables = [{} for _ in range(BANDS)]
+        # fingerprint -> (expires_at, signals, text digest, (rating, reason)), oldest first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.reset_stats()
+        logger.info("near_duplicate_index_ready", threshold=threshold, max_distance=self.max_distance,
+                    size=size, ttl=ttl, min_chars=min_chars)
+
+    def band_keys(self, fingerprint):
+        return [(fingerprint >> (band * BAND_BITS)) & ((1 << BAND_BITS) - 1) for band in range(BANDS)]
+
+    def fingerprint(self, content):
+        """SimHash of content long enough to match, otherwise None."""
+        return self.fingerprint_of(shingle_text(content))
+
+    def fingerprint_of(self, text):
+        return simhash(text) if len(text) >= self.min_chars else None
+
+    def signals_of(self, content):
+        return frozenset(self.signals(content)) if self.signals else frozenset()
+
+    def find(self, content):
+        """
+        The verdict of the nearest recent post within the threshold, its reason marked as
+        reused, or None.
+        """
+        text = shingle_text(content)
+        fingerprint = self.fingerprint_of(text)
+        if fingerprint is None:
+            with self.lock:
+                self.skipped += 1
+            return None
+        digest = text_digest(text)
+        now = time.time()
+        with self.lock:
+            near = set()
+            for (table, key) in zip(self.tables, self.band_keys(fingerprint)):
+                for flip in self.flips:
+                    near.update(table.get(key ^ flip, ()))
+            candidates = []
+            for candidate in near:
+                distance = (candidate ^ fingerprint).bit_count()
+                if distance <= self.max_distance and self.entries[candidate][0] > now:
+                    candidates.append((distance, self.entries[candidate]))
+        # the lexicon pass is only paid for when something is close
+        best = None
+        if candidates:
+            signals = self.signals_of(content)
+            best = min(((distance, verdict)
+                        for (distance, (_, candidate_signals, candidate_digest, verdict)) in candidates
+                        if candidate_signals == signals
+                        and (verdict[0] != "safe" or candidate_digest == digest)),
+                       default=None, key=lambda match: match[0])
+        with self.lock:
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        (distance, (rating, reason)) = best
+        similarity = round(1 - distance / FINGERPRINT_BITS, 3)
+        logger.info("near_duplicate_reused", rating=rating,
+                    similarity=similarity, distance=distance)
+        return (rating, f"{reason} [Reused from a near-duplicate post, similarity {similarity}.]")
+
+    def put(self, content, rating, reason):
+        text = shingle_text(content)
+        fingerprint = self.fingerprint_of(text)
+        if fingerprint is None:
+            return
+        signals = self.signals_of(content)
+        now = time.time()
+        with self.lock:
+            if fingerprint in self.entries:
+                self.entries.move_to_end(fingerprint)
+            else:
+                for (table, key) in zip(self.tables, self.band_keys(fingerprint)):
+                    table.setdefault(key, set()).add(fingerprint)
+            self.entries[fingerprint] = (now + self.ttl, signals, text_digest(text), (rating, reason))
+
+            # every entry lives for the same ttl, so the expired ones are at the front
+            while self.entries and (len(self.entries) > self.size
+                                    or next(iter(self.entries.values()))[0] <= now):
+                self.forget(next(iter(self.entries)))
+
+    def forget(self, fingerprint):
+        # caller holds the lock
+        del self.entries[fingerprint]
+        for (table, key) in zip(self.tables, self.band_keys(fingerprint)):
+            bucket = table[key]
+            bucket.discard(fingerprint)
+            if not bucket:
+                del table[key]
+
+    def stats(self, reset=False):
+        """Hit/miss counters since the last reset."""
+        with self.lock:
+            counters = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "too_short": self.skipped,
+                "entries": len(self.entries),
+            }
+            if reset:
+                self.reset_stats()
+            return counters
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
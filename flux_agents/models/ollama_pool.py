@@ -0,0 +1,210 @@
+import threading
+import time
+import httpx
+from ollama import Client, ResponseError
+from config.settings import OLLAMA_HOSTS, OLLAMA_HEALTH_INTERVAL
+from utils.logger import logger
+
+
+def parse_hosts(spec):
+    """
+    Turn "http://a:11434,http://b:11434=llama3:8b" into [(host, model)]. A host without
+    "=model" serves the configured LLM_MODEL, and one with it serves only that model.
+    """
+    endpoints = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if entry:
+            (host, _, model) = entry.partition("=")
+            endpoints.append((host.strip(), model.strip() or None))
+    return endpoints
+
+
+def is_endpoint_failure(error):
+    """Errors that say the host is in trouble, as opposed to a bad request."""
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+
+class OllamaEndpoint:
+
+    def __init__(self, host, model):
+        self.host = host
+        self.model = model
+        self.client = Client(host=host)
+        self.outstanding = 0
+        self.latency = None  # smoothed seconds per non-streamed call
+        self.healthy = True
+
+
+class PooledStream:
+    """
+    A streamed answer from one endpoint, which stays busy until the stream is read to the
+    end, closed or dropped. Starts with the `first` chunk, already read by the pool.
+    """
+
+    def __init__(self, pool, endpoint, stream, first):
+        self.pool = pool
+        self.endpoint = endpoint
+        self.stream = stream
+        self.released = False
+        self.pending = [] if first is None else [first]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pending:
+            return self.pending.pop()
+        try:
+            return next(self.stream)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            self.pool.release(self.endpoint)
+            # closing the stream makes Ollama stop generating
+            self.stream.close()
+
+    def __del__(self):
+        self.close()
+
+
+class OllamaPool:
+    """
+    Spreads calls over several Ollama hosts. It stands in for ollama.Client: generate,
+    chat and show go to the healthy endpoint with the fewest calls in flight among those
+    serving the requested model, with the lowest recent latency breaking ties. Calls are
+    never sent to a host serving another model, so a verdict always comes from the model
+    it is cached under.
+
+    A host that fails a call is ejected and the call moves on to the next one. A
+    background probe checks every host on an interval with the same check ping_ai uses.
+    It re-admits hosts that answer again, and keeps their models loaded in the meantime.
+    """
+
+    def __init__(self, endpoints, model, probe, interval=OLLAMA_HEALTH_INTERVAL):
+        self.endpoints = [OllamaEndpoint(host, endpoint_model)
+                          for (host, endpoint_model) in endpoints]
+        self.model = model
+        self.probe = probe
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.prober = threading.Thread(
+            target=self.probe_periodically, name="ollama-prober", daemon=True)
+        logger.info("ollama_pool_ready",
+                    endpoints=[f"{ep.host}={ep.model or model}" for ep in self.endpoints])
+
+    @classmethod
+    def from_settings(cls, model, probe):
+        return cls(parse_hosts(OLLAMA_HOSTS), model, probe)
+
+    def start(self):
+        if self.interval:
+            self.prober.start()
+
+    def generate(self, model=None, **kwargs):
+        return self.call("generate", model, **kwargs)
+
+    def chat(self, model=None, **kwargs):
+        return self.call("chat", model, **kwargs)
+
+    def show(self, model=None):
+        return self.call("show", model)
+
+    def serves(self, endpoint, model):
+        return (endpoint.model or self.model) == model
+
+    def call(self, method, model, **kwargs):
+        model = model or self.model
+        if not any(self.serves(ep, model) for ep in self.endpoints):
+            # what a single Ollama host answers for a model it does not have
+            raise ResponseError(f"no Ollama endpoint serves model '{model}'", 404)
+        tried = set()
+        while True:
+            endpoint = self.acquire(tried, model)
+            if endpoint is None:
+                raise ConnectionError("No Ollama endpoint is available")
+            started = time.monotonic()
+            try:
+                result = getattr(endpoint.client, method)(model=model, **kwargs)
+                if kwargs.get("stream"):
+                    # an ollama stream only connects when its first chunk is asked for,
+                    # so read it here, where a failing host can still be passed over
+                    return PooledStream(self, endpoint, result, next(result, None))
+            except Exception as e:
+                self.release(endpoint)
+                if not is_endpoint_failure(e):
+                    raise
+                self.eject(endpoint, e)
+                tried.add(endpoint)
+                continue
+
+            self.release(endpoint, time.monotonic() - started)
+            return result
+
+    def acquire(self, tried, model):
+        with self.lock:
+            serving = [ep for ep in self.endpoints
+                       if self.serves(ep, model) and ep not in tried]
+            candidates = [ep for ep in serving if ep.healthy]
+            if not candidates:
+                # everything is ejected: better to try a sick host than fail outright
+                candidates = serving
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda ep: (
+                ep.outstanding, ep.latency or 0))
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint, latency=None):
+        with self.lock:
+            endpoint.outstanding -= 1
+            if latency is not None:
+                endpoint.latency = latency if endpoint.latency is None else \
+                    0.7 * endpoint.latency + 0.3 * latency
+
+    def eject(self, endpoint, error):
+        with self.lock:
+            was_healthy = endpoint.healthy
+            endpoint.healthy = False
+        if was_healthy:
+            logger.warning("ollama_endpoint_ejected",
+                           host=endpoint.host, error=str(error))
+
+    def probe_all(self):
+        for endpoint in self.endpoints:
+            try:
+                self.probe(endpoint.client, endpoint.model or self.model)
+                ok = True
+            except Exception as e:
+                ok = False
+                error = e
+            with self.lock:
+                was_healthy = endpoint.healthy
+                endpoint.healthy = ok
+            if ok and not was_healthy:
+                logger.info("ollama_endpoint_readmitted", host=endpoint.host)
+            elif not ok and was_healthy:
+                logger.warning("ollama_endpoint_ejected",
+                               host=endpoint.host, error=str(error))
+
+    def probe_periodically(self):
+        while not self.closed.wait(self.interval):
+            self.probe_all()
+
+    def status(self):
+        with self.lock:
+            return [{"host": ep.host, "model": ep.model or self.model, "healthy": ep.healthy,
+                     "outstanding": ep.outstanding,
+                     "latency_ms": round(ep.latency * 1000, 2) if ep.latency is not None else None}
+                    for ep in self.endpoints]
+
+    def close(self):
+        self.closed.set()
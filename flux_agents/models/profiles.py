@@ -0,0 +1,66 @@
+from .formats import rating_item_format, with_confidence, rating_list_format
+from .prompts import think_requests
+from config.settings import GENERATION_PROFILE, LLM_NUM_CTX, EVAL_OUTPUT_TOKENS
+from utils.logger import logger
+
+
+class GenerationProfile:
+    """
+    How much a rating is allowed to cost in output tokens: whether the model writes out
+    its thinking, how long the reason and thinking may get, and the token budget
+    (num_predict) and context window (num_ctx) requested from Ollama.
+
+    Ollama reloads the model when num_ctx changes, so profiles that leave it unset
+    share the loaded model; mixing in one that sets it costs a reload on every switch.
+    """
+
+    def __init__(self, name, think=True, reason_chars=None, think_chars=None, num_predict=None, num_ctx=None):
+        self.name = name
+        self.think = think
+        self.num_predict = num_predict
+        self.num_ctx = num_ctx
+        self.schema = rating_item_format(think, reason_chars, think_chars)
+        self.confident_schema = with_confidence(self.schema)
+        self.batch_schema = rating_list_format(self.schema)
+
+    @property
+    def output_tokens(self):
+        """Expected response tokens per post, used to size batches."""
+        return self.num_predict or EVAL_OUTPUT_TOKENS
+
+    def prompt(self, template):
+        """The template as this profile sends it; without `think`, the request for it goes too."""
+        if not self.think:
+            for request in think_requests:
+                template = template.replace(request, "")
+        return template
+
+    def options(self, posts=1, num_ctx=None):
+        """Ollama options for a generation rating `posts` posts."""
+        options = {"temperature": 0}
+        if self.num_predict:
+            options["num_predict"] = self.num_predict * posts
+        if num_ctx or self.num_ctx:
+            options["num_ctx"] = num_ctx or self.num_ctx
+        return options
+
+
+# the length caps keep a complete answer well inside num_predict, so it is not cut off mid-JSON
+PROFILES = {
+    "fast": GenerationProfile("fast", think=False, reason_chars=120, num_predict=80),
+    "balanced": GenerationProfile("balanced", reason_chars=200, think_chars=400, num_predict=256),
+    "audit": GenerationProfile("audit", num_ctx=LLM_NUM_CTX),
+}
+
+
+def profile_named(name, default=None):
+    """The profile called `name`, or `default` (the deployment's profile) if there is none."""
+    default = default or PROFILES.get(GENERATION_PROFILE) or PROFILES["balanced"]
+    if not name:
+        return default
+    profile = PROFILES.get(name)
+    if profile is None:
+        logger.warning("unknown_generation_profile", profile=name,
+                       using=default.name, known=list(PROFILES))
+        return default
+    return profile
@@ -65,7 +65,18 @@ Forbidden words: fuck, shit, cunt, the n-word, other racial slurs
 """
 
 
-assign_rating_level = """
+# Hard-rule words from the rating levels below. The lexicon pre-classifier matches on the
+# same lists, so the prompt and the shortcut cannot drift apart.
+harsh_words = ["ass", "asshole", "hell", "damn", "bitch", "bastard"]
+violation_words = ["fuck", "shit", "cunt", "motherfucker"]
+
+
+def quoted(words):
+    return ", ".join(f'"{word}"' for word in words)
+
+
+# the rules every rating prompt shares
+rating_rules = f"""
 You are an assistant moderator for an online public forum. Your job is to rate the content that is posted to the forum.
 The content is meant for other people. They do not know that you are reading it, so you do not need to respond to the 
 author of the post.
@@ -83,17 +94,20 @@ of increasing severity.
   * Possible sexual innuendo
 
 3. **Harsh** - 
-  * Contains any of the following curse words: "ass", "asshole", "hell", "damn", "bitch", "bastard"
+  * Contains any of the following curse words: {quoted(harsh_words)}
   * Attacking others, name-calling
   * Sexually explicit
   * Illegal topics
 
 4. **Violation** -
-  * Contains any of the following curse words: "fuck", "shit", "cunt", "motherfucker"
+  * Contains any of the following curse words: {quoted(violation_words)}
   * Threats of violence
   * Graphic sexuality
 
-# Rate This Content
+"""
+
+
+assign_rating_level = rating_rules + """# Rate This Content
 
 Please rate the following content, and respond with your **rating** (safe, edgy, harsh, violation), and a **reason** (One sentence or less). Include your thought process as **think**. Respond using JSON.
 
@@ -103,6 +117,41 @@ $content
 
 """
 
+
+# several posts in one generation, so the rules above are only paid for once
+assign_rating_levels = rating_rules + """# Rate These Posts
+
+Each post below starts with a line "### Post <id>". Rate every post on its own. Respond using JSON with a **ratings** list
+that has one entry per post: the post **id**, your **rating** (safe, edgy, harsh, violation), a **reason** (One sentence or less),
+and your thought process as **think**.
+
+$posts
+"""
+
+# chat mode: the rules never change, so they go in a fixed system message and the post
+# content follows as the user message; Ollama can then reuse the cached prefix
+rating_system_prompt = rating_rules + """# How To Respond
+
+Every user message is the content of one post. Rate it, and respond with your **rating** (safe, edgy, harsh, violation),
+and a **reason** (One sentence or less). Include your thought process as **think**. Respond using JSON.
+"""
+
+# cascade fast stage: the same request, plus how sure the model is, so unsure verdicts escalate
+confidence_request = "Also give your **confidence** in the rating, from 0 (a guess) to 1 (certain). Respond using JSON."
+confident_rating_level = assign_rating_level.replace(
+    "Respond using JSON.", confidence_request)
+confident_system_prompt = rating_system_prompt.replace(
+    "Respond using JSON.", confidence_request)
+
+# what a generation profile without `think` strips from the templates above
+think_requests = (" Include your thought process as **think**.",
+                  ",\nand your thought process as **think**")
+
+rated_post = """### Post $id
+$content
+
+"""
+
 simple = """
 This is a simple template with a $code and a $reason. Will this work?
 """
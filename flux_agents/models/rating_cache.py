@@ -0,0 +1,135 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from .prompts import assign_rating_level
+from .formats import rating_format
+from config.settings import RATING_CACHE_SIZE, RATING_CACHE_TTL, RATING_CACHE_DB, RATING_CACHE_DB_TTL
+from utils.logger import logger
+
+
+def fingerprint(value):
+    """Short, stable hash of a prompt template or schema, used to version cache keys."""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True)
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_content(content):
+    """Fold away differences that cannot change a rating: unicode forms and whitespace."""
+    content = unicodedata.normalize("NFKC", content)
+    return re.sub(r"\s+", " ", content).strip()
+
+
+class RatingCache:
+    """
+    Content-addressed cache of verdicts. The key covers the normalized content, the model,
+    the prompt template and the response schema, so changing any of them starts fresh.
+
+    Lookups go to an in-process LRU first (bounded by size and TTL), then to a SQLite
+    store that survives restarts.
+    """
+
+    def __init__(self, model, prompt=assign_rating_level, schema=rating_format, size=RATING_CACHE_SIZE,
+                 ttl=RATING_CACHE_TTL, db_path=RATING_CACHE_DB, db_ttl=RATING_CACHE_DB_TTL):
+        self.model = model
+        self.version = f"{fingerprint(prompt)}:{fingerprint(schema)}"
+        self.size = size
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS ratings (
+                    key TEXT PRIMARY KEY,
+                    rating TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )""")
+            if self.db_ttl:
+                self.db.execute("DELETE FROM ratings WHERE created_at < ?",
+                                (time.time() - self.db_ttl,))
+            self.db.commit()
+
+        logger.info("rating_cache_ready", model=self.model, version=self.version,
+                    size=self.size, ttl=self.ttl, db_path=db_path or None)
+
+    def key(self, content):
+        material = json.dumps(
+            [normalize_content(content), self.model, self.version])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, content):
+        """Return a cached (rating, reason) for the content, or None."""
+        key = self.key(content)
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry:
+                (expires_at, verdict) = entry
+                if expires_at > now:
+                    self.memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return verdict
+                del self.memory[key]
+
+            if self.db:
+                row = self.db.execute(
+                    "SELECT rating, reason, created_at FROM ratings WHERE key = ?", (key,)).fetchone()
+                if row and (not self.db_ttl or row[2] >= now - self.db_ttl):
+                    verdict = (row[0], row[1])
+                    self.remember(key, verdict, now)
+                    self.hits_disk += 1
+                    return verdict
+
+            self.misses += 1
+            return None
+
+    def put(self, content, rating, reason):
+        key = self.key(content)
+        now = time.time()
+        with self.lock:
+            self.remember(key, (rating, reason), now)
+            if self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO ratings (key, rating, reason, created_at) VALUES (?, ?, ?, ?)",
+                    (key, rating, reason, now))
+                self.db.commit()
+
+    def remember(self, key, verdict, now):
+        # caller holds the lock
+        self.memory[key] = (now + self.ttl, verdict)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def stats(self, reset=False):
+        """Hit/miss counters since the last reset."""
+        with self.lock:
+            counters = {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "entries": len(self.memory),
+            }
+            if reset:
+                self.reset_stats()
+            return counters
+
+    def reset_stats(self):
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def close(self):
+        if self.db:
+            self.db.close()
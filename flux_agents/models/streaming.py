@@ -0,0 +1,63 @@
+import json
+from concurrent.futures import Future
+
+
+class StreamedFields:
+    """
+    Incremental scanner over a JSON object arriving a few characters at a time. Picks out
+    the top-level string fields as each one completes, without waiting for the object to
+    close or re-reading what it has already seen. Nested values and non-string values are
+    stepped over.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.raw = []
+        self.key = None
+        self.after_colon = False
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def get(self, name, default=None):
+        return self.fields.get(name, default)
+
+    def feed(self, text):
+        for char in text:
+            if self.in_string:
+                self.raw.append(char)
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        # the collected characters end with the closing quote
+                        self.string_done(json.loads('"' + "".join(self.raw)))
+            elif char == '"':
+                self.in_string = True
+                self.raw = []
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+            elif self.depth == 1 and char == ":":
+                self.after_colon = True
+            elif self.depth == 1 and char == ",":
+                (self.key, self.after_colon) = (None, False)
+
+    def string_done(self, value):
+        if self.after_colon and self.key is not None:
+            self.fields[self.key] = value
+            (self.key, self.after_colon) = (None, False)
+        else:
+            self.key = value
+
+
+def settled_reason(reason):
+    """The reason text, waiting for it first if it is still being generated."""
+    return reason.result() if isinstance(reason, Future) else reason
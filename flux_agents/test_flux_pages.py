@@ -0,0 +1,99 @@
+import threading
+import time
+import pytest
+from api.flux_svc import FluxService
+from benchmarks.stubs import FakeFluxApi, make_backlog
+
+
+class CappedFluxApi(FakeFluxApi):
+    """Lists at most `cap` unrated fluxes, however many are asked for."""
+
+    def __init__(self, fluxes, cap):
+        self.cap = cap
+        super().__init__(fluxes)
+
+    def page(self, limit):
+        return super().page(min(limit, self.cap))
+
+
+@pytest.fixture
+def flux_svc():
+    flux_svc = FluxService()
+    yield flux_svc
+    flux_svc.close()
+
+
+def sweep(pages, rate, timeout=10):
+    """Run one sweep on a thread, so a sweep that never ends fails instead of hanging."""
+    handed_out = []
+
+    def run():
+        for page in pages:
+            handed_out.extend(flux["id"] for flux in page)
+            rate(page)
+            pages.done([flux["id"] for flux in page])
+        pages.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the sweep never ended"
+    return handed_out
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_sweep_ends_when_a_rating_never_lands(flux_svc, depth):
+    api = FakeFluxApi(make_backlog(12)).start()
+    try:
+        flux_svc.endpoint = api.url
+        # flux 1 fails to rate every time, so the service keeps listing it first
+        rate = lambda page: api.store([{"fluxId": flux["id"], "rating": "safe"}
+                                       for flux in page if flux["id"] != 1])
+        handed_out = sweep(flux_svc.iter_unrated(page_size=4, depth=depth), rate)
+    finally:
+        api.stop()
+    assert sorted(handed_out) == list(range(1, 13))
+    assert list(api.unrated) == [1]
+
+
+def test_prefetch_holds_at_most_max_items(flux_svc):
+    api = FakeFluxApi(make_backlog(30)).start()
+    try:
+        flux_svc.endpoint = api.url
+        pages = flux_svc.iter_unrated(page_size=4, depth=3, max_items=10)
+        largest = []
+
+        def rate(page):
+            # give the prefetcher time to fill up while this page is "rated"
+            time.sleep(0.05)
+            largest.append(len(pages.buffer))
+            api.store([{"fluxId": flux["id"], "rating": "safe"} for flux in page])
+
+        handed_out = sweep(pages, rate)
+    finally:
+        api.stop()
+    assert sorted(handed_out) == list(range(1, 31))
+    # more than a page ahead, never more than max_items
+    assert 4 < max(largest) <= 10
+
+
+def test_close_while_the_prefetcher_waits_for_progress(flux_svc):
+    api = CappedFluxApi(make_backlog(10), cap=4).start()
+    try:
+        flux_svc.endpoint = api.url
+        pages = flux_svc.iter_unrated(page_size=4, depth=1)
+        assert len(pages.next_page()) == 4
+        # everything listed is in flight, so the prefetcher waits for done()
+        deadline = time.monotonic() + 5
+        while api.calls.get("fetch_next_fluxes", 0) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        assert pages.thread.is_alive()
+
+        closer = threading.Thread(target=pages.close, daemon=True)
+        closer.start()
+        closer.join(5)
+    finally:
+        api.stop()
+    assert not closer.is_alive() and not pages.thread.is_alive()
+    assert pages.next_page() == []
@@ -0,0 +1,36 @@
+import pytest
+from models.lexicon import LexiconClassifier
+
+
+def test_violation_words_need_a_word_start():
+    lexicon = LexiconClassifier(mode="enforce", safe_max_chars=0)
+    assert ("violation", "shit") not in lexicon.signals("What a mishit, straight into the stands.")
+    assert lexicon.classify("Great day out in Scunthorpe with the kids.") is None
+
+
+def test_violation_words_and_compounds_still_match():
+    lexicon = LexiconClassifier(mode="enforce", safe_max_chars=0)
+    assert lexicon.classify("This is sh!t.")[0] == "violation"
+    assert lexicon.classify("Total bullshit from start to end.")[0] == "violation"
+    assert ("violation", "fuck") in lexicon.signals("Only a fuckwit would post that.")
+
+
+@pytest.mark.parametrize("content", [
+    "shitting on you", "what a shitstorm", "fuckery", "you fucktard", "shitpost",
+])
+def test_any_word_starting_with_a_violation_word_matches(content):
+    lexicon = LexiconClassifier(mode="enforce", safe_max_chars=280)
+    assert lexicon.classify(content)[0] == "violation"
+
+
+@pytest.mark.parametrize("content", [
+    "I will blow up the power plant tomorrow", "a murderous mood today",
+])
+def test_short_posts_with_risk_words_are_not_safe(content):
+    lexicon = LexiconClassifier(mode="enforce", safe_max_chars=280)
+    assert lexicon.classify(content) is None
+
+
+def test_short_clean_posts_are_safe():
+    lexicon = LexiconClassifier(mode="enforce", safe_max_chars=280)
+    assert lexicon.classify("Lovely weather for a walk today.")[0] == "safe"
@@ -0,0 +1,50 @@
+from models.near_duplicates import NearDuplicateIndex
+
+
+SPAM = ("Get rich fast with our crypto signals group, join now and use code SAVE12 "
+        "for 12 percent off your first month of premium picks")
+CALM = ("I would never hurt anyone at that school, I just miss my old friends there "
+        "and wish I could visit them again")
+NOTICE = ("The lab says the water test results are safe for the whole neighborhood, "
+          "see https://example.org/report-2231 for details")
+# SimHash of SPAM, the same in every process
+FINGERPRINT = 0xaa3a4e53cbb39f67
+
+
+def test_fingerprints_are_stable():
+    """Fingerprints must not depend on the per-process string hash salt."""
+    assert NearDuplicateIndex().fingerprint(SPAM) == FINGERPRINT
+
+
+def test_small_variants_match():
+    index = NearDuplicateIndex()
+    index.put(SPAM, "violation", "Crypto spam.")
+
+    # different code and amount
+    variant = SPAM.replace("SAVE12", "SAVE47").replace("12 percent", "15 percent")
+    assert index.find(variant) is not None
+    # one word changed
+    assert index.find(SPAM.replace("join now", "join today")) is not None
+
+
+def test_unrelated_post_does_not_match():
+    index = NearDuplicateIndex()
+    index.put(SPAM, "violation", "Crypto spam.")
+    other = ("Had a lovely walk along the river this morning, the herons were out "
+             "and the light on the water was beautiful")
+    assert index.find(other) is None
+
+
+def test_safe_is_not_reused_across_a_negation():
+    index = NearDuplicateIndex()
+    index.put(CALM, "safe", "Nostalgic, no threat.")
+    index.put(NOTICE, "safe", "Public information.")
+    assert index.find(CALM.replace("never ", "")) is None
+    assert index.find(NOTICE.replace("are safe", "are not safe")) is None
+
+
+def test_safe_is_reused_when_only_links_and_numbers_differ():
+    index = NearDuplicateIndex()
+    index.put(NOTICE, "safe", "Public information.")
+    variant = NOTICE.replace("https://example.org/report-2231", "www.example.net/r/7")
+    assert index.find(variant)[0] == "safe"
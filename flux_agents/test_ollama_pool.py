@@ -0,0 +1,45 @@
+import gc
+from models.ollama_pool import OllamaPool
+
+
+class StubClient:
+
+    def __init__(self, host, fail=False):
+        self.host = host
+        self.fail = fail
+
+    def generate(self, model, stream=False, **kwargs):
+        if not stream:
+            return {"response": self.host}
+        return self.chunks()
+
+    def chunks(self):
+        # like ollama's, the stream only connects once the first chunk is asked for
+        if self.fail:
+            raise ConnectionError(f"{self.host} is down")
+        yield {"response": self.host}
+        yield {"response": "done"}
+
+
+def make_pool(*clients):
+    pool = OllamaPool([(client.host, None) for client in clients], "stub", probe=None, interval=0)
+    for (endpoint, client) in zip(pool.endpoints, clients):
+        endpoint.client = client
+    return pool
+
+
+def test_stream_fails_over_when_the_host_is_down():
+    pool = make_pool(StubClient("a", fail=True), StubClient("b"))
+    stream = pool.generate(prompt="hi", stream=True)
+    assert [chunk["response"] for chunk in stream] == ["b", "done"]
+    assert [(ep["host"], ep["healthy"], ep["outstanding"]) for ep in pool.status()] == \
+        [("a", False, 0), ("b", True, 0)]
+
+
+def test_dropped_stream_releases_the_endpoint():
+    pool = make_pool(StubClient("a"))
+    stream = pool.generate(prompt="hi", stream=True)
+    assert pool.status()[0]["outstanding"] == 1
+    del stream
+    gc.collect()
+    assert pool.status()[0]["outstanding"] == 0
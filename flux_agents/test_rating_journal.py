@@ -0,0 +1,96 @@
+import json
+from api.flux_svc import FluxService
+from api.rating_journal import RatingJournal
+from benchmarks.stubs import StubServer, JsonHandler
+
+
+class RefusingApi(StubServer):
+    """Answers every rating with `status`."""
+
+    def __init__(self, status):
+        self.status = status
+        super().__init__()
+
+    def handler(self):
+        api = self
+
+        class RefusingHandler(JsonHandler):
+
+            def do_POST(self):
+                self.body()
+                self.reply(api.status, {"error": "refused"})
+
+        return RefusingHandler
+
+
+def lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_unacknowledged_verdicts_are_replayed_after_a_crash(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = RatingJournal(path, sync_delay=0)
+    journal.record(1, "safe", "Fine.")
+    journal.record(2, "edgy", "Borderline.")
+    journal.acknowledge([1])
+    # the next verdict syncs the acknowledgement along with it
+    journal.record(3, "violation", "Slur.")
+
+    # no close(): the process died here
+    replayed = RatingJournal(path, sync_delay=0)
+    assert replayed.unacknowledged() == [(2, "edgy", "Borderline."), (3, "violation", "Slur.")]
+    journal.file.close()
+    replayed.close()
+
+
+def test_a_torn_last_line_is_skipped(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    path.write_text(json.dumps({"op": "verdict", "fluxId": 1, "rating": "safe", "reason": "Fine.", "at": 0})
+                    + "\n" + '{"op": "verdict", "fluxId": 2, "rat', encoding="utf-8")
+    journal = RatingJournal(str(path), sync_delay=0)
+    assert journal.unacknowledged() == [(1, "safe", "Fine.")]
+    # compaction dropped the torn line, so new entries start on a line of their own
+    journal.record(3, "safe", "Fine.")
+    journal.close()
+    assert [entry["fluxId"] for entry in lines(path)] == [1, 3]
+
+
+def test_error_verdicts_are_never_journaled(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    # written by an older version
+    path.write_text(json.dumps({"op": "verdict", "fluxId": 1, "rating": "error", "reason": "Timed out.",
+                                "at": 0}) + "\n", encoding="utf-8")
+    journal = RatingJournal(str(path), sync_delay=0)
+    journal.record(2, "error", "Timed out.")
+    assert journal.verdict(1) is None and journal.verdict(2) is None
+    journal.close()
+    assert lines(path) == []
+
+
+def test_a_verdict_refused_for_good_moves_to_the_rejected_file(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = RatingJournal(path, sync_delay=0)
+    flux_svc = FluxService()
+    flux_svc.on_rejected = journal.reject
+    journal.record(7, "safe", "Fine.")
+    journal.record(8, "safe", "Fine.")
+
+    api = RefusingApi(422).start()
+    try:
+        flux_svc.endpoint = api.url
+        assert flux_svc.rate_flux(7, "safe", "Fine.") is None
+        # a transient refusal keeps the verdict for the next replay
+        api.status = 429
+        assert flux_svc.rate_flux(8, "safe", "Fine.") is None
+    finally:
+        api.stop()
+        flux_svc.close()
+
+    assert journal.unacknowledged() == [(8, "safe", "Fine.")]
+    journal.close()
+    rejected = lines(tmp_path / "journal.rejected.jsonl")
+    assert [(entry["fluxId"], entry["rating"], entry["statusCode"]) for entry in rejected] == [(7, "safe", 422)]
+    reopened = RatingJournal(path, sync_delay=0)
+    assert reopened.unacknowledged() == [(8, "safe", "Fine.")]
+    reopened.close()
@@ -0,0 +1,42 @@
+from api.rating_writer import BufferedRatingWriter
+
+
+class StubService:
+
+    def __init__(self, batch_results):
+        self.batch_supported = True
+        self.batch_results = list(batch_results)
+        self.batches = []
+        self.singles = []
+
+    def rate_fluxes(self, ratings):
+        self.batches.append([flux_id for (flux_id, _, _) in ratings])
+        return self.batch_results.pop(0)
+
+    def rate_flux(self, flux_id, rating_code, reason):
+        self.singles.append(flux_id)
+        return {}
+
+
+def test_failed_batch_is_retried_as_a_batch():
+    service = StubService([None, []])
+    stored = []
+    writer = BufferedRatingWriter(service, batch_size=10, flush_interval=60, on_stored=stored.extend)
+    writer.add(1, "safe", "Fine.")
+    writer.add(2, "edgy", "Hmm.")
+    writer.flush()
+    assert stored == [] and service.singles == []
+    writer.add(3, "safe", "Fine.")
+    writer.close()
+    assert service.batches == [[1, 2], [1, 2, 3]]
+    assert stored == [1, 2, 3] and service.singles == []
+
+
+def test_refused_batch_falls_back_to_single_ratings():
+    service = StubService([False])
+    stored = []
+    writer = BufferedRatingWriter(service, batch_size=10, flush_interval=60, on_stored=stored.extend)
+    writer.add(1, "safe", "Fine.")
+    writer.add(2, "edgy", "Hmm.")
+    writer.close()
+    assert service.singles == [1, 2] and stored == [1, 2]
@@ -0,0 +1,48 @@
+import json
+import models.llm
+from models.llm import read_field
+from models.streaming import StreamedFields
+
+
+def feed_in_pieces(text, size):
+    fields = StreamedFields()
+    for start in range(0, len(text), size):
+        fields.feed(text[start:start + size])
+    return fields
+
+
+def test_escapes_split_across_chunks():
+    reason = 'He said "hi" \\ then été \U0001f600 and left.'
+    text = json.dumps({"rating": "edgy", "reason": reason})
+    # every split point, including inside a backslash escape and a \\uXXXX sequence
+    for size in range(1, 8):
+        fields = feed_in_pieces(text, size)
+        assert (fields.get("rating"), fields.get("reason")) == ("edgy", reason)
+
+
+def test_nested_values_are_stepped_over():
+    text = ('{"meta": {"rating": "violation", "tags": ["reason", {"reason": "nested"}]}, '
+            '"score": 3, "flags": [], "rating": "safe", "ok": true, "reason": "Fine."}')
+    fields = feed_in_pieces(text, 3)
+    assert (fields.get("rating"), fields.get("reason")) == ("safe", "Fine.")
+    assert "meta" not in fields and "tags" not in fields
+
+
+def test_stream_ending_before_the_rating():
+    chunks = [{"response": '{"rea'}, {"response": 'son": "cut'}]
+    fields = StreamedFields()
+    assert read_field(iter(chunks), fields, "rating") is None
+    assert "rating" not in fields
+
+
+def test_stats_of_the_final_chunk_are_logged(monkeypatch):
+    logged = []
+    monkeypatch.setattr(models.llm, "log_call_stats", lambda response, **context: logged.append(
+        (response["eval_count"], context)))
+    chunks = [{"response": '{"rating": "safe", '}, {"response": '"reason": "Fine."}'},
+              {"response": "", "done": True, "eval_count": 9}]
+    fields = StreamedFields()
+    assert read_field(iter(chunks), fields, "reason", post_id=1) == "Fine."
+    assert logged == []
+    read_field(iter(chunks[2:]), fields, post_id=1)
+    assert logged == [(9, {"post_id": 1})]
@@ -1,23 +1,42 @@
 import structlog
 import requests
 import logging
+import logging.handlers
+import atexit
+import queue
+import random
 import sys
 import os
 from pathlib import Path
 
 # Import settings for LOG_FILE
 try:
-    from config.settings import LOG_FILE
+    from config.settings import (LOG_FILE, LOG_QUEUE_ENABLED, LOG_ROTATE_BYTES, LOG_ROTATE_WHEN,
+                                 LOG_BACKUP_COUNT, LOG_SAMPLE_RATES, AGENT_WORKERS)
 except ImportError:
     # If we can't import directly, try to get it from environment
     from dotenv import load_dotenv
     load_dotenv()
     LOG_FILE = os.getenv("LOG_FILE", "./flux-moderator.log")
+    LOG_QUEUE_ENABLED = os.getenv("LOG_QUEUE_ENABLED", "false").lower() == "true"
+    LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", "0"))
+    LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+    AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
 
 # Environment variable to control logging behavior:
 # RUNNING_AS_SERVICE=true - Only log to file (prevents duplicate logs when stdout is redirected to the same file)
 # RUNNING_AS_SERVICE=false (default) - Log to both file and stdout
 
+# Set by won_agent_service.py for each worker it starts
+WORKER_TAG = os.getenv("WORKER_ID")
+
+# Workers cannot safely rotate a shared file, so each rotates its own
+if (LOG_ROTATE_BYTES or LOG_ROTATE_WHEN) and WORKER_TAG and AGENT_WORKERS > 1:
+    (base, ext) = os.path.splitext(LOG_FILE)
+    LOG_FILE = f"{base}.worker-{WORKER_TAG}{ext}"
+
 # Ensure log directory exists
 log_dir = os.path.dirname(LOG_FILE)
 if log_dir and not os.path.exists(log_dir):
@@ -51,6 +70,52 @@ def connection_error_processor(logger, method_name, event_dict):
     return event_dict
 
 
+def parse_sample_rates(spec):
+    """Turn "rating_flux=0.1,storing_flux_rating=0.25" into {event: share to keep}."""
+    rates = {}
+    for entry in spec.split(","):
+        (event, _, rate) = entry.partition("=")
+        if event.strip() and rate.strip():
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+SAMPLE_RATES = parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def sampling_processor(logger, method_name, event_dict):
+    """Keep only the configured share of high-volume events; warnings and errors always pass."""
+    rate = SAMPLE_RATES.get(event_dict.get('event'))
+    if rate is not None and method_name in ("debug", "info") and random.random() >= rate:
+        raise structlog.DropEvent
+    return event_dict
+
+
+def worker_processor(logger, method_name, event_dict):
+    """Tag every entry with the worker that wrote it when started by the controller."""
+    if WORKER_TAG:
+        event_dict['worker'] = WORKER_TAG
+    return event_dict
+
+
+def file_handler():
+    """The log file handler, rotating by size or on a schedule when configured."""
+    if LOG_ROTATE_BYTES:
+        return logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_ROTATE_BYTES, backupCount=LOG_BACKUP_COUNT)
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT)
+    return logging.FileHandler(LOG_FILE)
+
+
+class HandoffQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records untouched, so formatting happens on the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
 def configure_logging():
     """Configure structured logging for the application."""
     # Determine if we're running as a service or in interactive mode
@@ -58,12 +123,50 @@ def configure_logging():
     is_service = os.getenv("RUNNING_AS_SERVICE", "false").lower() == "true"
 
     # Set up handlers based on the running mode
-    handlers = [logging.FileHandler(LOG_FILE)]
+    handlers = [file_handler()]
 
     # Only add stdout handler if not running as a service
     if not is_service:
         handlers.append(logging.StreamHandler(sys.stdout))
 
+    # Cheap steps run on the calling thread; in queue mode JSON rendering and the
+    # writes happen on the listener thread
+    processors = [
+        sampling_processor,  # first, so dropped events cost nothing more
+        structlog.stdlib.add_log_level,
+        structlog.stdlib.PositionalArgumentsFormatter(),
+        structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S"),
+        structlog.processors.StackInfoRenderer(),
+        connection_error_processor,  # Add our custom processor
+        worker_processor,
+        structlog.processors.format_exc_info,
+    ]
+    if LOG_QUEUE_ENABLED:
+        formatter = structlog.stdlib.ProcessorFormatter(
+            processors=[
+                structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+                structlog.processors.UnicodeDecoder(),
+                structlog.processors.JSONRenderer()
+            ],
+            foreign_pre_chain=[structlog.stdlib.add_log_level,
+                               structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S")])
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        records = queue.Queue()
+        listener = logging.handlers.QueueListener(
+            records, *handlers, respect_handler_level=True)
+        listener.start()
+        # drain the queue on the way out
+        atexit.register(listener.stop)
+        handlers = [HandoffQueueHandler(records)]
+        processors.append(
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter)
+    else:
+        processors += [
+            structlog.processors.UnicodeDecoder(),
+            structlog.processors.JSONRenderer()
+        ]
+
     # Set up the standard library logger
     logging.basicConfig(
         level=logging.INFO,
@@ -73,16 +176,7 @@ def configure_logging():
 
     # Configure structlog to use the standard library logger
     structlog.configure(
-        processors=[
-            structlog.stdlib.add_log_level,
-            structlog.stdlib.PositionalArgumentsFormatter(),
-            structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S"),
-            structlog.processors.StackInfoRenderer(),
-            connection_error_processor,  # Add our custom processor
-            structlog.processors.format_exc_info,
-            structlog.processors.UnicodeDecoder(),
-            structlog.processors.JSONRenderer()
-        ],
+        processors=processors,
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
         wrapper_class=structlog.stdlib.BoundLogger,
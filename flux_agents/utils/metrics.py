@@ -0,0 +1,174 @@
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config.settings import METRICS_HOST, METRICS_PORT
+from utils.logger import logger
+
+# seconds; LLM calls run from milliseconds (cache-warm prompts) to minutes (cold loads)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300)
+THROUGHPUT_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for (_, value) in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for ((name, _), value) in zip(pairs, escaped)) + "}"
+
+
+def number_text(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for (key, value) in sorted(self.values.items()):
+                lines += self.samples(key, value)
+        return lines
+
+    def samples(self, key, value):
+        return [f"{self.name}{label_text(self.labels, key)} {number_text(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # per-bucket counts (the last one is +Inf), then sum and count
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][slot] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self, key, value):
+        (counts, total, count) = value
+        lines = []
+        cumulative = 0
+        for (bound, bucket_count) in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = label_text(self.labels, key, [("le", number_text(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = label_text(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {number_text(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves the registry at GET /metrics for Prometheus to scrape."""
+
+    def __init__(self, registry=registry, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics-server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        (host, port) = self.server.server_address[:2]
+        logger.info("metrics_server_started", host=host, port=port)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def handler(self):
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0].rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                data = metrics.registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # scrapes every few seconds would drown the log
+                pass
+
+        return MetricsHandler
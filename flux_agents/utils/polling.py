@@ -0,0 +1,48 @@
+from config.settings import (POLLING_INTERVAL, POLLING_ADAPTIVE, POLLING_MIN_INTERVAL,
+                             POLLING_MAX_INTERVAL, POLLING_BACKOFF)
+from utils.metrics import registry, COUNT_BUCKETS
+
+ROUNDS = registry.counter(
+    "flux_rounds_total", "Polling rounds, by outcome", labels=("outcome",))
+ROUND_FLUXES = registry.histogram(
+    "flux_round_fluxes", "Fluxes processed per round", buckets=COUNT_BUCKETS)
+BACKLOG = registry.gauge(
+    "flux_backlog", "Unrated fluxes waiting at the start of the last round")
+REST_SECONDS = registry.gauge(
+    "flux_polling_rest_seconds", "Rest chosen after the last round")
+
+
+class AdaptivePoller:
+    """
+    Decides how long to rest between rounds. A round that found work (or saw more than a
+    page waiting) drops the rest to the minimum so a burst is drained quickly; every idle
+    or failed round multiplies it by the backoff factor, up to the ceiling.
+
+    With adaptive polling switched off, the rest is always POLLING_INTERVAL.
+    """
+
+    def __init__(self, interval=POLLING_INTERVAL, adaptive=POLLING_ADAPTIVE, minimum=POLLING_MIN_INTERVAL,
+                 maximum=POLLING_MAX_INTERVAL, backoff=POLLING_BACKOFF):
+        self.adaptive = adaptive
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.backoff = max(1.0, backoff)
+        self.interval = interval or 60
+        self.backlog = None
+
+    def next_interval(self, summary):
+        """Work out the next rest, in seconds, from the summary of the round just finished."""
+        self.backlog = summary["backlog"]
+        ROUNDS.inc(outcome="failed" if summary["failed"] else "ok")
+        ROUND_FLUXES.observe(summary["processed"])
+        if self.backlog is not None:
+            BACKLOG.set(self.backlog)
+
+        if self.adaptive:
+            if not summary["failed"] and (summary["processed"] or summary["has_more"]):
+                self.interval = self.minimum
+            else:
+                self.interval = min(self.maximum,
+                                    max(self.minimum, self.interval * self.backoff))
+        REST_SECONDS.set(self.interval)
+        return self.interval
@@ -0,0 +1,37 @@
+import importlib
+import os
+import config.settings
+from utils.logger import logger
+
+
+def current_values(module):
+    return {name: value for (name, value) in vars(module).items()
+            if name.isupper() and name != "LAUNCH_ENVIRONMENT"}
+
+
+def reload_settings(hot):
+    """
+    Re-read config/settings.py and .env (SIGHUP). Settings are bound when a module
+    imports them, so only the names in `hot` take effect, by whoever asked for the reload;
+    other changes are logged as waiting for a restart. Returns the reloaded settings
+    module and the names of the hot settings that changed.
+    """
+    before = current_values(config.settings)
+    # forget what the last .env put into the environment, so removed entries fall back
+    # to their defaults; the environment as launched still wins over .env
+    launched = config.settings.LAUNCH_ENVIRONMENT
+    for name in [name for name in os.environ if name not in launched]:
+        del os.environ[name]
+    os.environ.update(launched)
+    try:
+        importlib.reload(config.settings)
+    except Exception as e:
+        logger.error("settings_reload_failed", error=str(e))
+        return (config.settings, set())
+
+    after = current_values(config.settings)
+    changed = {name for name in before.keys() | after.keys() if before.get(name) != after.get(name)}
+    # names only: some settings are secrets
+    logger.info("settings_reloaded", applied=sorted(changed & hot),
+                restart_needed=sorted(changed - hot))
+    return (config.settings, changed & hot)
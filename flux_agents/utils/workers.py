@@ -0,0 +1,32 @@
+import json
+import os
+from config.settings import PID_FILE
+
+
+def status_path(worker_id):
+    """Where a worker leaves its status for the service controller, next to the PID file."""
+    (base, _) = os.path.splitext(PID_FILE)
+    return f"{base}.worker-{worker_id}.json"
+
+
+def write_status(worker_id, status):
+    # write then rename, so the controller never reads half a file
+    path = status_path(worker_id)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(status, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_status(worker_id):
+    try:
+        with open(status_path(worker_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def remove_status(worker_id):
+    try:
+        os.remove(status_path(worker_id))
+    except FileNotFoundError:
+        pass
@@ -6,6 +6,9 @@ of the flux_agents service.
 
 When starting the service, this script automatically sets RUNNING_AS_SERVICE=true
 to prevent duplicate log entries (since stdout is redirected to the log file).
+
+With AGENT_WORKERS above 1, that many agents are started. They share the backlog
+through flux leases (see LEASE_MODE), so no flux is rated twice.
 """
 
 import os
@@ -14,19 +17,20 @@ import signal
 import subprocess
 import time
 from pathlib import Path
-from config.settings import PID_FILE, LOG_FILE
+from config.settings import PID_FILE, LOG_FILE, AGENT_WORKERS, INGEST_PORT, METRICS_PORT, DRAIN_TIMEOUT
+from utils.workers import read_status, remove_status
 
 # Get the absolute path to the directory containing this script
 SCRIPT_DIR = Path(__file__).resolve().parent
 
 
-def get_pid():
-    """Read the PID from the PID file if it exists."""
+def get_pids():
+    """Read the worker PIDs from the PID file, one per line, if it exists."""
     try:
         with open(PID_FILE, 'r') as f:
-            return int(f.read().strip())
+            return [int(line) for line in f.read().split()]
     except (FileNotFoundError, ValueError):
-        return None
+        return []
 
 
 def is_running(pid):
@@ -42,10 +46,11 @@ def is_running(pid):
 
 
 def start():
-    """Start the flux_agents service."""
-    pid = get_pid()
-    if pid and is_running(pid):
-        print(f"Flux agents service is already running with PID {pid}")
+    """Start the flux_agents service, with AGENT_WORKERS workers."""
+    running = [pid for pid in get_pids() if is_running(pid)]
+    if running:
+        print(
+            f"Flux agents service is already running with PID {', '.join(map(str, running))}")
         return
 
     # Start the process
@@ -57,53 +62,71 @@ def start():
     # Change to the script directory before running
     os.chdir(SCRIPT_DIR)
 
-    # Set up environment variables for the service
-    env = os.environ.copy()
-    env['RUNNING_AS_SERVICE'] = 'true'
-
-    # Start the process and redirect output to the log file
-    with open(log_path, 'a') as log_file:
-        process = subprocess.Popen(
-            [sys.executable, 'main.py'],
-            stdout=log_file,
-            stderr=log_file,
-            start_new_session=True,
-            env=env
-        )
-
-    # Write the PID to the PID file
+    workers = max(1, AGENT_WORKERS)
+    pids = []
+    for worker in range(workers):
+        # Set up environment variables for the service; every worker gets its own
+        # id (for its leases, log entries and status) and its own listener ports
+        env = os.environ.copy()
+        env['RUNNING_AS_SERVICE'] = 'true'
+        env['AGENT_WORKERS'] = str(workers)
+        env['WORKER_ID'] = str(worker)
+        env['INGEST_PORT'] = str(INGEST_PORT + worker)
+        env['METRICS_PORT'] = str(METRICS_PORT + worker)
+        remove_status(worker)
+
+        # Start the process and redirect output to the log file
+        with open(log_path, 'a') as log_file:
+            process = subprocess.Popen(
+                [sys.executable, 'main.py'],
+                stdout=log_file,
+                stderr=log_file,
+                start_new_session=True,
+                env=env
+            )
+        pids.append(process.pid)
+
+    # Write the PIDs to the PID file
     with open(PID_FILE, 'w') as f:
-        f.write(str(process.pid))
+        f.write("\n".join(map(str, pids)))
 
-    print(f"Flux agents service started with PID {process.pid}")
+    if workers == 1:
+        print(f"Flux agents service started with PID {pids[0]}")
+    else:
+        print(
+            f"Flux agents service started {workers} workers with PID {', '.join(map(str, pids))}")
     print(f"Logs are being written to {log_path}")
 
 
 def stop():
-    """Stop the flux_agents service."""
-    pid = get_pid()
-    if not pid:
+    """Stop the flux_agents service and all of its workers."""
+    pids = get_pids()
+    if not pids:
         print("Flux agents service is not running")
         return
 
-    if not is_running(pid):
+    running = [pid for pid in pids if is_running(pid)]
+    if not running:
         print(
-            f"Process with PID {pid} is not running, removing stale PID file")
+            f"Process with PID {', '.join(map(str, pids))} is not running, removing stale PID file")
         os.remove(PID_FILE)
         return
 
-    # Try to terminate gracefully first
+    # Try to terminate gracefully first; the workers drain what they are rating
     try:
-        os.kill(pid, signal.SIGTERM)
-        # Wait for the process to terminate
-        for _ in range(10):  # Wait up to 10 seconds
-            if not is_running(pid):
+        for pid in running:
+            os.kill(pid, signal.SIGTERM)
+        # Wait for the workers to terminate, with a little time past the drain for closing down
+        for _ in range(int(DRAIN_TIMEOUT) + 5):
+            running = [pid for pid in running if is_running(pid)]
+            if not running:
                 break
             time.sleep(1)
         else:
-            # If it's still running after 10 seconds, force kill
-            os.kill(pid, signal.SIGKILL)
-            print(f"Force killed process with PID {pid}")
+            # If any are still running by then, force kill
+            for pid in running:
+                os.kill(pid, signal.SIGKILL)
+                print(f"Force killed process with PID {pid}")
     except OSError as e:
         print(f"Error stopping process: {e}")
         return
@@ -111,10 +134,23 @@ def stop():
     # Remove the PID file
     if os.path.exists(PID_FILE):
         os.remove(PID_FILE)
+    for worker in range(len(pids)):
+        remove_status(worker)
 
     print("Flux agents service stopped")
 
 
+def reload():
+    """Have every worker re-read its settings (SIGHUP) without restarting."""
+    running = [pid for pid in get_pids() if is_running(pid)]
+    if not running:
+        print("Flux agents service is not running")
+        return
+    for pid in running:
+        os.kill(pid, signal.SIGHUP)
+    print(f"Asked {len(running)} worker(s) to reload their settings")
+
+
 def restart():
     """Restart the flux_agents service."""
     stop()
@@ -123,17 +159,39 @@ def restart():
 
 
 def status():
-    """Check the status of the flux_agents service."""
-    pid = get_pid()
-    if pid and is_running(pid):
-        print(f"Flux agents service is running with PID {pid}")
-    else:
+    """Check the status of the flux_agents service and each of its workers."""
+    pids = get_pids()
+    if not any(is_running(pid) for pid in pids):
         print("Flux agents service is not running")
+        return
+
+    if len(pids) == 1:
+        print(f"Flux agents service is running with PID {pids[0]}")
+    else:
+        print(f"Flux agents service is running {len(pids)} workers")
+    for (worker, pid) in enumerate(pids):
+        print(f"  worker {worker}: {describe_worker(worker, pid)}")
+
+
+def describe_worker(worker, pid):
+    """One line about a worker, from the status it leaves after every round."""
+    if not is_running(pid):
+        return f"PID {pid}, not running"
+    report = read_status(worker)
+    if not report or report.get("pid") != pid:
+        return f"PID {pid}, starting"
+    line = f"PID {pid}, {report['state']} (round {report['round']}), rated {report['rated']}"
+    if "leases_held" in report:
+        line += f", leases held {report['leases_held']}"
+    if report.get("backlog") is not None:
+        line += f", backlog {report['backlog']}"
+    line += f", updated {int(time.time() - report['updated_at'])}s ago"
+    return line
 
 
 def usage():
     """Print usage information."""
-    print(f"Usage: {sys.argv[0]} {{start|stop|restart|status}}")
+    print(f"Usage: {sys.argv[0]} {{start|stop|restart|reload|status}}")
     sys.exit(1)
 
 
@@ -148,6 +206,8 @@ if __name__ == "__main__":
         stop()
     elif command == "restart":
         restart()
+    elif command == "reload":
+        reload()
     elif command == "status":
         status()
     else: